@@ -1,10 +1,17 @@
 import json
 import threading
+import time
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify
 
+import cache_graph
 import escala_lucro
+import estrutura_contas
+import graph_client
+import operacoes_orcamento
+import plano_orcamento
 import realocar_orcamento
 import reduzir_orcamento
+import snapshot_campanhas
 
 app = Flask(__name__)
 app.secret_key = 'mysecretkey'  # Chave de segurança para a sessão
@@ -42,6 +49,13 @@ config['MAXIMO_ORCAMENTO'] = config.get('max_budget', 10000)
 logs = []
 process_running = False
 
+# Módulo de cada operação do painel (planos e aplicação de planos)
+OPERACOES = {
+    'escalar': escala_lucro,
+    'reduzir': reduzir_orcamento,
+    'realocar': realocar_orcamento
+}
+
 # Protege rotas (exceto login e arquivos estáticos)
 @app.before_request
 def require_login():
@@ -137,6 +151,7 @@ def start_process():
         return jsonify({"error": "Operação não informada."})
     
     operation = data['operation']
+    modo = data.get('mode', 'executar')  # "planejar" calcula e grava o plano sem alterar orçamentos
     fb_token = config.get('fb_token')
     ad_accounts = config.get('ad_accounts', [])
     abo_accounts = config.get('abo_accounts', [])  # Obter contas ABO
@@ -144,7 +159,7 @@ def start_process():
     
     logs.clear()
     process_running = True
-    logs.append(f"Iniciando operação: {operation}...")
+    logs.append(f"Iniciando operação: {operation}{' (somente plano)' if modo == 'planejar' else ''}...")
     
     # Verificar configurações
     if not fb_token:
@@ -181,7 +196,8 @@ def start_process():
                     data.get('end_date'),
                     min_profit, 
                     scale_value,
-                    abo_accounts  # Passar contas ABO
+                    abo_accounts,  # Passar contas ABO
+                    modo=modo
                 )
                 
             elif operation == 'reduzir':
@@ -195,7 +211,8 @@ def start_process():
                     data.get('end_date'),
                     data.get('reduce_profit_limit', 0), 
                     data.get('reduce_pct', 0),
-                    abo_accounts  # Passar contas ABO se o módulo suportar
+                    abo_accounts,  # Passar contas ABO se o módulo suportar
+                    modo=modo
                 )
                 
             elif operation == 'realocar':
@@ -210,7 +227,8 @@ def start_process():
                     data.get('low_profit', 0), 
                     data.get('high_profit', 0), 
                     data.get('realloc_pct', 0),
-                    abo_accounts  # Passar contas ABO se o módulo suportar
+                    abo_accounts,  # Passar contas ABO se o módulo suportar
+                    modo=modo
                 )
             else:
                 logs.append("Operação desconhecida.")
@@ -227,11 +245,114 @@ def start_process():
     threading.Thread(target=run_task).start()
     return jsonify({"status": "started"})
 
+# Rota para obter o último plano calculado de uma operação (lido do arquivo, sem consultar a Graph API)
+@app.route('/plan')
+def get_plan():
+    modulo = OPERACOES.get(request.args.get('operation'))
+    if modulo is None:
+        return jsonify({"error": "Operação desconhecida."})
+    plano = plano_orcamento.carregar(modulo.PLANO_PATH)
+    return jsonify(plano_orcamento.resumo(plano, operacoes_orcamento.IDADE_MAXIMA_SNAPSHOT))
+
+# Rota para aplicar o último plano calculado de uma operação (via AJAX)
+@app.route('/apply_plan', methods=['POST'])
+def apply_plan():
+    global process_running
+    
+    if process_running:
+        return jsonify({"error": "Já existe um processo em execução."})
+    
+    data = request.get_json() or {}
+    operation = data.get('operation')
+    modulo = OPERACOES.get(operation)
+    if modulo is None:
+        return jsonify({"error": "Operação desconhecida."})
+    if not config.get('fb_token'):
+        return jsonify({"error": "Token do Facebook não configurado."})
+    
+    logs.clear()
+    process_running = True
+    logs.append(f"Aplicando plano: {operation}...")
+    
+    def apply_task():
+        global process_running
+        try:
+            modulo.aplicar_plano(config.get('fb_token'), config.get('whatsapp_group', ''), logs)
+            logs.append("Processo concluído.")
+        except Exception as e:
+            logs.append(f"Erro ao aplicar plano: {e}")
+            import traceback
+            logs.append(traceback.format_exc())
+        finally:
+            process_running = False
+    
+    threading.Thread(target=apply_task).start()
+    return jsonify({"status": "started"})
+
 # Rota para obter logs (AJAX)
 @app.route('/logs')
 def get_logs():
     return jsonify({"logs": logs, "running": process_running})
 
+# Rota para obter o uso atual da Graph API (folga antes do limite de chamadas) e os acertos do cache de leituras
+@app.route('/graph_usage')
+def graph_usage():
+    return jsonify({"uso": graph_client.obter_uso_atual(), "cache": cache_graph.obter_estatisticas()})
+
+# Rota para descartar o cache de leituras da Graph API (memória e disco) e a estrutura local das contas
+@app.route('/clear_cache', methods=['POST'])
+def clear_cache():
+    cache_graph.invalidar(disco=True)
+    estrutura_contas.invalidar()
+    return jsonify({"status": "ok"})
+
+# Rota para obter a idade do snapshot das campanhas compartilhado pelas operações
+@app.route('/snapshot_status')
+def snapshot_status():
+    return jsonify(snapshot_campanhas.obter_status())
+
+# Rota para forçar uma nova coleta das campanhas (via AJAX)
+@app.route('/refresh_snapshot', methods=['POST'])
+def refresh_snapshot():
+    global process_running
+    
+    if process_running:
+        return jsonify({"error": "Já existe um processo em execução."})
+    if not config.get('fb_token') or not config.get('ad_accounts'):
+        return jsonify({"error": "Token ou contas de anúncio não configurados."})
+    
+    data = request.get_json() or {}
+    date_preset, start_date, end_date = snapshot_campanhas.resolver_periodo(
+        data.get('date_range', 'today'), data.get('start_date'), data.get('end_date')
+    )
+    ad_accounts = list(config.get('ad_accounts', []))
+    abo_accounts = config.get('abo_accounts', [])
+    ad_accounts += [conta for conta in abo_accounts if conta not in ad_accounts]
+    
+    logs.clear()
+    process_running = True
+    logs.append("Atualizando snapshot das campanhas...")
+    
+    def refresh_task():
+        global process_running
+        try:
+            graph_client.configurar_log(lambda msg: logs.append(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}"))
+            graph_client.iniciar_execucao()
+            # Mesmos parâmetros de coleta usados pelas operações, para que a próxima reaproveite o snapshot
+            snapshot_campanhas.obter_snapshot(
+                config.get('fb_token'), ad_accounts, abo_accounts, date_preset, start_date, end_date,
+                operacoes_orcamento.JANELAS_COMPARACAO, operacoes_orcamento.PESOS_JANELAS,
+                max_contas_paralelas=operacoes_orcamento.MAX_CONTAS_PARALELAS, forcar=True
+            )
+            logs.append("Processo concluído.")
+        except Exception as e:
+            logs.append(f"Erro ao atualizar snapshot: {e}")
+        finally:
+            process_running = False
+    
+    threading.Thread(target=refresh_task).start()
+    return jsonify({"status": "started"})
+
 # Rota para obter status das contas
 @app.route('/account_status')
 def account_status():
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark da etapa de processamento das campanhas (junção campanhas/ad sets x insights).
+Não acessa a Graph API: campanhas, ad sets e insights são gerados em memória.
+
+Uso: python benchmark_processamento.py [campanhas] [adsets]
+     (padrão: 50000 campanhas CBO e 200000 ad sets em campanhas ABO)
+"""
+import random
+import sys
+import time
+import graph_client
+import snapshot_campanhas
+
+ADSETS_POR_CAMPANHA_ABO = 50
+ESCALAS = [0.125, 0.25, 0.5, 1]
+TIPOS_ACAO = [
+    "offsite_conversion.fb_pixel_purchase", "offsite_conversion.purchase",
+    "offsite_conversion.fb_pixel_add_to_cart", "link_click", "landing_page_view"
+]
+
+def gerar_insight(campo, id_objeto, gerador):
+    return {
+        campo: id_objeto,
+        "spend": f"{gerador.uniform(1, 500):.2f}",
+        "action_values": [
+            {"action_type": tipo, "value": f"{gerador.uniform(0, 900):.2f}"}
+            for tipo in gerador.sample(TIPOS_ACAO, 3)
+        ]
+    }
+
+def gerar_campanhas_cbo(quantidade, gerador):
+    campanhas = [
+        {"id": f"c{i}", "name": f"Campanha {i}", "daily_budget": str(gerador.randint(1000, 100000)), "status": "ACTIVE"}
+        for i in range(quantidade)
+    ]
+    insights = [gerar_insight("campaign_id", campanha["id"], gerador) for campanha in campanhas]
+    gerador.shuffle(insights)
+    return campanhas, insights
+
+def gerar_campanhas_abo(quantidade_adsets, adsets_por_campanha, gerador):
+    campanhas = []
+    for i in range(max(1, quantidade_adsets // adsets_por_campanha)):
+        adsets = [
+            {"id": f"a{i}_{j}", "name": f"Ad set {j}", "daily_budget": str(gerador.randint(1000, 20000)), "status": "ACTIVE"}
+            for j in range(adsets_por_campanha)
+        ]
+        insights = [gerar_insight("adset_id", adset["id"], gerador) for adset in adsets]
+        gerador.shuffle(insights)
+        campanhas.append(({"id": f"abo{i}", "name": f"Campanha ABO {i}"}, adsets, insights))
+    return campanhas
+
+def medir(funcao):
+    inicio = time.perf_counter()
+    funcao()
+    return time.perf_counter() - inicio
+
+def medir_cbo(quantidade, gerador):
+    campanhas, insights = gerar_campanhas_cbo(quantidade, gerador)
+    return medir(lambda: snapshot_campanhas.processar_dados_campanhas(campanhas, insights, "act_benchmark"))
+
+def medir_abo(quantidade_adsets, adsets_por_campanha, gerador):
+    campanhas = gerar_campanhas_abo(quantidade_adsets, adsets_por_campanha, gerador)
+    return medir(lambda: [
+        snapshot_campanhas.processar_campanha_abo(campanha, "act_benchmark", adsets, insights)
+        for campanha, adsets, insights in campanhas
+    ])
+
+def imprimir(titulo, linhas):
+    print(titulo)
+    print(f"{'unidades':>10} {'tempo (s)':>10} {'µs/unidade':>11}")
+    for unidades, segundos in linhas:
+        print(f"{unidades:>10} {segundos:>10.3f} {segundos / unidades * 1e6:>11.2f}")
+    print()
+
+def main():
+    total_campanhas = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    total_adsets = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    gerador = random.Random(42)
+    graph_client.configurar_log(lambda msg: None)  # Sem logs por campanha durante a medição
+
+    linhas = []
+    for escala in ESCALAS:
+        quantidade = int(total_campanhas * escala)
+        linhas.append((quantidade, medir_cbo(quantidade, gerador)))
+    imprimir("Campanhas CBO (processar_dados_campanhas)", linhas)
+
+    linhas = []
+    for escala in ESCALAS:
+        quantidade = int(total_adsets * escala)
+        linhas.append((quantidade, medir_abo(quantidade, ADSETS_POR_CAMPANHA_ABO, gerador)))
+    imprimir(f"Ad sets ABO, {ADSETS_POR_CAMPANHA_ABO} por campanha (processar_campanha_abo)", linhas)
+
+    # Mesmo total de ad sets concentrado em menos campanhas: a junção por índice
+    # não depende de quantos ad sets cada campanha tem
+    linhas = []
+    for adsets_por_campanha in [50, 500, 5000]:
+        linhas.append((total_adsets, medir_abo(total_adsets, adsets_por_campanha, gerador)))
+    imprimir(f"{total_adsets} ad sets com 50, 500 e 5000 ad sets por campanha", linhas)
+
+if __name__ == "__main__":
+    main()
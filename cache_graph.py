@@ -0,0 +1,248 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from urllib.parse import urlsplit, parse_qsl
+import graph_client
+import limite_uso
+
+# Cache das leituras da Graph API compartilhado pelas operações.
+# Consultas de janelas em andamento (today) e de estrutura (campanhas, ad sets) ficam
+# em memória por TTL_ABERTA segundos; insights de janelas já encerradas (yesterday,
+# last_7d, intervalos que terminam antes de hoje) não mudam mais e são gravados em disco.
+
+TTL_ABERTA = 300  # segundos que uma consulta de janela em andamento continua válida
+MAX_ITENS_MEMORIA = 256  # consultas mantidas em memória (as menos usadas saem primeiro)
+DIRETORIO_DISCO = "cache_insights"
+MAX_BYTES_DISCO = 50 * 1024 * 1024  # tamanho máximo do cache em disco
+PARAMETROS_IGNORADOS = {"access_token"}
+
+# Presets que terminam antes de hoje; o intervalo real depende do dia em que são consultados
+PRESETS_FECHADOS = {
+    "yesterday", "last_3d", "last_7d", "last_14d", "last_28d", "last_30d", "last_90d",
+    "last_week_mon_sun", "last_week_sun_sat", "last_month", "last_quarter", "last_year"
+}
+
+ESTRUTURA = "estrutura"
+ABERTA = "aberta"
+FECHADA = "fechada"
+
+_memoria = OrderedDict()  # chave -> {"conta", "tipo", "expira_em", "dados"}
+_lock = threading.Lock()
+_estatisticas = {"acertos": 0, "falhas": 0}
+
+def log_message(msg):
+    graph_client.log_message(msg)
+
+def _normalizar(url, params=None):
+    partes = urlsplit(url)
+    parametros = dict(parse_qsl(partes.query, keep_blank_values=True))
+    parametros.update({nome: str(valor) for nome, valor in (params or {}).items()})
+    for nome in PARAMETROS_IGNORADOS:
+        parametros.pop(nome, None)
+    return partes.path, parametros
+
+def _fins_intervalos(parametros):
+    """Datas finais dos intervalos pedidos (time_range, time_ranges ou time_range[until])"""
+    try:
+        if "time_ranges" in parametros:
+            return [t["until"] for t in json.loads(parametros["time_ranges"])]
+        if "time_range" in parametros:
+            return [json.loads(parametros["time_range"])["until"]]
+    except (ValueError, KeyError, TypeError):
+        return None
+    if "time_range[until]" in parametros:
+        return [parametros["time_range[until]"]]
+    return []
+
+def classificar(caminho, parametros):
+    """
+    Classifica a consulta e indica se o resultado depende do dia atual
+
+    Returns:
+        tuple: (ESTRUTURA | ABERTA | FECHADA, depende_do_dia)
+    """
+    preset = parametros.get("date_preset")
+    if preset:
+        return (FECHADA if preset in PRESETS_FECHADOS else ABERTA), True
+    fins = _fins_intervalos(parametros)
+    if fins is None:
+        return ABERTA, True
+    if not fins:
+        return (ABERTA, True) if caminho.endswith("/insights") else (ESTRUTURA, False)
+    hoje = date.today().isoformat()
+    return (FECHADA if all(fim < hoje for fim in fins) else ABERTA), False
+
+def _chave(caminho, parametros, depende_do_dia):
+    partes = [caminho, sorted(parametros.items())]
+    if depende_do_dia:
+        partes.append(date.today().isoformat())
+    return json.dumps(partes, separators=(",", ":"))
+
+def _arquivo(chave):
+    return os.path.join(DIRETORIO_DISCO, hashlib.sha256(chave.encode("utf-8")).hexdigest() + ".json")
+
+def _ler_disco(chave):
+    caminho = _arquivo(chave)
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            conteudo = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if conteudo.get("chave") != chave:
+        return None
+    try:
+        os.utime(caminho)  # Marca o uso para a remoção por antiguidade
+    except OSError:
+        pass
+    return conteudo["dados"]
+
+def _gravar_disco(chave, conta, dados):
+    try:
+        os.makedirs(DIRETORIO_DISCO, exist_ok=True)
+        caminho = _arquivo(chave)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"chave": chave, "conta": conta, "salvo_em": time.time(), "dados": dados}, f)
+        os.replace(temporario, caminho)
+        _podar_disco()
+    except OSError as e:
+        log_message(f"[AVISO] Não foi possível gravar o cache em disco: {e}")
+
+def _podar_disco():
+    """Remove os arquivos usados há mais tempo até o cache caber em MAX_BYTES_DISCO"""
+    arquivos = []
+    for nome in os.listdir(DIRETORIO_DISCO):
+        if not nome.endswith(".json"):
+            continue
+        caminho = os.path.join(DIRETORIO_DISCO, nome)
+        try:
+            info = os.stat(caminho)
+        except OSError:
+            continue
+        arquivos.append((info.st_mtime, info.st_size, caminho))
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= MAX_BYTES_DISCO:
+            break
+        try:
+            os.remove(caminho)
+            total -= tamanho
+        except OSError:
+            pass
+
+def _guardar_memoria(chave, conta, tipo, dados):
+    expira_em = None if tipo == FECHADA else time.time() + TTL_ABERTA
+    _memoria[chave] = {"conta": conta, "tipo": tipo, "expira_em": expira_em, "dados": dados}
+    _memoria.move_to_end(chave)
+    while len(_memoria) > MAX_ITENS_MEMORIA:
+        _memoria.popitem(last=False)
+
+def obter(url, params=None):
+    """Retorna uma cópia do resultado em cache da consulta, ou None se não houver"""
+    caminho, parametros = _normalizar(url, params)
+    tipo, depende_do_dia = classificar(caminho, parametros)
+    chave = _chave(caminho, parametros, depende_do_dia)
+
+    with _lock:
+        item = _memoria.get(chave)
+        if item and (item["expira_em"] is None or item["expira_em"] > time.time()):
+            _memoria.move_to_end(chave)
+            _estatisticas["acertos"] += 1
+            return copy.deepcopy(item["dados"])
+        if item:
+            del _memoria[chave]
+
+    if tipo == FECHADA:
+        dados = _ler_disco(chave)
+        if dados is not None:
+            with _lock:
+                _guardar_memoria(chave, limite_uso.identificar_conta(url), tipo, dados)
+                _estatisticas["acertos"] += 1
+            return copy.deepcopy(dados)
+
+    with _lock:
+        _estatisticas["falhas"] += 1
+    return None
+
+def guardar(url, params, dados):
+    """Guarda o resultado completo de uma consulta (todas as páginas)"""
+    caminho, parametros = _normalizar(url, params)
+    tipo, depende_do_dia = classificar(caminho, parametros)
+    chave = _chave(caminho, parametros, depende_do_dia)
+    conta = limite_uso.identificar_conta(url)
+    dados = copy.deepcopy(dados)
+
+    with _lock:
+        _guardar_memoria(chave, conta, tipo, dados)
+    if tipo == FECHADA:
+        _gravar_disco(chave, conta, dados)
+
+def registrar_orcamentos(orcamentos):
+    """
+    Aplica nas consultas de estrutura em cache os orçamentos alterados pelas operações,
+    para que a próxima operação não precise buscar campanhas e ad sets de novo
+
+    Args:
+        orcamentos (dict): id do objeto (campanha ou ad set) -> novo daily_budget em centavos
+    """
+    if not orcamentos:
+        return
+    with _lock:
+        for item in _memoria.values():
+            if item["tipo"] == ESTRUTURA:
+                _atualizar_orcamentos(item["dados"], orcamentos)
+
+def _atualizar_orcamentos(registros, orcamentos):
+    for registro in registros:
+        if not isinstance(registro, dict):
+            continue
+        if registro.get("id") in orcamentos:
+            registro["daily_budget"] = str(orcamentos[registro["id"]])
+        # Conexões expandidas (ex.: ad sets embutidos na campanha)
+        for valor in registro.values():
+            if isinstance(valor, dict) and isinstance(valor.get("data"), list):
+                _atualizar_orcamentos(valor["data"], orcamentos)
+
+def invalidar(conta=None, somente_estrutura=False, disco=False):
+    """
+    Descarta resultados em cache
+
+    Args:
+        conta (str): limita à conta de anúncio informada; None descarta de todas
+        somente_estrutura (bool): descarta apenas campanhas/ad sets, mantendo insights
+        disco (bool): também apaga o cache de janelas encerradas gravado em disco
+    """
+    with _lock:
+        for chave in list(_memoria):
+            item = _memoria[chave]
+            if conta and item["conta"] != conta:
+                continue
+            if somente_estrutura and item["tipo"] != ESTRUTURA:
+                continue
+            del _memoria[chave]
+
+    if disco and not somente_estrutura and os.path.isdir(DIRETORIO_DISCO):
+        for nome in os.listdir(DIRETORIO_DISCO):
+            caminho = os.path.join(DIRETORIO_DISCO, nome)
+            if conta:
+                # Arquivos ilegíveis podem ser de outra conta; só saem na limpeza geral (conta=None)
+                try:
+                    with open(caminho, "r", encoding="utf-8") as f:
+                        if json.load(f).get("conta") != conta:
+                            continue
+                except (OSError, ValueError):
+                    continue
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+def obter_estatisticas():
+    """Acertos e falhas do cache desde o início do processo, para exibição no dashboard"""
+    with _lock:
+        return dict(_estatisticas, itens_memoria=len(_memoria))
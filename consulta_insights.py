@@ -0,0 +1,325 @@
+import json
+import time
+from datetime import date, timedelta
+import requests
+import graph_client
+import cache_graph
+import dinheiro
+
+# Consulta de insights compartilhada pelas operações.
+# Consultas pequenas usam o endpoint síncrono /insights; consultas grandes (muitos
+# objetos ou períodos longos) são enviadas como relatório assíncrono
+# (POST /act_x/insights -> report_run_id), acompanhadas até concluir e então lidas.
+
+LIMITE_CUSTO_SINCRONO = 20000  # objetos x dias acima do qual a consulta vai para relatório assíncrono
+INTERVALO_CONSULTA_INICIAL = 2.0  # segundos entre consultas de status do relatório
+INTERVALO_CONSULTA_MAXIMO = 15.0
+TEMPO_MAXIMO_RELATORIO = 900  # segundos aguardando um relatório assíncrono
+
+DIAS_POR_PRESET = {
+    "today": 1,
+    "yesterday": 1,
+    "last_3d": 3,
+    "last_7d": 7,
+    "last_14d": 14,
+    "last_28d": 28,
+    "last_30d": 30,
+    "last_90d": 90
+}
+
+TIPOS_COMPRA = frozenset(['offsite_conversion.purchase', 'offsite_conversion.fb_pixel_purchase'])
+
+STATUS_CONCLUIDO = "Job Completed"
+STATUS_FALHA = {"Job Failed", "Job Skipped"}
+
+def dias_periodo(date_preset=None, start_date=None, end_date=None, time_ranges=None):
+    """Quantidade de dias coberta pelo período da consulta"""
+    if time_ranges:
+        return sum(dias_periodo(start_date=t["since"], end_date=t["until"]) for t in time_ranges)
+    if date_preset:
+        if date_preset in DIAS_POR_PRESET:
+            return DIAS_POR_PRESET[date_preset]
+        try:
+            intervalo = intervalo_janela(date_preset)
+        except ValueError:
+            return 1
+        return dias_periodo(start_date=intervalo["since"], end_date=intervalo["until"])
+    try:
+        inicio = date.fromisoformat(start_date)
+        fim = date.fromisoformat(end_date)
+        return max(1, (fim - inicio).days + 1)
+    except (TypeError, ValueError):
+        return 1
+
+def parametros_periodo(date_preset=None, start_date=None, end_date=None, time_ranges=None):
+    if time_ranges:
+        return {"time_ranges": json.dumps(time_ranges)}
+    if date_preset:
+        return {"date_preset": date_preset}
+    return {"time_range": json.dumps({"since": start_date, "until": end_date})}
+
+def intervalo_janela(janela, hoje=None):
+    """
+    Converte um preset da Graph API no intervalo {"since", "until"} equivalente:
+    today, yesterday, last_Nd, last_week_mon_sun, last_week_sun_sat, last_month,
+    last_quarter e last_year (os mesmos presets encerrados do cache_graph)
+    """
+    hoje = hoje or date.today()
+    if janela == "today":
+        inicio = fim = hoje
+    elif janela == "yesterday":
+        inicio = fim = hoje - timedelta(days=1)
+    elif janela in DIAS_POR_PRESET:
+        # Os presets last_Nd da Graph API terminam ontem
+        fim = hoje - timedelta(days=1)
+        inicio = hoje - timedelta(days=DIAS_POR_PRESET[janela])
+    elif janela in ("last_week_mon_sun", "last_week_sun_sat"):
+        # Semana completa anterior à atual (começando na segunda ou no domingo)
+        dias_desde_inicio = hoje.weekday() if janela == "last_week_mon_sun" else (hoje.weekday() + 1) % 7
+        inicio = hoje - timedelta(days=dias_desde_inicio + 7)
+        fim = inicio + timedelta(days=6)
+    elif janela == "last_month":
+        fim = hoje.replace(day=1) - timedelta(days=1)
+        inicio = fim.replace(day=1)
+    elif janela == "last_quarter":
+        inicio_trimestre = hoje.replace(month=3 * ((hoje.month - 1) // 3) + 1, day=1)
+        fim = inicio_trimestre - timedelta(days=1)
+        inicio = fim.replace(month=3 * ((fim.month - 1) // 3) + 1, day=1)
+    elif janela == "last_year":
+        inicio = date(hoje.year - 1, 1, 1)
+        fim = date(hoje.year - 1, 12, 31)
+    else:
+        raise ValueError(f"Janela de comparação desconhecida: {janela}")
+    return {"since": inicio.isoformat(), "until": fim.isoformat()}
+
+# Presets aceitos por intervalo_janela (e, portanto, em JANELAS_COMPARACAO)
+PRESETS_JANELAS = (
+    *DIAS_POR_PRESET,
+    "last_week_mon_sun", "last_week_sun_sat", "last_month", "last_quarter", "last_year",
+)
+
+def janelas_desconhecidas(janelas):
+    """Janelas da lista que intervalo_janela não sabe converter"""
+    return [janela for janela in janelas or [] if janela not in PRESETS_JANELAS]
+
+def deve_usar_async(quantidade_objetos, date_preset=None, start_date=None, end_date=None, time_ranges=None):
+    """Decide entre consulta síncrona e relatório assíncrono pelo tamanho esperado do resultado"""
+    custo = max(1, quantidade_objetos or 1) * dias_periodo(date_preset, start_date, end_date, time_ranges)
+    return custo >= LIMITE_CUSTO_SINCRONO
+
+def montar_parametros(access_token, campos, level, date_preset=None, start_date=None, end_date=None, filtering=None,
+                      time_ranges=None):
+    parametros = {
+        "fields": ",".join(campos),
+        "level": level,
+        "limit": graph_client.LIMITE_PAGINA,
+        "access_token": access_token
+    }
+    parametros.update(parametros_periodo(date_preset, start_date, end_date, time_ranges))
+    if filtering:
+        parametros["filtering"] = json.dumps(filtering, separators=(",", ":"))
+    return parametros
+
+def iniciar_relatorio(ad_account, parametros):
+    """Envia um relatório assíncrono e retorna o report_run_id"""
+    url = f"{graph_client.GRAPH_API_URL}/{ad_account}/insights"
+    try:
+        resultado = graph_client.post(url, data=parametros).json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise graph_client.ErroGraphAPI({"message": f"Falha ao iniciar relatório assíncrono: {e}"})
+    if "report_run_id" not in resultado:
+        raise graph_client.ErroGraphAPI(resultado.get("error", {"message": f"Resposta inesperada: {resultado}"}))
+    return resultado["report_run_id"]
+
+def aguardar_relatorio(report_run_id, access_token):
+    """Consulta o status do relatório até concluir, falhar ou estourar TEMPO_MAXIMO_RELATORIO"""
+    url = f"{graph_client.GRAPH_API_URL}/{report_run_id}"
+    parametros = {"fields": "async_status,async_percent_completion", "access_token": access_token}
+    intervalo = INTERVALO_CONSULTA_INICIAL
+    limite = time.time() + TEMPO_MAXIMO_RELATORIO
+
+    while True:
+        try:
+            status = graph_client.get(url, params=parametros).json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise graph_client.ErroGraphAPI({"message": f"Falha ao consultar relatório {report_run_id}: {e}"})
+        if "error" in status:
+            raise graph_client.ErroGraphAPI(status["error"])
+
+        situacao = status.get("async_status")
+        if situacao == STATUS_CONCLUIDO and status.get("async_percent_completion", 100) >= 100:
+            return
+        if situacao in STATUS_FALHA:
+            raise graph_client.ErroGraphAPI({"message": f"Relatório {report_run_id} terminou com status '{situacao}'"})
+        if time.time() + intervalo > limite:
+            raise graph_client.ErroGraphAPI({"message": f"Relatório {report_run_id} não concluiu em {TEMPO_MAXIMO_RELATORIO}s"})
+
+        time.sleep(intervalo)
+        intervalo = min(intervalo * 1.5, INTERVALO_CONSULTA_MAXIMO)
+
+def resultados_relatorio(report_run_id, access_token):
+    url = f"{graph_client.GRAPH_API_URL}/{report_run_id}/insights"
+    return graph_client.buscar_todos(url, {"limit": graph_client.LIMITE_PAGINA, "access_token": access_token})
+
+def buscar_insights_async(ad_account, parametros):
+    """Executa a consulta como relatório assíncrono e retorna todos os registros"""
+    report_run_id = iniciar_relatorio(ad_account, parametros)
+    graph_client.log_message(f"Relatório assíncrono {report_run_id} iniciado para a conta {ad_account} ({parametros['level']})")
+    aguardar_relatorio(report_run_id, parametros["access_token"])
+    dados = resultados_relatorio(report_run_id, parametros["access_token"])
+    graph_client.log_message(f"Relatório assíncrono {report_run_id} concluído: {len(dados)} registros")
+    return dados
+
+def buscar_insights(ad_account, access_token, campos, level, date_preset=None, start_date=None, end_date=None,
+                    filtering=None, quantidade_objetos=None, time_ranges=None):
+    """
+    Busca insights de uma conta escolhendo automaticamente entre o endpoint síncrono
+    e o relatório assíncrono
+
+    Args:
+        ad_account (str): conta de anúncio (act_...)
+        access_token (str): token da Graph API
+        campos (list): campos pedidos (ex.: ["campaign_id", "spend", "action_values"])
+        level (str): nível da consulta (campaign, adset, ...)
+        date_preset (str): preset de período; se None, usa start_date/end_date
+        filtering (list): filtros da Graph API, opcional
+        quantidade_objetos (int): estimativa de objetos no resultado, usada na escolha sync/async
+        time_ranges (list): vários intervalos {"since", "until"} em uma única consulta;
+                            cada registro volta com date_start/date_stop do seu intervalo
+
+    Returns:
+        list: registros de insights
+    """
+    parametros = montar_parametros(access_token, campos, level, date_preset, start_date, end_date, filtering, time_ranges)
+    url = f"{graph_client.GRAPH_API_URL}/{ad_account}/insights"
+
+    em_cache = cache_graph.obter(url, parametros)
+    if em_cache is not None:
+        return em_cache
+
+    try:
+        if deve_usar_async(quantidade_objetos, date_preset, start_date, end_date, time_ranges):
+            dados = buscar_insights_async(ad_account, parametros)
+        else:
+            try:
+                dados = graph_client.buscar_todos(url, parametros)
+            except graph_client.ErroGraphAPI as e:
+                if not graph_client.erro_volume_dados(e.erro):
+                    raise
+                graph_client.log_message(f"[AVISO] Consulta de insights grande demais para a conta {ad_account}. Usando relatório assíncrono")
+                dados = buscar_insights_async(ad_account, parametros)
+    except graph_client.ErroGraphAPI as e:
+        graph_client.log_message(f"[ERRO] Graph API retornou: {e.erro}")
+        raise
+
+    cache_graph.guardar(url, parametros, dados)
+    return dados
+
+def valor_compras(insight):
+    """Valor de conversão das compras de um registro de insights, em centavos (uma passada por action_values)"""
+    valor = 0
+    for acao in insight.get("action_values") or ():
+        if acao.get("action_type") in TIPOS_COMPRA:
+            valor += dinheiro.centavos(acao.get("value", 0))
+    return valor
+
+def indexar_insights(insights, campo):
+    """
+    Índice id -> registro de insights, para juntar insights com campanhas e ad sets
+    por consulta ao dicionário; mantém o primeiro registro de cada id
+    """
+    indice = {}
+    for insight in insights:
+        indice.setdefault(insight.get(campo), insight)
+    return indice
+
+def metricas_insight(insight, dias=1):
+    """Gasto, valor de conversão (compras) e lucro em centavos e ROAS de um registro de insights"""
+    gasto = dinheiro.centavos(insight.get("spend", 0))
+    valor_conversao = valor_compras(insight)
+    return {
+        "gasto": gasto,
+        "valor_conversao": valor_conversao,
+        "lucro": valor_conversao - gasto,
+        "roas": round(valor_conversao / gasto, 2) if gasto > 0 else 0,
+        "dias": dias
+    }
+
+def somar_metricas(lista_metricas_janelas):
+    """Soma, janela a janela, as métricas de várias unidades (ex.: ad sets de uma campanha ABO)"""
+    total = {}
+    for metricas_janelas in lista_metricas_janelas:
+        for janela, metricas in metricas_janelas.items():
+            acumulado = total.setdefault(janela, {"gasto": 0, "valor_conversao": 0, "dias": metricas["dias"]})
+            acumulado["gasto"] += metricas["gasto"]
+            acumulado["valor_conversao"] += metricas["valor_conversao"]
+    for acumulado in total.values():
+        acumulado["lucro"] = acumulado["valor_conversao"] - acumulado["gasto"]
+        acumulado["roas"] = round(acumulado["valor_conversao"] / acumulado["gasto"], 2) if acumulado["gasto"] > 0 else 0
+    return total
+
+def pontuacao_janelas(metricas_janelas, pesos=None):
+    """
+    Pontuação multi-janela: média ponderada do lucro diário (em reais) de cada janela.
+    Sem pesos configurados, todas as janelas valem o mesmo.
+    """
+    if not metricas_janelas:
+        return None
+    pesos = pesos or {}
+    soma_pesos = 0.0
+    soma = 0.0
+    for janela, metricas in metricas_janelas.items():
+        peso = float(pesos.get(janela, 1))
+        soma += peso * dinheiro.reais(metricas["lucro"]) / max(1, metricas["dias"])
+        soma_pesos += peso
+    return round(soma / soma_pesos, 2) if soma_pesos > 0 else None
+
+def buscar_insights_comparacao(ad_account, access_token, campos, level, janelas_comparacao=None, date_preset=None,
+                               start_date=None, end_date=None, filtering=None, quantidade_objetos=None):
+    """
+    Busca os insights da janela principal e, na mesma consulta (time_ranges), das janelas
+    de comparação. Retorna os registros da janela principal, cada um com a chave "janelas"
+    ({janela: métricas}); objetos sem dados na janela principal entram com gasto zero.
+    Sem janelas de comparação, equivale a buscar_insights.
+    """
+    janelas_extras = [j for j in (janelas_comparacao or []) if j != date_preset]
+    if not janelas_extras:
+        return buscar_insights(ad_account, access_token, campos, level, date_preset, start_date, end_date,
+                               filtering, quantidade_objetos)
+
+    principal = date_preset or "custom"
+    janelas = {principal: intervalo_janela(date_preset) if date_preset else {"since": start_date, "until": end_date}}
+    for janela in janelas_extras:
+        janelas[janela] = intervalo_janela(janela)
+
+    # Janelas com o mesmo intervalo compartilham o resultado
+    nomes_por_intervalo = {}
+    for janela, intervalo in janelas.items():
+        nomes_por_intervalo.setdefault((intervalo["since"], intervalo["until"]), []).append(janela)
+    time_ranges = [{"since": since, "until": until} for since, until in nomes_por_intervalo]
+
+    registros = buscar_insights(ad_account, access_token, campos, level, filtering=filtering,
+                                quantidade_objetos=quantidade_objetos, time_ranges=time_ranges)
+
+    chave_id = f"{level}_id"
+    principais = {}
+    metricas_por_objeto = {}
+    dias_por_intervalo = {intervalo: dias_periodo(start_date=intervalo[0], end_date=intervalo[1]) for intervalo in nomes_por_intervalo}
+    for registro in registros:
+        intervalo = (registro.get("date_start"), registro.get("date_stop"))
+        nomes = nomes_por_intervalo.get(intervalo, [])
+        if not nomes:
+            continue
+        dias = dias_por_intervalo[intervalo]
+        metricas = metricas_insight(registro, dias)
+        id_objeto = registro.get(chave_id)
+        for janela in nomes:
+            metricas_por_objeto.setdefault(id_objeto, {})[janela] = metricas
+        if principal in nomes:
+            principais[id_objeto] = registro
+        elif id_objeto not in principais:
+            principais[id_objeto] = dict(registro, spend="0", action_values=[])
+
+    for id_objeto, registro in principais.items():
+        registro["janelas"] = metricas_por_objeto.get(id_objeto, {})
+    return list(principais.values())
@@ -0,0 +1,73 @@
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+
+# Valores monetários em centavos inteiros (int no Python, int64 nos arrays NumPy).
+# Orçamentos, gastos e valores de conversão são convertidos para centavos ao chegarem
+# da Graph API e só voltam para reais na exibição (planilha e mensagens). Somas,
+# limites e divisões são exatas; os arredondamentos seguem as regras abaixo.
+
+LIMITE_PRODUTO_INT64 = 2 ** 62  # acima disso total x peso pode estourar o int64
+
+def centavos(valor):
+    """
+    Converte um valor em reais (número ou texto decimal da Graph API, ex.: "12.34")
+    para centavos, arredondando ao centavo mais próximo (meio centavo para cima)
+    """
+    if valor is None or valor == "":
+        return 0
+    return int((Decimal(str(valor)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def centavos_orcamento(daily_budget):
+    """daily_budget da Graph API, que já vem em centavos (texto ou número)"""
+    return int(daily_budget or 0)
+
+def reais(valor_centavos):
+    """Valor em reais para a planilha"""
+    return valor_centavos / 100
+
+def formatar(valor_centavos):
+    """Texto em reais com duas casas (ex.: 123456 -> "1234.56"), sem passar por float"""
+    valor_centavos = int(valor_centavos)
+    sinal = "-" if valor_centavos < 0 else ""
+    inteiro, resto = divmod(abs(valor_centavos), 100)
+    return f"{sinal}{inteiro}.{resto:02d}"
+
+def aplicar_percentual(valores, percentual):
+    """
+    Percentual (ex.: 0.3) de cada valor em centavos, arredondado ao centavo mais próximo
+    (meio centavo para cima). O percentual é considerado com precisão de 0,01%.
+    """
+    pontos_base = int((Decimal(str(percentual)) * 10000).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    valores = np.asarray(valores, dtype=np.int64)
+    return (valores * pontos_base + 5000) // 10000
+
+def dividir_proporcional(total, pesos):
+    """
+    Divide total (centavos) na proporção dos pesos, em centavos inteiros.
+
+    Regra de arredondamento (maiores restos): cada parte recebe o piso da sua cota exata
+    total * peso / soma dos pesos; os centavos que sobram vão, um para cada, às partes com
+    as maiores frações descartadas (em empate, na ordem recebida). A soma das partes é
+    sempre exatamente total. Se a soma dos pesos não for positiva, divide em partes iguais.
+
+    Returns:
+        numpy.ndarray: partes em centavos (int64), na ordem dos pesos
+    """
+    pesos = np.asarray(pesos, dtype=np.int64)
+    if len(pesos) == 0:
+        return np.zeros(0, dtype=np.int64)
+    soma = int(pesos.sum())
+    if soma <= 0:
+        pesos = np.ones(len(pesos), dtype=np.int64)
+        soma = len(pesos)
+
+    if abs(total) * int(np.abs(pesos).max()) < LIMITE_PRODUTO_INT64:
+        produtos = total * pesos
+    else:
+        produtos = np.array([total * peso for peso in pesos.tolist()], dtype=object)
+    partes = (produtos // soma).astype(np.int64)
+    restos = (produtos % soma).astype(np.int64)
+
+    sobra = total - int(partes.sum())
+    partes[np.argsort(-restos, kind="stable")[:sobra]] += 1
+    return partes
@@ -1,7 +1,14 @@
 import json
 import os
-import requests
-import openpyxl
+import graph_client
+import snapshot_campanhas
+import dinheiro
+import registros
+import exportacao
+import plano_orcamento
+import operacoes_orcamento
+import metricas_unidades
+import numpy as np
 import time
 import logging
 from selenium import webdriver
@@ -60,478 +67,144 @@ ACCESS_TOKEN = config.get("ACCESS_TOKEN", "")
 AD_ACCOUNTS = config.get("AD_ACCOUNTS", [])
 ABO_ACCOUNTS = config.get("ABO_ACCOUNTS", [])  # Contas que usam ABO
 SPREADSHEET_PATH = "campanhas_lucro.xlsx"
+PLANO_PATH = "plano_escala.json"  # Último plano de escala calculado (ver plano_orcamento)
 LIMITE_LUCRO = float(config.get("LIMITE_LUCRO", 1))
 VALOR_TOTAL_ESCALA = float(config.get("VALOR_TOTAL_ESCALA", 10000))
 MINIMO_ORCAMENTO = float(config.get("MINIMO_ORCAMENTO", 100))
 MAXIMO_ORCAMENTO = float(config.get("MAXIMO_ORCAMENTO", 10000))
+INCREMENTO_MINIMO = 1000  # centavos (R$ 10); incrementos menores não são enviados
 WHATSAPP_GROUP = config.get("WHATSAPP_GROUP", "#ZIP - ROAS IMPERIO")
 DATE_PRESET = config.get("DATE_PRESET", "today")
+SAIDAS = config.get("SAIDAS_ESCALA", exportacao.SAIDAS_PADRAO)  # Formatos do resultado: "xlsx", "csv", "parquet" e/ou "sqlite"
 
-# Armazena dados completos das campanhas para uso no escalonamento
-campanhas_completas_data = {}
+# Estado da execução: campanhas (registros.Campanha) na ordem da planilha; as decisões
+# leem e gravam nesses registros e as saídas só são geradas no final
+campanhas_execucao = []
 
-def criar_planilha():
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "CAMPANHAS"
-    sheet.append([
-        "ID da Conta de Anúncio", "ID da Campanha", "Nome da Campanha", "Tipo",
-        "Orçamento Diário", "Gasto", "Valor de Conversões",
-        "ROAS", "Lucro", "Novo Orçamento", "Detalhes AdSets"
-    ])
-    workbook.save(SPREADSHEET_PATH)
-    log_message("Planilha criada com sucesso.")
+# Ids das unidades deixadas de fora na conferência dos orçamentos, informados no relatório
+unidades_ignoradas = []
 
-def limpar_planilha():
-    if os.path.exists(SPREADSHEET_PATH):
-        try:
-            workbook = openpyxl.load_workbook(SPREADSHEET_PATH)
-            if "CAMPANHAS" in workbook.sheetnames:
-                sheet = workbook["CAMPANHAS"]
-                sheet.delete_rows(2, sheet.max_row)
-            else:
-                workbook.create_sheet("CAMPANHAS")
-            workbook.save(SPREADSHEET_PATH)
-            log_message("Planilha limpa no início da execução.")
-        except Exception as e:
-            log_message(f"[ERRO] Falha ao limpar a planilha: {e}")
-    else:
-        log_message("Planilha não encontrada. Será criada uma nova ao salvar os dados.")
-        criar_planilha()
-
-def buscar_dados_facebook(url):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        log_message(f"[ERRO] Falha ao buscar dados do Facebook: {e}\nResposta: {response.text if 'response' in locals() else ''}")
-        return {}
-
-def buscar_todos_dados_facebook(url):
-    todos_dados = []
-    while url:
-        dados = buscar_dados_facebook(url)
-        if "error" in dados:
-            log_message(f"[ERRO] Graph API retornou: {dados['error']}")
-            break
-        page_data = dados.get("data", [])
-        todos_dados.extend(page_data)
-        url = dados.get("paging", {}).get("next")
-    return todos_dados
-
-def detectar_tipo_campanha(campanha, ad_account):
-    """
-    Detecta se a campanha é CBO ou ABO
-    CBO tem daily_budget > 0, ABO tem daily_budget = 0 ou null
+def planejar_escala():
     """
-    daily_budget = campanha.get("daily_budget", 0)
+    Calcula o escalonamento sem alterar nada na Graph API
     
-    # Verificação adicional pela conta
-    if ad_account in ABO_ACCOUNTS:
-        return "ABO"
-    
-    # Verificação pelo orçamento
-    if daily_budget and int(daily_budget) > 0:
-        return "CBO"
-    else:
-        return "ABO"
-
-def buscar_adsets_campanha(campaign_id):
-    """Busca todos os ad sets de uma campanha ABO"""
-    url = (
-        f"https://graph.facebook.com/v17.0/{campaign_id}/adsets"
-        f"?fields=id,name,daily_budget,status&access_token={ACCESS_TOKEN}"
-    )
-    return buscar_todos_dados_facebook(url)
-
-def buscar_insights_adset(ad_account, campaign_id, date_preset=None, start_date=None, end_date=None):
-    """Busca insights no nível de ad set para campanhas ABO"""
-    # CORREÇÃO: Usar campaign.id ao invés de campaign_id
-    filtering = f'[{{"field":"campaign.id","operator":"EQUAL","value":"{campaign_id}"}}]'
-    
-    if date_preset:
-        url = (
-            f"https://graph.facebook.com/v17.0/{ad_account}/insights"
-            f"?fields=adset_id,adset_name,campaign_id,spend,action_values"
-            f"&date_preset={date_preset}&level=adset"
-            f"&filtering={filtering}"
-            f"&access_token={ACCESS_TOKEN}"
-        )
-    else:
-        url = (
-            f"https://graph.facebook.com/v17.0/{ad_account}/insights"
-            f"?fields=adset_id,adset_name,campaign_id,spend,action_values"
-            f"&time_range[since]={start_date}&time_range[until]={end_date}"
-            f"&level=adset"
-            f"&filtering={filtering}"
-            f"&access_token={ACCESS_TOKEN}"
-        )
-    
-    return buscar_todos_dados_facebook(url)
-
-def processar_campanha_abo(campanha, ad_account, date_preset=None, start_date=None, end_date=None):
-    """
-    Processa campanhas ABO agregando dados de todos os ad sets ativos
-    """
-    campaign_id = campanha["id"]
-    log_message(f"Processando campanha ABO: {campanha['name']}")
-    
-    adsets = buscar_adsets_campanha(campaign_id)
-    insights_adsets = buscar_insights_adset(ad_account, campaign_id, date_preset, start_date, end_date)
-    
-    # Agregar dados de todos os ad sets ativos
-    total_orcamento = 0
-    total_gasto = 0
-    total_conversao = 0
-    adsets_info = []
-    adsets_ativos = 0
-    
-    for adset in adsets:
-        if adset.get("status") == "ACTIVE":
-            adsets_ativos += 1
-            adset_id = adset["id"]
-            daily_budget = float(adset.get("daily_budget", 0)) / 100
-            total_orcamento += daily_budget
-            
-            # Buscar insight correspondente
-            insight = next((i for i in insights_adsets if i.get("adset_id") == adset_id), None)
-            
-            if insight:
-                gasto = float(insight.get("spend", 0))
-                valor_conversao = sum(
-                    float(a.get("value", 0))
-                    for a in insight.get("action_values", [])
-                    if a.get("action_type") in ['offsite_conversion.purchase', 'offsite_conversion.fb_pixel_purchase']
-                )
-                total_gasto += gasto
-                total_conversao += valor_conversao
-            else:
-                gasto = 0
-                valor_conversao = 0
-            
-            adsets_info.append({
-                "adset_id": adset_id,
-                "adset_name": adset["name"],
-                "daily_budget": daily_budget,
-                "gasto": gasto,
-                "valor_conversao": valor_conversao
-            })
-    
-    log_message(f"Campanha ABO {campaign_id}: {adsets_ativos} adsets ativos, orçamento total: R$ {total_orcamento:.2f}")
-    
-    lucro = total_conversao - total_gasto
-    roas = round(total_conversao / total_gasto, 2) if total_gasto > 0 else 0
-    
-    return {
-        "id_conta": ad_account,
-        "id_campanha": campaign_id,
-        "nome_campanha": campanha["name"],
-        "tipo_campanha": "ABO",
-        "orcamento_diario": total_orcamento,
-        "gasto": total_gasto,
-        "valor_conversao": total_conversao,
-        "roas": roas,
-        "lucro": lucro,
-        "adsets_info": adsets_info,
-        "detalhes_adsets": f"{adsets_ativos} adsets ativos"
-    }
-
-def processar_dados_campanhas(campanhas, insights, ad_account, date_preset=None, start_date=None, end_date=None):
-    """
-    Processa dados das campanhas, detectando automaticamente se são CBO ou ABO
+    Returns:
+        list: decisões (unidade, id_objeto, novo_orcamento, incremento_real),
+              ou None se não houver unidades para escalar
     """
-    campanhas_filtradas = []
-    
-    for campanha in campanhas:
-        if campanha.get("status", "").upper().strip() == "ACTIVE":
-            tipo_campanha = detectar_tipo_campanha(campanha, ad_account)
-            
-            if tipo_campanha == "ABO":
-                # Processar como ABO
-                dados_campanha = processar_campanha_abo(campanha, ad_account, date_preset, start_date, end_date)
-                campanhas_filtradas.append(dados_campanha)
-                # Armazenar dados completos para uso posterior
-                campanhas_completas_data[campanha["id"]] = dados_campanha
-            else:
-                # Processar como CBO (código original)
-                insight = next((i for i in insights if i.get("campaign_id") == campanha.get("id")), None)
-                
-                if insight:
-                    gasto = float(insight.get("spend", 0))
-                    valor_conversao = sum(
-                        float(a.get("value", 0))
-                        for a in insight.get("action_values", [])
-                        if a.get("action_type") in ['offsite_conversion.purchase', 'offsite_conversion.fb_pixel_purchase']
-                    )
-                else:
-                    gasto = 0.0
-                    valor_conversao = 0.0
-                
-                daily_budget = float(campanha.get("daily_budget", 0)) / 100
-                lucro = valor_conversao - gasto
-                roas = round(valor_conversao / gasto, 2) if gasto > 0 else 0
-                
-                dados_campanha = {
-                    "id_conta": ad_account,
-                    "id_campanha": campanha["id"],
-                    "nome_campanha": campanha["name"],
-                    "tipo_campanha": "CBO",
-                    "orcamento_diario": daily_budget,
-                    "gasto": gasto,
-                    "valor_conversao": valor_conversao,
-                    "roas": roas,
-                    "lucro": lucro,
-                    "adsets_info": None,
-                    "detalhes_adsets": "N/A"
-                }
-                
-                campanhas_filtradas.append(dados_campanha)
-                campanhas_completas_data[campanha["id"]] = dados_campanha
-    
-    return campanhas_filtradas
-
-def salvar_campanhas_excel(campanhas):
-    if not os.path.exists(SPREADSHEET_PATH):
-        criar_planilha()
-    
-    try:
-        workbook = openpyxl.load_workbook(SPREADSHEET_PATH)
-        sheet = workbook["CAMPANHAS"]
-        
-        for campanha in campanhas:
-            sheet.append([
-                campanha["id_conta"],
-                campanha["id_campanha"],
-                campanha["nome_campanha"],
-                campanha.get("tipo_campanha", "CBO"),
-                campanha["orcamento_diario"],
-                campanha["gasto"],
-                campanha["valor_conversao"],
-                campanha["roas"],
-                campanha["lucro"],
-                "",  # Novo orçamento
-                campanha.get("detalhes_adsets", "")
-            ])
-        
-        workbook.save(SPREADSHEET_PATH)
-        log_message("Dados das campanhas salvos na planilha.")
-    except Exception as e:
-        log_message(f"[ERRO] Falha ao salvar planilha: {e}")
-
-def calcular_orcamento_total():
-    try:
-        workbook = openpyxl.load_workbook(SPREADSHEET_PATH)
-        sheet = workbook["CAMPANHAS"]
-        total = 0
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            novo_orcamento = row[9] if row[9] is not None else row[4]
-            total += novo_orcamento
-        return total
-    except Exception as e:
-        log_message(f"[ERRO] Falha ao calcular orçamento total: {e}")
-        return 0
-
-def atualizar_orcamento_adset(adset_id, novo_orcamento):
-    """Atualiza o orçamento de um ad set específico"""
-    url = f"https://graph.facebook.com/v17.0/{adset_id}"
-    payload = {
-        "daily_budget": int(novo_orcamento * 100),
-        "access_token": ACCESS_TOKEN
-    }
+    # Lista unificada de unidades candidatas (campanhas CBO + AdSets ABO individuais)
+    candidatas = []
     
-    try:
-        log_message(f"Atualizando orçamento do AdSet {adset_id} para R$ {novo_orcamento:.2f}")
-        response = requests.post(url, data=payload)
-        result = response.json()
+    for campanha in campanhas_execucao:
+        if campanha.tipo_campanha == "ABO" and campanha.adsets_info:
+            # IMPORTANTE: Para campanhas ABO, SEMPRE processar os AdSets
+            # independentemente do lucro da campanha
+            log_message(f"Processando AdSets da campanha ABO: {campanha.nome_campanha} (lucro campanha: R$ {dinheiro.formatar(campanha.lucro)})")
         
-        if result.get("success"):
-            log_message(f"Orçamento do AdSet {adset_id} atualizado com sucesso")
-            return True
-        else:
-            erro_msg = result.get('error', {}).get('message', 'Erro desconhecido')
-            log_message(f"[ERRO] Falha ao atualizar AdSet {adset_id}: {erro_msg}")
-            return False
-    except requests.exceptions.RequestException as e:
-        log_message(f"[ERRO] Erro na requisição para atualizar AdSet {adset_id}: {e}")
-        return False
-
-def atualizar_orcamento_facebook(id_campanha, novo_orcamento):
-    """Atualiza o orçamento de campanhas CBO"""
-    url = f"https://graph.facebook.com/v17.0/{id_campanha}"
-    payload = {
-        "daily_budget": int(novo_orcamento * 100),
-        "access_token": ACCESS_TOKEN
-    }
-    try:
-        log_message(f"Enviando atualização de orçamento para campanha {id_campanha}")
-        response = requests.post(url, data=payload)
-        result = response.json()
-        log_message(f"Resposta da API: {result}")
-        if result.get("success"):
-            log_message(f"Orçamento atualizado para a campanha {id_campanha}: R$ {novo_orcamento:.2f}")
-            return True
-        else:
-            log_message(f"[ERRO] Falha ao atualizar campanha {id_campanha}: {result.get('error', {}).get('message')}")
-            return False
-    except requests.exceptions.RequestException as e:
-        log_message(f"[ERRO] Erro na requisição para atualizar orçamento: {e}")
-        return False
-
-def escalar_campanhas():
-    if not os.path.exists(SPREADSHEET_PATH):
-        log_message("[ERRO] Planilha de campanhas não encontrada.")
-        return False
+        # As unidades apontam para os registros da coleta, sem copiar os dados
+        candidatas.extend(registros.unidades_da_campanha(campanha))
     
-    workbook = openpyxl.load_workbook(SPREADSHEET_PATH)
-    if "CAMPANHAS" not in workbook.sheetnames:
-        log_message("[ERRO] Aba 'CAMPANHAS' não encontrada na planilha.")
-        return False
-    
-    sheet = workbook["CAMPANHAS"]
+    # Filtro de lucro no nível do AdSet para ABO e da campanha para CBO, calculado em bloco
+    candidatas = metricas_unidades.TabelaUnidades(candidatas)
+    escalaveis = candidatas.selecionar(candidatas.lucro >= dinheiro.centavos(LIMITE_LUCRO))
+    log_message(f"  -> {int(escalaveis.adset.sum())} AdSets com lucro >= R$ {LIMITE_LUCRO:.2f}")
     
-    # Lista unificada de unidades escaláveis (campanhas CBO + AdSets ABO individuais)
-    unidades_escalaveis = []
-    
-    for row_index, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-        lucro = row[8]
-        tipo_campanha = row[3] if len(row) > 3 else "CBO"
-        id_campanha = row[1]
-        
-        if tipo_campanha == "ABO":
-            # IMPORTANTE: Para campanhas ABO, SEMPRE processar os AdSets
-            # independentemente do lucro da campanha
-            campanha_completa = campanhas_completas_data.get(id_campanha)
-            if campanha_completa and campanha_completa.get("adsets_info"):
-                log_message(f"Processando AdSets da campanha ABO: {row[2]} (lucro campanha: R$ {lucro:.2f})")
-                adsets_adicionados = 0
-                
-                for adset in campanha_completa["adsets_info"]:
-                    adset_lucro = adset.get('valor_conversao', 0) - adset.get('gasto', 0)
-                    # Aplicar filtro de lucro apenas no nível do AdSet
-                    if adset_lucro >= LIMITE_LUCRO:
-                        unidades_escalaveis.append({
-                            "tipo": "ABO_ADSET",
-                            "linha_index": row_index,
-                            "id_campanha": id_campanha,
-                            "id_adset": adset['adset_id'],
-                            "nome": f"{row[2]} - {adset['adset_name']}",
-                            "nome_campanha": row[2],
-                            "orcamento_atual": adset['daily_budget'],
-                            "lucro": adset_lucro,
-                            "adset_info": adset,
-                            "campanha_info": campanha_completa
-                        })
-                        adsets_adicionados += 1
-                
-                log_message(f"  -> {adsets_adicionados} AdSets com lucro >= R$ {LIMITE_LUCRO:.2f}")
-        else:
-            # Para campanhas CBO, aplicar filtro de lucro na campanha
-            if lucro is not None and lucro >= LIMITE_LUCRO:
-                unidades_escalaveis.append({
-                    "tipo": "CBO",
-                    "linha_index": row_index,
-                    "id_campanha": id_campanha,
-                    "nome": row[2],
-                    "nome_campanha": row[2],
-                    "orcamento_atual": row[4],
-                    "lucro": lucro
-                })
+    # Conferir os orçamentos atuais antes de calcular as alterações
+    unidades_escalaveis = operacoes_orcamento.conferir_orcamentos_atuais(escalaveis.unidades, ACCESS_TOKEN, ignoradas=unidades_ignoradas)
     
     if not unidades_escalaveis:
         log_message("[INFO] Nenhuma unidade para escalar.")
-        return False
+        return None
     
     # Ordenar por lucro (maior primeiro) para priorizar os melhores
-    unidades_escalaveis.sort(key=lambda x: x["lucro"], reverse=True)
+    tabela = metricas_unidades.TabelaUnidades(unidades_escalaveis).ordenar_por_lucro(decrescente=True)
     
     # Calcular soma total dos lucros
-    soma_lucro = sum(u["lucro"] for u in unidades_escalaveis)
-    
-    log_message(f"[INFO] {len(unidades_escalaveis)} unidades para escalonamento:")
-    log_message(f"- Campanhas CBO: {sum(1 for u in unidades_escalaveis if u['tipo'] == 'CBO')}")
-    log_message(f"- AdSets ABO: {sum(1 for u in unidades_escalaveis if u['tipo'] == 'ABO_ADSET')}")
-    log_message(f"- Soma dos lucros: R$ {soma_lucro:.2f}")
+    soma_lucro = int(tabela.lucro.sum())
+    
+    log_message(f"[INFO] {len(tabela)} unidades para escalonamento:")
+    log_message(f"- Campanhas CBO: {int((~tabela.adset).sum())}")
+    log_message(f"- AdSets ABO: {int(tabela.adset.sum())}")
+    log_message(f"- Soma dos lucros: R$ {dinheiro.formatar(soma_lucro)}")
+    
+    # Calcular os novos orçamentos de todas as unidades antes de enviar as atualizações:
+    # incremento proporcional ao lucro, limites de orçamento e incremento real (em centavos)
+    incrementos = tabela.partes_proporcionais(dinheiro.centavos(VALOR_TOTAL_ESCALA))
+    novos_orcamentos = metricas_unidades.limitar(
+        tabela.orcamento + incrementos, dinheiro.centavos(MINIMO_ORCAMENTO), dinheiro.centavos(MAXIMO_ORCAMENTO)
+    )
+    incrementos_reais = novos_orcamentos - tabela.orcamento
     
+    decisoes = [
+        (tabela.unidades[i], tabela.ids[i], novos_orcamentos[i].item(), incrementos_reais[i].item())
+        for i in np.flatnonzero(incrementos >= INCREMENTO_MINIMO)
+    ]
+    return decisoes
+
+def itens_do_plano(decisoes):
+    """Itens do plano (plano_orcamento) com o motivo de cada escalonamento"""
+    return [
+        plano_orcamento.novo_item(
+            "escala", unidade, novo_orcamento,
+            f"Lucro de R$ {dinheiro.formatar(unidade.valor_conversao - unidade.gasto)} (mínimo R$ {LIMITE_LUCRO:.2f}): "
+            f"+R$ {dinheiro.formatar(incremento_real)} da escala de R$ {VALOR_TOTAL_ESCALA:.2f}, proporcional ao lucro"
+        )
+        for unidade, _, novo_orcamento, incremento_real in decisoes
+    ]
+
+def aplicar_escala(decisoes):
+    """Envia as alterações calculadas em planejar_escala, registra o resultado e avisa no WhatsApp"""
     # Distribuir verba proporcionalmente
     unidades_escaladas = []
     total_distribuido = 0
     campanhas_modificadas = {}  # Para rastrear mudanças nas campanhas ABO
     
-    for unidade in unidades_escalaveis:
-        # Calcular incremento proporcional ao lucro
-        if soma_lucro > 0:
-            proporcao = unidade["lucro"] / soma_lucro
-            incremento = VALOR_TOTAL_ESCALA * proporcao
-        else:
-            incremento = VALOR_TOTAL_ESCALA / len(unidades_escalaveis)
-        
-        # Aplicar limites mínimos de incremento
-        if incremento < 10:  # Incremento mínimo de R$ 10
+    # Enviar todas as atualizações pelo endpoint batch
+    resultados = operacoes_orcamento.atualizar_orcamentos_em_lote([
+        (unidade.tipo, id_objeto, novo_orcamento, unidade.campanha_info.id_conta)
+        for unidade, id_objeto, novo_orcamento, _ in decisoes
+    ], ACCESS_TOKEN)
+    
+    for (unidade, _, novo_orcamento, incremento_real), sucesso in zip(decisoes, resultados):
+        if not sucesso:
             continue
-            
-        sucesso = False
         
-        if unidade["tipo"] == "CBO":
-            # Escalar campanha CBO
-            novo_orcamento = min(
-                max(unidade["orcamento_atual"] + incremento, MINIMO_ORCAMENTO),
-                MAXIMO_ORCAMENTO
-            )
-            
-            # Calcular incremento real (pode ser menor devido aos limites)
-            incremento_real = novo_orcamento - unidade["orcamento_atual"]
-            
-            if atualizar_orcamento_facebook(unidade["id_campanha"], novo_orcamento):
-                sheet.cell(row=unidade["linha_index"], column=10).value = novo_orcamento
-                unidades_escaladas.append(f"{unidade['nome']} (CBO) +R$ {incremento_real:.2f}")
-                total_distribuido += incremento_real
-                sucesso = True
-                log_message(f"Campanha CBO {unidade['id_campanha']} escalada para R$ {novo_orcamento:.2f} (+R$ {incremento_real:.2f})")
-                
+        unidade.definir_novo_orcamento(novo_orcamento)
+        if unidade.tipo == "CBO":
+            unidades_escaladas.append(f"{unidade.nome} (CBO) +R$ {dinheiro.formatar(incremento_real)}")
+            total_distribuido += incremento_real
+            log_message(f"Campanha CBO {unidade.id_campanha} escalada para R$ {dinheiro.formatar(novo_orcamento)} (+R$ {dinheiro.formatar(incremento_real)})")
         else:  # ABO_ADSET
-            # Escalar AdSet individual
-            adset = unidade["adset_info"]
-            novo_orcamento = min(
-                max(adset['daily_budget'] + incremento, MINIMO_ORCAMENTO),
-                MAXIMO_ORCAMENTO
-            )
+            adset = unidade.adset_info
+            # Rastrear mudança total na campanha
+            if unidade.id_campanha not in campanhas_modificadas:
+                campanhas_modificadas[unidade.id_campanha] = {
+                    "campanha": unidade.campanha_info,
+                    "orcamento_original": unidade.campanha_info.orcamento_diario,
+                    "incremento_total": 0,
+                    "nome": unidade.nome_campanha
+                }
             
-            # Calcular incremento real
-            incremento_real = novo_orcamento - adset['daily_budget']
+            campanhas_modificadas[unidade.id_campanha]["incremento_total"] += incremento_real
             
-            if atualizar_orcamento_adset(unidade["id_adset"], novo_orcamento):
-                # Rastrear mudança total na campanha
-                if unidade["id_campanha"] not in campanhas_modificadas:
-                    campanhas_modificadas[unidade["id_campanha"]] = {
-                        "linha_index": unidade["linha_index"],
-                        "orcamento_original": unidade["campanha_info"]["orcamento_diario"],
-                        "incremento_total": 0,
-                        "nome": unidade["nome_campanha"]
-                    }
-                
-                campanhas_modificadas[unidade["id_campanha"]]["incremento_total"] += incremento_real
-                
-                unidades_escaladas.append(f"{unidade['nome']} (ABO AdSet) +R$ {incremento_real:.2f}")
-                total_distribuido += incremento_real
-                sucesso = True
-                log_message(f"AdSet {unidade['id_adset']} escalado de R$ {adset['daily_budget']:.2f} para R$ {novo_orcamento:.2f} (+R$ {incremento_real:.2f})")
+            unidades_escaladas.append(f"{unidade.nome} (ABO AdSet) +R$ {dinheiro.formatar(incremento_real)}")
+            total_distribuido += incremento_real
+            log_message(f"AdSet {unidade.id_adset} escalado de R$ {dinheiro.formatar(adset.daily_budget)} para R$ {dinheiro.formatar(novo_orcamento)} (+R$ {dinheiro.formatar(incremento_real)})")
     
-    # Atualizar orçamentos totais das campanhas ABO na planilha
+        # Atualizar orçamentos totais das campanhas ABO na planilha
     for id_campanha, info in campanhas_modificadas.items():
         novo_orcamento_total = info["orcamento_original"] + info["incremento_total"]
-        sheet.cell(row=info["linha_index"], column=10).value = novo_orcamento_total
-        log_message(f"Campanha ABO {info['nome']} - orçamento total atualizado para R$ {novo_orcamento_total:.2f}")
+        info["campanha"].novo_orcamento = novo_orcamento_total
+        log_message(f"Campanha ABO {info['nome']} - orçamento total atualizado para R$ {dinheiro.formatar(novo_orcamento_total)}")
     
-    workbook.save(SPREADSHEET_PATH)
-    total_orcamento_atual = calcular_orcamento_total()
+    total_orcamento_atual = operacoes_orcamento.calcular_orcamento_total(campanhas_execucao)
     
     # Criar mensagem detalhada
     mensagem = (
         f"✅ Escala realizada com sucesso!\n\n"
-        f"💰 Total distribuído: R$ {total_distribuido:.2f}\n"
+        f"💰 Total distribuído: R$ {dinheiro.formatar(total_distribuido)}\n"
         f"📊 Unidades escaladas: {len(unidades_escaladas)}\n"
-        f"📈 Orçamento total atual: R$ {total_orcamento_atual:.2f}\n\n"
+        f"📈 Orçamento total atual: R$ {dinheiro.formatar(total_orcamento_atual)}\n\n"
     )
     
     # Separar por tipo
@@ -553,11 +226,13 @@ def escalar_campanhas():
         if len(adsets_abo_escalados) > 5:
             mensagem += f"... e mais {len(adsets_abo_escalados) - 5} AdSets ABO\n"
     
+    mensagem += operacoes_orcamento.relatorio_ignoradas(unidades_ignoradas)
+    
     # Log detalhado
     log_message(f"[RESUMO] Total de unidades escaladas: {len(unidades_escaladas)}")
     log_message(f"[RESUMO] Campanhas CBO escaladas: {len(campanhas_cbo_escaladas)}")
     log_message(f"[RESUMO] AdSets ABO escalados: {len(adsets_abo_escalados)}")
-    log_message(f"[RESUMO] Total distribuído: R$ {total_distribuido:.2f}")
+    log_message(f"[RESUMO] Total distribuído: R$ {dinheiro.formatar(total_distribuido)}")
     
     sucesso_whatsapp = enviar_mensagem_whatsapp(WHATSAPP_GROUP, mensagem)
     
@@ -569,6 +244,12 @@ def escalar_campanhas():
     log_message("Processo de escala concluído com sucesso!")
     return True
 
+def escalar_campanhas():
+    decisoes = planejar_escala()
+    if decisoes is None:
+        return False
+    return aplicar_escala(decisoes)
+
 def limpar_mensagem_whatsapp(mensagem):
     """
     Remove caracteres especiais e emojis que podem causar problemas no WhatsApp Web
@@ -918,7 +599,7 @@ def enviar_mensagem_whatsapp(grupo, mensagem_original):
         if driver:
             driver.quit()
 
-def run(token, accounts, group, logs, date_range='today', start_date=None, end_date=None, min_profit=None, scale_value=None, abo_accounts=None):
+def run(token, accounts, group, logs, date_range='today', start_date=None, end_date=None, min_profit=None, scale_value=None, abo_accounts=None, modo="executar"):
     """
     Função principal que executa o processo de escala de orçamento
     
@@ -933,6 +614,7 @@ def run(token, accounts, group, logs, date_range='today', start_date=None, end_d
         min_profit (float): Lucro mínimo para considerar escala
         scale_value (float): Valor total para escalar
         abo_accounts (list): Lista de contas que usam ABO
+        modo (str): "executar" calcula e aplica; "planejar" só grava o plano em PLANO_PATH
         
     Returns:
         bool: True se o processo foi concluído com sucesso, False caso contrário
@@ -943,6 +625,8 @@ def run(token, accounts, group, logs, date_range='today', start_date=None, end_d
     AD_ACCOUNTS = accounts if accounts is not None else []
     WHATSAPP_GROUP = group
     logs_list = logs
+    graph_client.configurar_log(log_message)
+    graph_client.iniciar_execucao()
     
     # Definir contas ABO se fornecidas
     if abo_accounts:
@@ -955,14 +639,11 @@ def run(token, accounts, group, logs, date_range='today', start_date=None, end_d
                 log_message(f"Conta ABO {conta_abo} adicionada à lista de processamento")
     
     # Limpar dados de campanhas anteriores
-    global campanhas_completas_data
-    campanhas_completas_data = {}
+    global campanhas_execucao, unidades_ignoradas
+    campanhas_execucao = []
+    unidades_ignoradas = []
     
-    if date_range == 'custom' and start_date and end_date:
-        DATE_PRESET = None
-    else:
-        presets = {'today': 'today', 'yesterday': 'yesterday', 'last7': 'last_7d'}
-        DATE_PRESET = presets.get(date_range, 'today')
+    DATE_PRESET, data_inicio, data_fim = snapshot_campanhas.resolver_periodo(date_range, start_date, end_date)
     
     if min_profit is not None:
         LIMITE_LUCRO = float(min_profit)
@@ -975,62 +656,20 @@ def run(token, accounts, group, logs, date_range='today', start_date=None, end_d
     log_message(f"Contas ABO configuradas: {ABO_ACCOUNTS}")
     
     try:
-        limpar_planilha()
-        todas_campanhas = []
-        
-        # Processar TODAS as contas (incluindo ABO)
-        for ad_account in AD_ACCOUNTS:
-            tipo_conta = "ABO" if ad_account in ABO_ACCOUNTS else "CBO"
-            log_message(f"Processando conta de anúncio {tipo_conta}: {ad_account}")
-            log_message(f"Buscando campanhas para conta {ad_account}...")
-            
-            campaigns_url = f"https://graph.facebook.com/v17.0/{ad_account}/campaigns?fields=id,name,daily_budget,status&access_token={ACCESS_TOKEN}"
-            
-            if date_range == 'custom' and start_date and end_date:
-                insights_url = f"https://graph.facebook.com/v17.0/{ad_account}/insights?fields=campaign_id,campaign_name,spend,action_values&time_range[since]={start_date}&time_range[until]={end_date}&level=campaign&access_token={ACCESS_TOKEN}"
-            else:
-                insights_url = f"https://graph.facebook.com/v17.0/{ad_account}/insights?fields=campaign_id,campaign_name,spend,action_values&date_preset={DATE_PRESET}&level=campaign&access_token={ACCESS_TOKEN}"
-            
-            campaigns = buscar_todos_dados_facebook(campaigns_url)
-            log_message(f"Encontradas {len(campaigns)} campanhas.")
-            
-            insights = buscar_todos_dados_facebook(insights_url)
-            log_message(f"Encontrados {len(insights)} insights.")
-            
-            # Processar campanhas com suporte a ABO
-            campanhas_processadas = processar_dados_campanhas(
-                campaigns, insights, ad_account, 
-                DATE_PRESET if DATE_PRESET else None, 
-                start_date if date_range == 'custom' else None,
-                end_date if date_range == 'custom' else None
-            )
-            
-            log_message(f"Processadas {len(campanhas_processadas)} campanhas ativas.")
-            
-            # Log detalhado para campanhas ABO
-            if ad_account in ABO_ACCOUNTS:
-                campanhas_abo_desta_conta = [c for c in campanhas_processadas if c.get("tipo_campanha") == "ABO"]
-                if campanhas_abo_desta_conta:
-                    for camp in campanhas_abo_desta_conta:
-                        log_message(f"  - Campanha ABO: {camp['nome_campanha']} com {len(camp.get('adsets_info', []))} adsets")
-            
-            todas_campanhas.extend(campanhas_processadas)
-        
-        log_message(f"Total de {len(todas_campanhas)} campanhas ativas encontradas.")
-        
-        # Contar campanhas por tipo
-        campanhas_cbo = [c for c in todas_campanhas if c.get("tipo_campanha") == "CBO"]
-        campanhas_abo = [c for c in todas_campanhas if c.get("tipo_campanha") == "ABO"]
-        log_message(f"Campanhas CBO: {len(campanhas_cbo)}, Campanhas ABO: {len(campanhas_abo)}")
-        
-        # Log detalhado de campanhas ABO
-        if campanhas_abo:
-            total_adsets = sum(len(c.get("adsets_info", [])) for c in campanhas_abo)
-            log_message(f"Total de AdSets em campanhas ABO: {total_adsets}")
+        snapshot, todas_campanhas = operacoes_orcamento.obter_campanhas(
+            ACCESS_TOKEN, AD_ACCOUNTS, ABO_ACCOUNTS, DATE_PRESET, data_inicio, data_fim
+        )
+        campanhas_execucao = todas_campanhas
         
-        salvar_campanhas_excel(todas_campanhas)
+        if modo == "planejar":
+            return salvar_plano(snapshot)
         
-        resultado = escalar_campanhas()
+        try:
+            resultado = escalar_campanhas()
+        finally:
+            # Exportar o resultado uma única vez, já com os novos orçamentos; também se a
+            # execução for interrompida, para registrar as alterações já enviadas
+            operacoes_orcamento.salvar_resultado(SPREADSHEET_PATH, campanhas_execucao, SAIDAS, "escala", snapshot.criado_em)
         return resultado
         
     except Exception as e:
@@ -1039,22 +678,62 @@ def run(token, accounts, group, logs, date_range='today', start_date=None, end_d
         log_message(traceback.format_exc())
         return False
 
-if __name__ == "__main__":
-    limpar_planilha()
-    todas_campanhas = []
+def salvar_plano(snapshot):
+    """Calcula o escalonamento sem alterar nenhum orçamento e grava o plano em PLANO_PATH"""
+    decisoes = planejar_escala()
+    operacoes_orcamento.salvar_plano(
+        PLANO_PATH, "escala", snapshot,
+        {"LIMITE_LUCRO": LIMITE_LUCRO, "VALOR_TOTAL_ESCALA": VALOR_TOTAL_ESCALA},
+        itens_do_plano(decisoes or []),
+        campanhas_execucao
+    )
+    return decisoes is not None
+
+def aplicar_plano(token, group, logs):
+    """
+    Aplica o plano gravado em PLANO_PATH sem coletar nem recalcular (ver
+    operacoes_orcamento.preparar_aplicacao)
     
-    for ad_account in AD_ACCOUNTS:
-        log_message(f"[INFO] Processando conta de anúncio: {ad_account}")
-        campaigns_url = f"https://graph.facebook.com/v17.0/{ad_account}/campaigns?fields=id,name,daily_budget,status&access_token={ACCESS_TOKEN}"
-        insights_url = f"https://graph.facebook.com/v17.0/{ad_account}/insights?fields=campaign_id,campaign_name,spend,action_values&date_preset={DATE_PRESET}&level=campaign&access_token={ACCESS_TOKEN}"
-        
-        campaigns = buscar_todos_dados_facebook(campaigns_url)
-        insights = buscar_todos_dados_facebook(insights_url)
+    Returns:
+        bool: True se o plano foi aplicado, False caso contrário
+    """
+    global ACCESS_TOKEN, WHATSAPP_GROUP, LIMITE_LUCRO, VALOR_TOTAL_ESCALA, logs_list, campanhas_execucao, unidades_ignoradas
+    
+    ACCESS_TOKEN = token
+    WHATSAPP_GROUP = group
+    logs_list = logs
+    graph_client.configurar_log(log_message)
+    graph_client.iniciar_execucao()
+    unidades_ignoradas = []
+    
+    try:
+        aplicacao = operacoes_orcamento.preparar_aplicacao(PLANO_PATH, "escala", ACCESS_TOKEN, unidades_ignoradas)
+        if aplicacao is None:
+            return False
+        plano, campanhas_execucao, pares = aplicacao
+        LIMITE_LUCRO = plano["parametros"]["LIMITE_LUCRO"]
+        VALOR_TOTAL_ESCALA = plano["parametros"]["VALOR_TOTAL_ESCALA"]
         
-        campanhas_processadas = processar_dados_campanhas(
-            campaigns, insights, ad_account, DATE_PRESET
-        )
-        todas_campanhas.extend(campanhas_processadas)
+        decisoes = [
+            (unidade, item["id_objeto"], item["novo_orcamento"], item["novo_orcamento"] - item["orcamento_anterior"])
+            for item, unidade in pares
+        ]
+        try:
+            resultado = aplicar_escala(decisoes)
+        finally:
+            # Exportar o resultado uma única vez, já com os novos orçamentos; também se a
+            # execução for interrompida, para registrar as alterações já enviadas
+            operacoes_orcamento.salvar_resultado(SPREADSHEET_PATH, campanhas_execucao, SAIDAS, "escala", plano["snapshot_em"])
+        return resultado
+    except Exception as e:
+        log_message(f"Erro ao aplicar o plano de escala: {e}")
+        import traceback
+        log_message(traceback.format_exc())
+        return False
+
+if __name__ == "__main__":
+    snapshot, todas_campanhas = operacoes_orcamento.obter_campanhas(ACCESS_TOKEN, AD_ACCOUNTS, ABO_ACCOUNTS, DATE_PRESET)
+    campanhas_execucao = todas_campanhas
     
-    salvar_campanhas_excel(todas_campanhas)
-    escalar_campanhas()
\ No newline at end of file
+    escalar_campanhas()
+    operacoes_orcamento.salvar_resultado(SPREADSHEET_PATH, campanhas_execucao, SAIDAS, "escala", snapshot.criado_em)
@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+import time
+import graph_client
+
+# Estrutura local das contas (campanhas e ad sets ativos: tipo, nomes, ad sets de cada
+# campanha e orçamentos), guardada por id e gravada em disco por conta.
+# A estrutura muda bem menos que os insights: a cada coleta só são pedidos à Graph API
+# os objetos com updated_time posterior à última sincronização. De tempos em tempos
+# (INTERVALO_RECONCILIACAO) a conta é baixada inteira de novo, o que corrige mudanças
+# que não alteram o updated_time (ex.: conta desativada, fim da programação).
+
+DIRETORIO_DISCO = "estrutura_contas"
+INTERVALO_RECONCILIACAO = 6 * 60 * 60  # segundos entre sincronizações completas de uma conta
+MARGEM_SINCRONIZACAO = 120  # segundos de sobreposição entre sincronizações (diferença de relógio)
+LIMITE_ADSETS_EXPANDIDOS = 50  # Ad sets ativos que vêm embutidos em cada campanha; acima disso segue o cursor
+
+# Campos pedidos em cada consulta (nomes vêm das consultas de campanhas e ad sets)
+CAMPOS_ADSETS = ["id", "name", "daily_budget", "status"]
+CAMPOS_CAMPANHAS = [
+    "id", "name", "daily_budget", "status", "updated_time",
+    graph_client.expandir("adsets", CAMPOS_ADSETS, LIMITE_ADSETS_EXPANDIDOS, [graph_client.filtro_ativos()])
+]
+# Na sincronização incremental também vêm os objetos desativados, para retirá-los da estrutura
+CAMPOS_CAMPANHAS_ALTERADAS = CAMPOS_CAMPANHAS + ["effective_status"]
+CAMPOS_ADSETS_ALTERADOS = CAMPOS_ADSETS + ["campaign_id", "effective_status", "updated_time"]
+
+# A estrutura de cada conta fica inteira em memória (só ids, nomes, status e orçamentos, sem
+# insights): a sincronização incremental precisa dela para aplicar as alterações. As campanhas
+# são entregues à coleta uma a uma, sem montar outra lista da conta.
+_estruturas = {}  # conta -> {"sincronizado_em", "reconciliado_em", "campanhas": {id: campanha}}
+_lock = threading.Lock()
+
+def log_message(msg):
+    graph_client.log_message(msg)
+
+def _arquivo(conta):
+    return os.path.join(DIRETORIO_DISCO, f"{conta}.json")
+
+def _carregar(conta):
+    with _lock:
+        if conta in _estruturas:
+            return _estruturas[conta]
+    try:
+        with open(_arquivo(conta), "r", encoding="utf-8") as f:
+            estrutura = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _lock:
+        return _estruturas.setdefault(conta, estrutura)
+
+def _salvar(conta, estrutura):
+    with _lock:
+        _estruturas[conta] = estrutura
+        conteudo = json.dumps(estrutura)
+    try:
+        os.makedirs(DIRETORIO_DISCO, exist_ok=True)
+        caminho = _arquivo(conta)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(conteudo)
+        os.replace(temporario, caminho)
+    except OSError as e:
+        log_message(f"[AVISO] Não foi possível gravar a estrutura da conta {conta} em disco: {e}")
+
+def _ativo(objeto):
+    return objeto.get("effective_status") not in graph_client.STATUS_INATIVOS
+
+def _registro_campanha(campanha):
+    """Campanha da Graph API no formato da estrutura local (ad sets indexados por id)"""
+    registro = {campo: valor for campo, valor in campanha.items() if campo != "adsets"}
+    adsets = campanha.get("adsets", {})
+    registro["adsets"] = {adset["id"]: adset for adset in adsets.get("data", [])}
+    proxima = adsets.get("paging", {}).get("next")
+    if proxima:
+        for pagina in graph_client.iterar_paginas(proxima):
+            registro["adsets"].update((adset["id"], adset) for adset in pagina)
+    return registro
+
+def _formato_graph(registro):
+    """Campanha da estrutura local no formato da consulta de campanhas com ad sets expandidos"""
+    campanha = {campo: valor for campo, valor in registro.items() if campo != "adsets"}
+    campanha["adsets"] = {"data": list(registro["adsets"].values())}
+    return campanha
+
+def _sincronizacao_completa(ad_account, access_token):
+    inicio = time.time()
+    url = graph_client.montar_url(
+        f"{ad_account}/campaigns", access_token, CAMPOS_CAMPANHAS,
+        filtros=[graph_client.filtro_ativos()]
+    )
+    campanhas = {}
+    # As campanhas seguem para o processamento à medida que as páginas chegam; a estrutura
+    # completa da conta é mantida até o fim para ser gravada
+    for pagina in graph_client.iterar_paginas(url):
+        for campanha in pagina:
+            registro = _registro_campanha(campanha)
+            campanhas[registro["id"]] = registro
+            yield _formato_graph(registro)
+
+    _salvar(ad_account, {"sincronizado_em": inicio, "reconciliado_em": inicio, "campanhas": campanhas})
+    log_message(f"Estrutura da conta {ad_account} sincronizada por completo: {len(campanhas)} campanhas")
+
+def _sincronizacao_incremental(ad_account, access_token, estrutura):
+    inicio = time.time()
+    desde = int(estrutura["sincronizado_em"] - MARGEM_SINCRONIZACAO)
+    filtro_alterados = {"field": "updated_time", "operator": "GREATER_THAN", "value": desde}
+    campanhas = dict(estrutura["campanhas"])
+
+    # Campanhas alteradas vêm com todos os seus ad sets ativos, o que cobre campanhas novas e reativadas
+    url_campanhas = graph_client.montar_url(
+        f"{ad_account}/campaigns", access_token, CAMPOS_CAMPANHAS_ALTERADAS, filtros=[filtro_alterados]
+    )
+    campanhas_alteradas = 0
+    for campanha in graph_client.buscar_todos(url_campanhas):
+        campanhas_alteradas += 1
+        if _ativo(campanha):
+            campanhas[campanha["id"]] = _registro_campanha(campanha)
+        else:
+            campanhas.pop(campanha["id"], None)
+
+    url_adsets = graph_client.montar_url(
+        f"{ad_account}/adsets", access_token, CAMPOS_ADSETS_ALTERADOS, filtros=[filtro_alterados]
+    )
+    adsets_alterados = 0
+    for adset in graph_client.buscar_todos(url_adsets):
+        adsets_alterados += 1
+        campanha = campanhas.get(adset.get("campaign_id"))
+        if campanha is None:
+            continue
+        # Registro copiado: a versão anterior da estrutura continua válida até a gravação
+        campanha = campanhas[campanha["id"]] = dict(campanha, adsets=dict(campanha["adsets"]))
+        adsets = campanha["adsets"]
+        if _ativo(adset):
+            adsets[adset["id"]] = {campo: adset[campo] for campo in CAMPOS_ADSETS if campo in adset}
+        else:
+            adsets.pop(adset["id"], None)
+
+    _salvar(ad_account, dict(estrutura, sincronizado_em=inicio, campanhas=campanhas))
+    log_message(f"Estrutura da conta {ad_account} atualizada: {campanhas_alteradas} campanhas e {adsets_alterados} ad sets alterados")
+    for registro in campanhas.values():
+        yield _formato_graph(registro)
+
+def campanhas_da_conta(ad_account, access_token):
+    """
+    Gera as campanhas ativas da conta com seus ad sets ativos, no mesmo formato da consulta
+    de campanhas com ad sets expandidos. Usa a estrutura local quando possível e só busca
+    na Graph API o que mudou desde a última sincronização.
+    """
+    estrutura = _carregar(ad_account)
+    if estrutura is None or time.time() - estrutura.get("reconciliado_em", 0) > INTERVALO_RECONCILIACAO:
+        yield from _sincronizacao_completa(ad_account, access_token)
+    else:
+        yield from _sincronizacao_incremental(ad_account, access_token, estrutura)
+
+def quantidade_campanhas(ad_account, access_token):
+    """
+    Campanhas ativas da conta, pela estrutura local ou, se a conta ainda não foi sincronizada,
+    pelo total informado pela Graph API (summary=total_count) sem baixar as campanhas.
+    None se o total não puder ser obtido.
+    """
+    estrutura = _carregar(ad_account)
+    if estrutura is not None:
+        return len(estrutura["campanhas"])
+    url = graph_client.montar_url(
+        f"{ad_account}/campaigns", access_token, ["id"],
+        filtros=[graph_client.filtro_ativos()], limite=1, summary="total_count"
+    )
+    try:
+        return graph_client.buscar_pagina(url).get("summary", {}).get("total_count")
+    except graph_client.ErroGraphAPI as e:
+        log_message(f"[AVISO] Não foi possível obter o total de campanhas da conta {ad_account}: {e}")
+        return None
+
+def _com_orcamentos(campanha, orcamentos):
+    """Cópia da campanha com os novos orçamentos, ou a própria campanha se nada mudou nela"""
+    adsets_alterados = [id_adset for id_adset in campanha["adsets"] if id_adset in orcamentos]
+    if campanha["id"] not in orcamentos and not adsets_alterados:
+        return campanha
+    copia = dict(campanha, adsets=dict(campanha["adsets"]))
+    if campanha["id"] in orcamentos:
+        copia["daily_budget"] = str(orcamentos[campanha["id"]])
+    for id_adset in adsets_alterados:
+        copia["adsets"][id_adset] = dict(copia["adsets"][id_adset], daily_budget=str(orcamentos[id_adset]))
+    return copia
+
+def registrar_orcamentos(orcamentos):
+    """
+    Aplica na estrutura local os orçamentos alterados pelas operações e grava em disco
+    as contas afetadas
+
+    Args:
+        orcamentos (dict): id do objeto (campanha ou ad set) -> novo daily_budget em centavos
+    """
+    if not orcamentos:
+        return
+    with _lock:
+        estruturas = list(_estruturas.items())
+    for conta, estrutura in estruturas:
+        campanhas = {
+            id_campanha: _com_orcamentos(campanha, orcamentos)
+            for id_campanha, campanha in estrutura["campanhas"].items()
+        }
+        if any(campanhas[id_campanha] is not campanha for id_campanha, campanha in estrutura["campanhas"].items()):
+            _salvar(conta, dict(estrutura, campanhas=campanhas))
+
+def invalidar(conta=None):
+    """Descarta a estrutura local (da conta informada ou de todas); a próxima coleta baixa tudo de novo"""
+    with _lock:
+        for nome in [conta] if conta else list(_estruturas):
+            _estruturas.pop(nome, None)
+    if not os.path.isdir(DIRETORIO_DISCO):
+        return
+    for nome in os.listdir(DIRETORIO_DISCO):
+        if conta and nome != f"{conta}.json":
+            continue
+        try:
+            os.remove(os.path.join(DIRETORIO_DISCO, nome))
+        except OSError:
+            pass
@@ -0,0 +1,249 @@
+import csv
+import os
+import sqlite3
+import time
+import openpyxl
+import dinheiro
+import graph_client
+
+# Exportação do resultado de uma execução (escalar, reduzir ou realocar).
+# Cada saída ("xlsx", "csv", "parquet" ou "sqlite") grava as mesmas linhas: uma por
+# campanha seguida de uma por ad set das campanhas ABO (tipo "ABO AdSet"), com o novo
+# orçamento e a variação aplicada, a operação e o instante do snapshot usado nas decisões.
+# Na planilha, a aba CAMPANHAS mantém só as campanhas, nas colunas de sempre (a soma do
+# orçamento não conta as ABO duas vezes), e os ad sets vão para a aba ADSETS.
+# Colunas novas entram sempre no fim, para não deslocar quem lê as saídas por posição.
+# As linhas são geradas a partir dos registros da execução e vão direto para o arquivo
+# (planilha em modo write-only, CSV linha a linha, Parquet e SQLite em lotes), então
+# o consumo de memória não cresce com o número de campanhas e ad sets.
+
+ABA = "CAMPANHAS"
+ABA_ADSETS = "ADSETS"
+TABELA_SQLITE = "campanhas"
+TIPO_LINHA_ADSET = "ABO AdSet"
+SAIDAS_PADRAO = ["xlsx"]
+TAMANHO_LOTE = 10000  # Linhas por lote nas saídas Parquet e SQLite
+
+# (nome da coluna nos dados, cabeçalho na planilha, tipo)
+COLUNAS = [
+    ("id_conta", "ID da Conta de Anúncio", "texto"),
+    ("id_campanha", "ID da Campanha", "texto"),
+    ("nome", "Nome da Campanha", "texto"),
+    ("tipo", "Tipo", "texto"),
+    ("orcamento_diario", "Orçamento Diário", "real"),
+    ("gasto", "Gasto", "real"),
+    ("valor_conversao", "Valor de Conversões", "real"),
+    ("roas", "ROAS", "real"),
+    ("lucro", "Lucro", "real"),
+    ("novo_orcamento", "Novo Orçamento", "real"),
+    ("classificacao", "Classificação", "texto"),
+    ("detalhes_adsets", "Detalhes AdSets", "texto"),
+    ("variacao_orcamento", "Variação do Orçamento", "real"),
+    ("operacao", "Operação", "texto"),
+    ("snapshot_em", "Snapshot", "texto"),
+]
+INDICE_CLASSIFICACAO = [nome for nome, _, _ in COLUNAS].index("classificacao")
+INDICE_TIPO = [nome for nome, _, _ in COLUNAS].index("tipo")
+
+def colunas_saida(com_classificacao=False):
+    """COLUNAS gravadas em todas as saídas (só a realocação inclui a classificação)"""
+    return [coluna for coluna in COLUNAS if com_classificacao or coluna[0] != "classificacao"]
+
+def colunas(com_classificacao=False):
+    """Cabeçalho das abas da planilha"""
+    return [cabecalho for _, cabecalho, _ in colunas_saida(com_classificacao)]
+
+def _linhas_saida(linhas, com_classificacao=False):
+    """Linhas de linhas_campanhas nas colunas de colunas_saida"""
+    if com_classificacao:
+        return linhas
+    return (linha[:INDICE_CLASSIFICACAO] + linha[INDICE_CLASSIFICACAO + 1:] for linha in linhas)
+
+def formatar_instante(instante):
+    """Instante (time.time()) no formato gravado nas saídas"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(instante)) if instante else None
+
+def caminho_saida(caminho_base, saida):
+    """Arquivo da saída ao lado da planilha da operação (ex.: campanhas_lucro.csv)"""
+    return f"{os.path.splitext(caminho_base)[0]}.{saida}"
+
+def _reais_ou_vazio(valor_centavos):
+    return dinheiro.reais(valor_centavos) if valor_centavos is not None else None
+
+def _variacao(orcamento, novo_orcamento):
+    return dinheiro.reais(novo_orcamento - orcamento) if novo_orcamento is not None else None
+
+def linhas_campanhas(campanhas, operacao=None, snapshot_em=None):
+    """
+    Gera as linhas das saídas, na ordem de COLUNAS: cada campanha seguida de uma linha
+    de detalhe por ad set (campanhas ABO). Novo orçamento e variação só são preenchidos
+    nas campanhas e ad sets cujo orçamento foi alterado.
+    """
+    snapshot_em = formatar_instante(snapshot_em)
+    for campanha in campanhas:
+        yield (
+            campanha.id_conta,
+            campanha.id_campanha,
+            campanha.nome_campanha,
+            campanha.tipo_campanha,
+            dinheiro.reais(campanha.orcamento_diario),
+            dinheiro.reais(campanha.gasto),
+            dinheiro.reais(campanha.valor_conversao),
+            float(campanha.roas),
+            dinheiro.reais(campanha.lucro),
+            _reais_ou_vazio(campanha.novo_orcamento),
+            campanha.classificacao,
+            campanha.detalhes_adsets,
+            _variacao(campanha.orcamento_diario, campanha.novo_orcamento),
+            operacao,
+            snapshot_em
+        )
+
+        for adset in campanha.adsets_info or ():
+            yield (
+                campanha.id_conta,
+                campanha.id_campanha,
+                f"{campanha.nome_campanha} - {adset.adset_name}",
+                TIPO_LINHA_ADSET,
+                dinheiro.reais(adset.daily_budget),
+                dinheiro.reais(adset.gasto),
+                dinheiro.reais(adset.valor_conversao),
+                round(adset.valor_conversao / adset.gasto, 2) if adset.gasto > 0 else 0.0,
+                dinheiro.reais(adset.lucro),
+                _reais_ou_vazio(adset.novo_orcamento),
+                None,
+                f"AdSet {adset.adset_id}",
+                _variacao(adset.daily_budget, adset.novo_orcamento),
+                operacao,
+                snapshot_em
+            )
+
+def _lotes(linhas, tamanho=TAMANHO_LOTE):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def exportar_xlsx(caminho, linhas, com_classificacao=False):
+    """
+    Grava a planilha em modo streaming: campanhas na aba CAMPANHAS e ad sets das ABO na
+    aba ADSETS. O arquivo é escrito ao lado e só substitui o anterior quando completo.
+
+    Returns:
+        int: quantidade de linhas gravadas nas duas abas (sem os cabeçalhos)
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(ABA)
+    sheet_adsets = workbook.create_sheet(ABA_ADSETS)
+    sheet.append(colunas(com_classificacao))
+    sheet_adsets.append(colunas(com_classificacao))
+    quantidade = 0
+    for linha in _linhas_saida(linhas, com_classificacao):
+        destino = sheet_adsets if linha[INDICE_TIPO] == TIPO_LINHA_ADSET else sheet
+        destino.append(linha)
+        quantidade += 1
+
+    temporario = f"{caminho}.tmp"
+    workbook.save(temporario)
+    os.replace(temporario, caminho)
+    return quantidade
+
+def exportar_csv(caminho, linhas, com_classificacao=False):
+    """CSV em UTF-8 com os nomes de COLUNAS no cabeçalho, gravado linha a linha"""
+    temporario = f"{caminho}.tmp"
+    quantidade = 0
+    with open(temporario, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow([nome for nome, _, _ in colunas_saida(com_classificacao)])
+        for linha in _linhas_saida(linhas, com_classificacao):
+            escritor.writerow(linha)
+            quantidade += 1
+    os.replace(temporario, caminho)
+    return quantidade
+
+def exportar_parquet(caminho, linhas, com_classificacao=False):
+    """Parquet com esquema fixo, gravado em lotes (requer pyarrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("a saída parquet requer o pacote pyarrow (pip install pyarrow)")
+
+    tipos = {"texto": pa.string(), "real": pa.float64()}
+    esquema = pa.schema([(nome, tipos[tipo]) for nome, _, tipo in colunas_saida(com_classificacao)])
+    temporario = f"{caminho}.tmp"
+    quantidade = 0
+    with pq.ParquetWriter(temporario, esquema) as escritor:
+        for lote in _lotes(_linhas_saida(linhas, com_classificacao)):
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*lote), esquema)],
+                schema=esquema
+            ))
+            quantidade += len(lote)
+        if quantidade == 0:
+            escritor.write_table(esquema.empty_table())
+    os.replace(temporario, caminho)
+    return quantidade
+
+def exportar_sqlite(caminho, linhas, com_classificacao=False):
+    """
+    Tabela campanhas num arquivo SQLite. A tabela da execução anterior é recriada
+    na mesma transação (com as colunas atuais), então quem lê o arquivo vê uma execução
+    completa ou a anterior.
+    """
+    tipos = {"texto": "TEXT", "real": "REAL"}
+    colunas_tabela = colunas_saida(com_classificacao)
+    definicao = ", ".join(f"{nome} {tipos[tipo]}" for nome, _, tipo in colunas_tabela)
+    marcadores = ", ".join("?" for _ in colunas_tabela)
+    quantidade = 0
+    conexao = sqlite3.connect(caminho)
+    try:
+        with conexao:
+            conexao.execute(f"DROP TABLE IF EXISTS {TABELA_SQLITE}")
+            conexao.execute(f"CREATE TABLE {TABELA_SQLITE} ({definicao})")
+            for lote in _lotes(_linhas_saida(linhas, com_classificacao)):
+                conexao.executemany(f"INSERT INTO {TABELA_SQLITE} VALUES ({marcadores})", lote)
+                quantidade += len(lote)
+    finally:
+        conexao.close()
+    return quantidade
+
+SAIDAS = {
+    "xlsx": exportar_xlsx,
+    "csv": exportar_csv,
+    "parquet": exportar_parquet,
+    "sqlite": exportar_sqlite,
+}
+
+def exportar(caminho_base, campanhas, saidas=None, operacao=None, snapshot_em=None, com_classificacao=False):
+    """
+    Grava o resultado da execução em cada saída escolhida. Uma saída que falhar é
+    registrada no log e não impede as demais.
+
+    Args:
+        caminho_base (str): planilha da operação; as outras saídas trocam só a extensão
+        saidas (list): nomes em SAIDAS (padrão: só a planilha)
+        operacao (str): operação gravada em cada linha
+        snapshot_em (float): instante de coleta do snapshot usado nas decisões
+
+    Returns:
+        dict: caminho -> quantidade de linhas, das saídas gravadas com sucesso
+    """
+    gravadas = {}
+    for saida in saidas or SAIDAS_PADRAO:
+        exportador = SAIDAS.get(saida)
+        if exportador is None:
+            graph_client.log_message(f"[ERRO] Saída desconhecida: {saida} (disponíveis: {', '.join(SAIDAS)})")
+            continue
+        caminho = caminho_saida(caminho_base, saida)
+        try:
+            gravadas[caminho] = exportador(
+                caminho, linhas_campanhas(campanhas, operacao, snapshot_em), com_classificacao
+            )
+        except Exception as e:
+            graph_client.log_message(f"[ERRO] Falha ao salvar {caminho}: {e}")
+    return gravadas
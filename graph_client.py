@@ -0,0 +1,505 @@
+import atexit
+import json
+import random
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+import requests
+from requests.adapters import HTTPAdapter
+import limite_uso
+
+# Cliente HTTP compartilhado pelas operações (escala, redução e realocação).
+# Mantém uma única sessão com pool de conexões keep-alive para graph.facebook.com,
+# evitando um novo handshake TCP+TLS a cada página ou atualização de orçamento.
+
+GRAPH_API_URL = "https://graph.facebook.com/v17.0"
+
+TIMEOUT_CONEXAO = 10  # segundos para abrir a conexão
+TIMEOUT_LEITURA = 60  # segundos aguardando a resposta
+POOL_HOSTS = 4  # quantidade de hosts distintos mantidos em cache
+MAX_CONEXOES_POR_HOST = 16  # limite de conexões simultâneas por host
+TAMANHO_MAXIMO_LOTE = 50  # limite de requisições por chamada ao endpoint batch
+LIMITE_PAGINA = 1000  # registros pedidos por página
+LIMITE_PAGINA_MINIMO = 25  # menor página tentada quando a Graph API pede menos dados
+STATUS_INATIVOS = ["PAUSED", "DELETED", "ARCHIVED"]  # excluídos no servidor pelo filtro de effective_status
+TAMANHO_MAXIMO_IDS = 50  # objetos por leitura GET /?ids=
+MAX_PAGINAS_ANTECIPADAS = 8  # páginas seguintes buscadas em segundo plano ao mesmo tempo (todas as consultas)
+MAX_MUTACOES_POR_CONTA = 4  # lotes de atualização de orçamento enviados ao mesmo tempo por conta
+
+# Política de novas tentativas para falhas transitórias
+MAX_RETENTATIVAS = 4  # novas tentativas por chamada, além da primeira
+ATRASO_BASE = 1.0  # segundos; dobra a cada nova tentativa
+ATRASO_MAXIMO = 30.0  # teto do atraso entre tentativas
+ORCAMENTO_RETENTATIVAS = 100  # total de novas tentativas permitidas por execução
+CODIGOS_TRANSITORIOS = {1, 2}  # erro desconhecido / serviço temporariamente indisponível
+SUBCODIGOS_VOLUME_DADOS = {1487534}  # consulta grande demais para o endpoint síncrono
+
+class ErroGraphAPI(Exception):
+    """Falha definitiva de uma chamada à Graph API (após as novas tentativas)"""
+    def __init__(self, erro):
+        self.erro = erro if isinstance(erro, dict) else {"message": str(erro)}
+        self.codigo = self.erro.get("code")
+        super().__init__(self.erro.get("message", "Erro desconhecido"))
+
+_sessao = None
+_sessao_lock = threading.Lock()
+
+_executor_paginas = None
+
+_retentativas_restantes = ORCAMENTO_RETENTATIVAS
+_retentativas_lock = threading.Lock()
+
+# Função de log usada pelos módulos compartilhados; cada operação registra a sua em run()
+_funcao_log = logging.info
+
+def log_message(msg):
+    _funcao_log(msg)
+
+def criar_sessao():
+    """Cria uma sessão com pool de conexões limitado por host"""
+    sessao = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_HOSTS,
+        pool_maxsize=MAX_CONEXOES_POR_HOST,
+        pool_block=True  # Aguarda uma conexão livre ao invés de abrir conexões extras
+    )
+    sessao.mount("https://", adapter)
+    sessao.mount("http://", adapter)
+    return sessao
+
+def obter_sessao():
+    """Retorna a sessão compartilhada, criando-a na primeira chamada"""
+    global _sessao
+    if _sessao is None:
+        with _sessao_lock:
+            if _sessao is None:
+                _sessao = criar_sessao()
+    return _sessao
+
+def fechar_sessao():
+    """Fecha a sessão compartilhada e libera as conexões do pool"""
+    global _sessao
+    with _sessao_lock:
+        if _sessao is not None:
+            _sessao.close()
+            _sessao = None
+
+# Libera as conexões do pool ao encerrar o processo (app ou operação executada direto)
+atexit.register(fechar_sessao)
+
+def configurar_log(funcao):
+    """Define a função de log usada pelos módulos compartilhados (cada operação passa a sua)"""
+    global _funcao_log
+    _funcao_log = funcao
+    limite_uso.log_message = funcao
+
+def iniciar_execucao(orcamento_retentativas=None):
+    """Renova o orçamento de novas tentativas no início de uma execução"""
+    global _retentativas_restantes
+    with _retentativas_lock:
+        _retentativas_restantes = orcamento_retentativas if orcamento_retentativas is not None else ORCAMENTO_RETENTATIVAS
+
+def _consumir_retentativa():
+    global _retentativas_restantes
+    with _retentativas_lock:
+        if _retentativas_restantes <= 0:
+            return False
+        _retentativas_restantes -= 1
+        return True
+
+def _pode_tentar_novamente(tentativa):
+    if tentativa >= MAX_RETENTATIVAS:
+        return False
+    if not _consumir_retentativa():
+        log_message("[AVISO] Orçamento de novas tentativas da execução esgotado")
+        return False
+    return True
+
+def aguardar_backoff(tentativa):
+    """Backoff exponencial com jitter completo: espera aleatória entre 0 e ATRASO_BASE * 2^tentativa"""
+    time.sleep(random.uniform(0, min(ATRASO_MAXIMO, ATRASO_BASE * (2 ** tentativa))))
+
+def erro_volume_dados(erro):
+    """Indica se a Graph API recusou a consulta pelo volume de dados ("reduce the amount of data")"""
+    if not isinstance(erro, dict):
+        return False
+    return (
+        erro.get("error_subcode") in SUBCODIGOS_VOLUME_DADOS
+        or "reduce the amount of data" in str(erro.get("message", "")).lower()
+    )
+
+def erro_transitorio(erro):
+    """Indica se um objeto de erro da Graph API representa uma falha transitória"""
+    if not isinstance(erro, dict) or erro_volume_dados(erro):
+        # Repetir a mesma consulta grande não adianta; quem chamou deve reduzir o volume
+        return False
+    codigo = erro.get("code")
+    return (
+        bool(erro.get("is_transient"))
+        or codigo in CODIGOS_TRANSITORIOS
+        or codigo in limite_uso.CODIGOS_LIMITE
+    )
+
+def falha_transitoria(response=None, excecao=None):
+    """
+    Classifica uma falha como transitória (vale tentar novamente) ou definitiva.
+    Erros de rede, respostas 5xx/429, códigos de limite de uso e erros marcados
+    com is_transient são transitórios; os demais (token, permissão, parâmetro) não.
+    """
+    if excecao is not None:
+        return isinstance(excecao, (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError
+        ))
+    if response is None:
+        return False
+    try:
+        dados = response.json()
+    except ValueError:
+        dados = None
+    erro = dados.get("error") if isinstance(dados, dict) else None
+    if erro_volume_dados(erro):
+        return False
+    if response.status_code >= 500 or response.status_code == 429:
+        return True
+    return erro_transitorio(erro)
+
+def _enviar(enviar, url, conta):
+    """
+    Envia a requisição passando pelo agendador de uso e pela política de novas tentativas:
+    aguarda folga da conta antes de cada chamada e repete falhas transitórias com
+    backoff exponencial, enquanto houver orçamento de novas tentativas na execução
+    """
+    conta = conta or limite_uso.identificar_conta(url)
+    tentativa = 0
+    while True:
+        limite_uso.aguardar_vez(conta)
+        try:
+            response = enviar()
+        except requests.exceptions.RequestException as e:
+            if not falha_transitoria(excecao=e) or not _pode_tentar_novamente(tentativa):
+                raise
+            log_message(f"[AVISO] Falha de rede na Graph API ({e}). Nova tentativa {tentativa + 1}/{MAX_RETENTATIVAS}")
+            aguardar_backoff(tentativa)
+            tentativa += 1
+            continue
+        
+        limitado = limite_uso.registrar_resposta(response, conta)
+        if not falha_transitoria(response=response) or not _pode_tentar_novamente(tentativa):
+            return response
+        log_message(f"[AVISO] Falha transitória na Graph API (HTTP {response.status_code}). Nova tentativa {tentativa + 1}/{MAX_RETENTATIVAS}")
+        if not limitado:
+            # Em limite de uso a pausa já é aplicada pelo agendador antes da próxima chamada
+            aguardar_backoff(tentativa)
+        tentativa += 1
+
+def get(url, params=None, timeout=None, conta=None):
+    """GET na Graph API usando a sessão compartilhada"""
+    return _enviar(
+        lambda: obter_sessao().get(
+            url,
+            params=params,
+            timeout=timeout or (TIMEOUT_CONEXAO, TIMEOUT_LEITURA)
+        ),
+        url, conta
+    )
+
+def post(url, data=None, timeout=None, conta=None):
+    """POST na Graph API usando a sessão compartilhada"""
+    return _enviar(
+        lambda: obter_sessao().post(
+            url,
+            data=data,
+            timeout=timeout or (TIMEOUT_CONEXAO, TIMEOUT_LEITURA)
+        ),
+        url, conta
+    )
+
+def filtro_ativos(campo="effective_status"):
+    """Filtro da Graph API que descarta no servidor objetos pausados, excluídos ou arquivados"""
+    return {"field": campo, "operator": "NOT_IN", "value": STATUS_INATIVOS}
+
+def expandir(conexao, campos, limite=None, filtros=None):
+    """
+    Campo com expansão de uma conexão (ex.: adsets.limit(50){id,name}), para que os
+    objetos filhos venham na mesma consulta do objeto pai
+    """
+    modificadores = ""
+    if limite:
+        modificadores += f".limit({limite})"
+    if filtros:
+        modificadores += f".filtering({json.dumps(filtros, separators=(',', ':'))})"
+    return f"{conexao}{modificadores}{{{','.join(campos)}}}"
+
+def montar_url(caminho, access_token, campos, filtros=None, limite=LIMITE_PAGINA, **parametros):
+    """
+    Monta a URL de uma consulta da Graph API pedindo apenas os campos necessários
+    
+    Args:
+        caminho (str): caminho relativo à versão da API (ex.: "act_123/campaigns")
+        access_token (str): token da Graph API
+        campos (list): campos retornados
+        filtros (list): filtros aplicados no servidor (parâmetro filtering)
+        limite (int): registros por página
+        parametros: demais parâmetros da consulta
+    """
+    consulta = {"fields": ",".join(campos)}
+    if filtros:
+        consulta["filtering"] = json.dumps(filtros, separators=(",", ":"))
+    if limite:
+        consulta["limit"] = limite
+    consulta.update(parametros)
+    consulta["access_token"] = access_token
+    return f"{GRAPH_API_URL}/{caminho}?{urlencode(consulta)}"
+
+def _reduzir_pagina(url, params=None):
+    """Retorna a URL com metade do limit atual, ou None se a página já estiver no mínimo"""
+    partes = urlsplit(url)
+    consulta = dict(parse_qsl(partes.query, keep_blank_values=True))
+    consulta.update({nome: str(valor) for nome, valor in (params or {}).items()})
+    try:
+        limite = int(consulta.get("limit", LIMITE_PAGINA))
+    except ValueError:
+        limite = LIMITE_PAGINA
+    if limite <= LIMITE_PAGINA_MINIMO:
+        return None
+    consulta["limit"] = max(LIMITE_PAGINA_MINIMO, limite // 2)
+    return urlunsplit(partes._replace(query=urlencode(consulta)))
+
+def _obter_executor_paginas():
+    global _executor_paginas
+    if _executor_paginas is None:
+        with _sessao_lock:
+            if _executor_paginas is None:
+                _executor_paginas = ThreadPoolExecutor(max_workers=MAX_PAGINAS_ANTECIPADAS, thread_name_prefix="pagina")
+    return _executor_paginas
+
+def buscar_pagina(url, params=None):
+    """
+    Busca uma página da Graph API, levantando ErroGraphAPI se ela falhar após as novas tentativas.
+    Se a Graph API pedir menos dados, a mesma página é pedida de novo com um limit menor.
+    """
+    while True:
+        try:
+            dados = get(url, params=params).json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise ErroGraphAPI({"message": f"Falha ao buscar dados do Facebook: {e}"})
+        if "error" not in dados:
+            return dados
+        
+        url_reduzida = _reduzir_pagina(url, params) if erro_volume_dados(dados["error"]) else None
+        if not url_reduzida:
+            raise ErroGraphAPI(dados["error"])
+        log_message("[AVISO] Graph API pediu menos dados. Repetindo a página com metade dos registros")
+        url, params = url_reduzida, None
+
+def iterar_paginas(url, params=None):
+    """
+    Gera os registros de cada página de uma consulta assim que ela chega.
+    Ao receber uma página, a seguinte (paging.next) já é pedida em segundo plano,
+    de modo que a rede trabalha enquanto quem consome processa a página atual.
+    """
+    pendente = _obter_executor_paginas().submit(buscar_pagina, url, params)
+    while pendente is not None:
+        dados = pendente.result()
+        proxima = dados.get("paging", {}).get("next")
+        # a URL de "next" já traz todos os parâmetros
+        pendente = _obter_executor_paginas().submit(buscar_pagina, proxima) if proxima else None
+        yield dados.get("data", [])
+
+def buscar_todos(url, params=None):
+    """
+    Percorre todas as páginas de uma consulta da Graph API e retorna os registros.
+    Levanta ErroGraphAPI se alguma página falhar após as novas tentativas.
+    """
+    todos_dados = []
+    for pagina in iterar_paginas(url, params):
+        todos_dados.extend(pagina)
+    return todos_dados
+
+def _ler_lote_objetos(lote, access_token, campos):
+    """
+    Lê um lote de GET /?ids=. A Graph API recusa o lote inteiro se um dos ids não existir
+    mais ou não puder ser lido; nesse caso o lote é dividido ao meio até isolar os ids
+    recusados, que ficam de fora
+    """
+    try:
+        return buscar_pagina(f"{GRAPH_API_URL}/", {
+            "ids": ",".join(lote),
+            "fields": ",".join(campos),
+            "access_token": access_token
+        })
+    except ErroGraphAPI as e:
+        # Falhas de rede ou de limite de uso não dependem dos ids: dividir o lote não adianta
+        if len(lote) == 1 or e.codigo is None or erro_transitorio(e.erro):
+            log_message(f"[AVISO] Falha ao ler {len(lote)} objetos da Graph API ({', '.join(lote)}): {e}")
+            return {}
+        meio = len(lote) // 2
+        objetos = _ler_lote_objetos(lote[:meio], access_token, campos)
+        objetos.update(_ler_lote_objetos(lote[meio:], access_token, campos))
+        return objetos
+
+def ler_objetos(ids, access_token, campos):
+    """
+    Lê campos de vários objetos com GET /?ids=a,b,c, em lotes de TAMANHO_MAXIMO_IDS
+    enviados em paralelo
+    
+    Returns:
+        dict: id -> objeto lido. Objetos que não puderam ser lidos ficam de fora.
+    """
+    ids = list(dict.fromkeys(str(id_objeto) for id_objeto in ids))
+    lotes = [ids[inicio:inicio + TAMANHO_MAXIMO_IDS] for inicio in range(0, len(ids), TAMANHO_MAXIMO_IDS)]
+    pendentes = [
+        _obter_executor_paginas().submit(_ler_lote_objetos, lote, access_token, campos)
+        for lote in lotes
+    ]
+    
+    objetos = {}
+    for pendente in pendentes:
+        objetos.update(pendente.result())
+    return objetos
+
+def obter_uso_atual():
+    """Uso conhecido da Graph API por aplicativo/conta, para exibição no dashboard"""
+    return limite_uso.obter_uso_atual()
+
+def executar_lote(requisicoes, access_token, conta=None):
+    """
+    Envia até TAMANHO_MAXIMO_LOTE requisições em uma única chamada ao endpoint batch
+    
+    Args:
+        requisicoes (list): dicts no formato do batch ({"method", "relative_url", "body"})
+        access_token (str): token usado em todas as requisições do lote
+        conta (str): conta de anúncio das requisições, usada no controle de uso
+        
+    Returns:
+        list: corpo decodificado de cada sub-resposta, na mesma ordem das requisições.
+              Sub-requisições não executadas retornam um dict com a chave "error".
+    """
+    response = post(GRAPH_API_URL, data={
+        "access_token": access_token,
+        "batch": json.dumps(requisicoes),
+        "include_headers": "false"
+    }, conta=conta)
+    resultado = response.json()
+    
+    if isinstance(resultado, dict):
+        # Falha do lote inteiro (token inválido, limite atingido, etc.)
+        erro = resultado.get("error", {"message": "Resposta inesperada do endpoint batch"})
+        return [{"error": erro} for _ in requisicoes]
+    
+    respostas = []
+    for item in resultado:
+        if item is None:
+            respostas.append({"error": {"message": "Requisição não executada no lote", "is_transient": True}})
+            continue
+        try:
+            corpo = json.loads(item.get("body") or "{}")
+        except ValueError:
+            corpo = {"error": {"message": item.get("body")}}
+        if not isinstance(corpo, dict):
+            corpo = {"error": {"message": str(corpo)}}
+        respostas.append(corpo)
+    
+    # Garante uma resposta por requisição mesmo que o lote volte incompleto
+    while len(respostas) < len(requisicoes):
+        respostas.append({"error": {"message": "Requisição sem resposta no lote", "is_transient": True}})
+    return respostas
+
+def executar_em_lotes(requisicoes, access_token, conta=None):
+    """
+    Divide as requisições em lotes de TAMANHO_MAXIMO_LOTE e retorna as respostas na mesma ordem.
+    Sub-requisições com falha transitória são reenviadas (com backoff) em um novo lote;
+    uma falha de rede em um lote só marca como erro as requisições daquele lote.
+    """
+    respostas = [None] * len(requisicoes)
+    pendentes = list(range(len(requisicoes)))
+    tentativa = 0
+    
+    while pendentes:
+        for inicio in range(0, len(pendentes), TAMANHO_MAXIMO_LOTE):
+            indices = pendentes[inicio:inicio + TAMANHO_MAXIMO_LOTE]
+            lote = [requisicoes[i] for i in indices]
+            try:
+                resultado = executar_lote(lote, access_token, conta)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                resultado = [{"error": {"message": f"Falha na requisição em lote: {e}"}} for _ in lote]
+            for i, corpo in zip(indices, resultado):
+                respostas[i] = corpo
+        
+        transitorias = [i for i in pendentes if erro_transitorio(respostas[i].get("error"))]
+        if not transitorias or not _pode_tentar_novamente(tentativa):
+            break
+        log_message(f"[AVISO] {len(transitorias)} atualizações com falha transitória. Nova tentativa {tentativa + 1}/{MAX_RETENTATIVAS}")
+        aguardar_backoff(tentativa)
+        pendentes = transitorias
+        tentativa += 1
+    
+    return respostas
+
+def _rodadas_por_objeto(requisicoes):
+    """
+    Separa as requisições em rodadas: a n-ésima escrita de cada objeto vai para a
+    rodada n, então escritas no mesmo objeto nunca são enviadas ao mesmo tempo
+
+    Returns:
+        list: listas de índices das requisições, uma por rodada, na ordem recebida
+    """
+    escritas = {}
+    rodadas = []
+    for indice, requisicao in enumerate(requisicoes):
+        id_objeto = str(requisicao["relative_url"]).split("?")[0]
+        rodada = escritas.get(id_objeto, 0)
+        escritas[id_objeto] = rodada + 1
+        if rodada == len(rodadas):
+            rodadas.append([])
+        rodadas[rodada].append(indice)
+    return rodadas
+
+def executar_mutacoes(requisicoes, access_token, contas, max_por_conta=MAX_MUTACOES_POR_CONTA):
+    """
+    Envia atualizações pelo endpoint batch em paralelo, com no máximo max_por_conta
+    lotes simultâneos por conta. Cada lote leva requisições de uma única conta, o que
+    também deixa o agendador de uso controlar as atualizações por conta. Escritas no
+    mesmo objeto são enviadas uma depois da outra, na ordem recebida.
+
+    Args:
+        requisicoes (list): dicts no formato do batch ({"method", "relative_url", "body"})
+        contas (list): conta de anúncio de cada requisição, na mesma ordem
+
+    Returns:
+        list: corpo decodificado de cada sub-resposta, na mesma ordem das requisições
+    """
+    respostas = [None] * len(requisicoes)
+    max_por_conta = max(1, max_por_conta)
+
+    def enviar_fila(conta, fila):
+        while True:
+            try:
+                indices = fila.popleft()
+            except IndexError:
+                return
+            resultado = executar_em_lotes([requisicoes[i] for i in indices], access_token, conta)
+            for i, corpo in zip(indices, resultado):
+                respostas[i] = corpo
+
+    for rodada in _rodadas_por_objeto(requisicoes):
+        por_conta = {}
+        for indice in rodada:
+            por_conta.setdefault(contas[indice], []).append(indice)
+
+        # Uma fila de lotes por conta, consumida por até max_por_conta envios simultâneos
+        tarefas = []
+        for conta, indices in por_conta.items():
+            fila = deque(indices[inicio:inicio + TAMANHO_MAXIMO_LOTE] for inicio in range(0, len(indices), TAMANHO_MAXIMO_LOTE))
+            tarefas.extend((conta, fila) for _ in range(min(max_por_conta, len(fila))))
+
+        with ThreadPoolExecutor(max_workers=min(MAX_CONEXOES_POR_HOST, len(tarefas)), thread_name_prefix="mutacao") as executor:
+            for pendente in [executor.submit(enviar_fila, conta, fila) for conta, fila in tarefas]:
+                pendente.result()
+
+    return respostas
@@ -0,0 +1,165 @@
+import sqlite3
+import time
+import registros
+import graph_client
+from exportacao import formatar_instante
+
+# Histórico das execuções num arquivo SQLite: cada execução (escalar, reduzir ou realocar)
+# acrescenta uma linha por unidade de orçamento (campanha CBO ou ad set ABO) com o
+# orçamento antes e depois da execução, gasto, valor de conversões e lucro, todos em
+# centavos. Os índices por unidade e por conta, ambos seguidos do instante, deixam
+# consultas como "como evoluiu o orçamento deste ad set na semana" em milissegundos.
+#
+# Manutenção a cada registro:
+# - compactação: linhas com mais de COMPACTAR_APOS_DIAS_PADRAO dias ficam reduzidas à
+#   última de cada unidade, operação e dia;
+# - retenção: linhas com mais de RETENCAO_DIAS_PADRAO dias são apagadas;
+# - as páginas liberadas voltam ao sistema (auto_vacuum incremental).
+
+CAMINHO_PADRAO = "historico_execucoes.sqlite"
+RETENCAO_DIAS_PADRAO = 90
+COMPACTAR_APOS_DIAS_PADRAO = 14
+TIMEOUT_CONEXAO = 30  # segundos esperando outra operação terminar de gravar
+
+ESQUEMA = [
+    """CREATE TABLE IF NOT EXISTS unidades (
+        id INTEGER PRIMARY KEY,
+        executado_em TEXT NOT NULL,
+        snapshot_em TEXT,
+        operacao TEXT NOT NULL,
+        id_conta TEXT NOT NULL,
+        id_campanha TEXT NOT NULL,
+        id_unidade TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        nome TEXT,
+        orcamento_anterior INTEGER NOT NULL,
+        orcamento_novo INTEGER NOT NULL,
+        gasto INTEGER NOT NULL,
+        valor_conversao INTEGER NOT NULL,
+        lucro INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_unidades_unidade ON unidades (id_unidade, executado_em)",
+    "CREATE INDEX IF NOT EXISTS idx_unidades_conta ON unidades (id_conta, executado_em)",
+    "CREATE INDEX IF NOT EXISTS idx_unidades_executado ON unidades (executado_em)",
+]
+
+def conectar(caminho=CAMINHO_PADRAO):
+    """Abre o histórico, criando o arquivo, a tabela e os índices se preciso"""
+    conexao = sqlite3.connect(caminho, timeout=TIMEOUT_CONEXAO)
+    conexao.row_factory = sqlite3.Row
+    # Só tem efeito na criação do arquivo; depois disso o modo fica gravado nele
+    conexao.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    with conexao:
+        for comando in ESQUEMA:
+            conexao.execute(comando)
+    return conexao
+
+def linhas_unidades(campanhas, operacao, executado_em, snapshot_em):
+    """Uma linha por unidade de orçamento das campanhas da execução"""
+    for campanha in campanhas:
+        for unidade in registros.unidades_da_campanha(campanha):
+            novo_orcamento = (unidade.adset_info or unidade.campanha_info).novo_orcamento
+            yield (
+                executado_em,
+                snapshot_em,
+                operacao,
+                campanha.id_conta,
+                campanha.id_campanha,
+                str(unidade.id_objeto),
+                unidade.tipo,
+                unidade.nome,
+                unidade.orcamento_atual,
+                unidade.orcamento_atual if novo_orcamento is None else novo_orcamento,
+                unidade.gasto,
+                unidade.valor_conversao,
+                unidade.valor_conversao - unidade.gasto
+            )
+
+def manter(conexao, retencao_dias=RETENCAO_DIAS_PADRAO, compactar_apos_dias=COMPACTAR_APOS_DIAS_PADRAO):
+    """
+    Aplica retenção e compactação (ver o cabeçalho do módulo)
+
+    Returns:
+        int: linhas apagadas
+    """
+    agora = time.time()
+    limite_retencao = formatar_instante(agora - retencao_dias * 86400)
+    limite_compactacao = formatar_instante(agora - compactar_apos_dias * 86400)
+    with conexao:
+        apagadas = conexao.execute(
+            "DELETE FROM unidades WHERE executado_em < ?", (limite_retencao,)
+        ).rowcount
+        apagadas += conexao.execute(
+            """DELETE FROM unidades WHERE executado_em < ? AND id NOT IN (
+                SELECT MAX(id) FROM unidades WHERE executado_em < ?
+                GROUP BY id_unidade, operacao, substr(executado_em, 1, 10)
+            )""",
+            (limite_compactacao, limite_compactacao)
+        ).rowcount
+    if apagadas:
+        conexao.execute("PRAGMA incremental_vacuum")
+    return apagadas
+
+def registrar(campanhas, operacao, snapshot_em=None, caminho=CAMINHO_PADRAO,
+              retencao_dias=RETENCAO_DIAS_PADRAO, compactar_apos_dias=COMPACTAR_APOS_DIAS_PADRAO):
+    """
+    Acrescenta ao histórico as unidades da execução e faz a manutenção do arquivo.
+    Uma falha é registrada no log e não interrompe a operação.
+
+    Args:
+        campanhas (list): registros.Campanha da execução, com os novos orçamentos
+        operacao (str): "escala", "reducao" ou "realocacao"
+        snapshot_em (float): instante de coleta do snapshot usado nas decisões
+
+    Returns:
+        int: unidades registradas
+    """
+    try:
+        conexao = conectar(caminho)
+        try:
+            with conexao:
+                quantidade = conexao.executemany(
+                    "INSERT INTO unidades (executado_em, snapshot_em, operacao, id_conta, id_campanha, id_unidade, "
+                    "tipo, nome, orcamento_anterior, orcamento_novo, gasto, valor_conversao, lucro) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    linhas_unidades(campanhas, operacao, formatar_instante(time.time()), formatar_instante(snapshot_em))
+                ).rowcount
+            apagadas = manter(conexao, retencao_dias, compactar_apos_dias)
+        finally:
+            conexao.close()
+    except Exception as e:
+        graph_client.log_message(f"[ERRO] Falha ao registrar o histórico em {caminho}: {e}")
+        return 0
+
+    graph_client.log_message(
+        f"Histórico: {quantidade} unidades registradas em {caminho}"
+        + (f" ({apagadas} linhas antigas removidas)" if apagadas else "")
+    )
+    return quantidade
+
+def evolucao_unidade(id_unidade, desde=None, caminho=CAMINHO_PADRAO):
+    """
+    Linhas de uma unidade (id da campanha CBO ou do ad set) em ordem cronológica
+
+    Args:
+        desde (float): instante inicial (time.time()); sem ele, todo o histórico
+    """
+    conexao = conectar(caminho)
+    try:
+        return [dict(linha) for linha in conexao.execute(
+            "SELECT * FROM unidades WHERE id_unidade = ? AND executado_em >= ? ORDER BY executado_em, id",
+            (str(id_unidade), formatar_instante(desde) or "")
+        )]
+    finally:
+        conexao.close()
+
+def execucoes_conta(id_conta, desde=None, caminho=CAMINHO_PADRAO):
+    """Linhas de todas as unidades de uma conta em ordem cronológica"""
+    conexao = conectar(caminho)
+    try:
+        return [dict(linha) for linha in conexao.execute(
+            "SELECT * FROM unidades WHERE id_conta = ? AND executado_em >= ? ORDER BY executado_em, id",
+            (id_conta, formatar_instante(desde) or "")
+        )]
+    finally:
+        conexao.close()
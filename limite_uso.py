@@ -0,0 +1,181 @@
+import json
+import re
+import threading
+import time
+import logging
+
+# Agendador de chamadas da Graph API baseado nos cabeçalhos de uso
+# (X-App-Usage, X-Ad-Account-Usage e X-Business-Use-Case-Usage).
+# Antes de cada chamada, espaça ou pausa as requisições da conta quando o uso
+# se aproxima do limite, evitando que a execução pare no meio com os erros 17/613.
+
+LIMITE_DESACELERAR = 75  # % de uso a partir do qual as chamadas da conta são espaçadas
+LIMITE_PAUSAR = 90  # % de uso a partir do qual as chamadas da conta são pausadas
+ATRASO_MAXIMO = 5.0  # segundos de espaçamento entre chamadas logo abaixo de LIMITE_PAUSAR
+PAUSA_PADRAO = 60  # segundos de pausa quando a Graph API não informa o tempo de recuperação
+PAUSA_MAXIMA = 600  # teto para pausas informadas pela Graph API
+
+# Códigos de erro da Graph API que indicam limite de chamadas atingido
+CODIGOS_LIMITE = {4, 17, 32, 613, 80000, 80001, 80002, 80003, 80004, 80005, 80006, 80008, 80009, 80014}
+CODIGOS_LIMITE_APP = {4}  # limite do aplicativo, afeta todas as contas
+
+CHAVE_APP = "app"
+
+_uso = {}
+_uso_lock = threading.Lock()
+
+# Função de log; cada operação registra a sua em run() através do graph_client
+log_message = logging.info
+
+def identificar_conta(url):
+    """Extrai o ID da conta de anúncio (act_...) de uma URL da Graph API"""
+    match = re.search(r"act_\d+", url or "")
+    return match.group(0) if match else None
+
+def _registro(chave):
+    if chave not in _uso:
+        _uso[chave] = {
+            "percentual": 0,
+            "detalhes": {},
+            "liberar_em": 0,
+            "recuperacao": None,
+            "atualizado_em": None
+        }
+    return _uso[chave]
+
+def _ler_json_cabecalho(headers, nome):
+    valor = headers.get(nome)
+    if not valor:
+        return None
+    try:
+        return json.loads(valor)
+    except ValueError:
+        return None
+
+def registrar_resposta(response, conta=None):
+    """Atualiza o uso conhecido a partir dos cabeçalhos e do corpo de uma resposta"""
+    headers = getattr(response, "headers", None) or {}
+    agora = time.time()
+
+    with _uso_lock:
+        uso_app = _ler_json_cabecalho(headers, "X-App-Usage")
+        if uso_app:
+            registro = _registro(CHAVE_APP)
+            registro["detalhes"] = uso_app
+            registro["percentual"] = max(
+                uso_app.get("call_count", 0),
+                uso_app.get("total_cputime", 0),
+                uso_app.get("total_time", 0)
+            )
+            registro["atualizado_em"] = agora
+
+        if conta:
+            percentuais = []
+            recuperacao = None
+            detalhes = {}
+
+            uso_conta = _ler_json_cabecalho(headers, "X-Ad-Account-Usage")
+            if uso_conta:
+                detalhes["ad_account"] = uso_conta
+                percentuais.append(uso_conta.get("acc_id_util_pct", 0))
+                if uso_conta.get("reset_time_duration"):
+                    recuperacao = uso_conta["reset_time_duration"]
+
+            uso_negocio = _ler_json_cabecalho(headers, "X-Business-Use-Case-Usage")
+            if uso_negocio:
+                detalhes["business_use_case"] = uso_negocio
+                for casos in uso_negocio.values():
+                    for caso in casos:
+                        percentuais.append(max(
+                            caso.get("call_count", 0),
+                            caso.get("total_cputime", 0),
+                            caso.get("total_time", 0)
+                        ))
+                        minutos = caso.get("estimated_time_to_regain_access", 0)
+                        if minutos:
+                            recuperacao = max(recuperacao or 0, minutos * 60)
+
+            if percentuais:
+                registro = _registro(conta)
+                registro["detalhes"] = detalhes
+                registro["percentual"] = max(percentuais)
+                registro["recuperacao"] = recuperacao
+                registro["atualizado_em"] = agora
+
+    codigo = codigo_erro(response)
+    if codigo in CODIGOS_LIMITE:
+        chave = CHAVE_APP if codigo in CODIGOS_LIMITE_APP or not conta else conta
+        with _uso_lock:
+            registro = _registro(chave)
+            pausa = min(registro.get("recuperacao") or PAUSA_PADRAO, PAUSA_MAXIMA)
+            registro["liberar_em"] = max(registro["liberar_em"], agora + pausa)
+            registro["percentual"] = 100
+        log_message(f"[AVISO] Limite da Graph API atingido ({chave}, código {codigo}). Pausando por {pausa:.0f}s")
+        return True
+    return False
+
+def codigo_erro(response):
+    """Retorna o código de erro da Graph API contido na resposta, se houver"""
+    try:
+        dados = response.json()
+    except (ValueError, AttributeError):
+        return None
+    if isinstance(dados, dict) and isinstance(dados.get("error"), dict):
+        return dados["error"].get("code")
+    return None
+
+def _calcular_espera(conta):
+    """Retorna (segundos, é_pausa) que a próxima chamada da conta deve aguardar"""
+    agora = time.time()
+    chaves = [CHAVE_APP] + ([conta] if conta else [])
+    registros = [_uso[chave] for chave in chaves if chave in _uso]
+
+    liberar_em = max((r["liberar_em"] for r in registros), default=0)
+    if liberar_em > agora:
+        return liberar_em - agora, True
+
+    for chave in chaves:
+        registro = _uso.get(chave)
+        if registro and registro["liberar_em"] and registro["liberar_em"] <= agora:
+            # Pausa concluída: o uso volta a ser conhecido na próxima resposta
+            registro["liberar_em"] = 0
+            registro["percentual"] = 0
+
+    percentual = max((r["percentual"] for r in registros), default=0)
+    if percentual >= LIMITE_PAUSAR:
+        registro = max(registros, key=lambda r: r["percentual"])
+        pausa = min(registro.get("recuperacao") or PAUSA_PADRAO, PAUSA_MAXIMA)
+        registro["liberar_em"] = agora + pausa
+        return pausa, True
+    if percentual >= LIMITE_DESACELERAR:
+        fracao = (percentual - LIMITE_DESACELERAR) / (LIMITE_PAUSAR - LIMITE_DESACELERAR)
+        return ATRASO_MAXIMO * fracao, False
+    return 0, False
+
+def aguardar_vez(conta=None):
+    """Bloqueia até que a conta (e o aplicativo) tenham folga para uma nova chamada"""
+    while True:
+        with _uso_lock:
+            espera, pausa = _calcular_espera(conta)
+        if espera <= 0:
+            return
+        if pausa:
+            log_message(f"[AVISO] Uso da Graph API próximo do limite ({conta or CHAVE_APP}). Aguardando {espera:.0f}s")
+        time.sleep(espera)
+        if not pausa:
+            return
+
+def obter_uso_atual():
+    """Retorna o uso conhecido por chave (aplicativo e contas) para exibição no dashboard"""
+    agora = time.time()
+    with _uso_lock:
+        return {
+            chave: {
+                "percentual": registro["percentual"],
+                "folga": max(0, 100 - registro["percentual"]),
+                "pausado_por": max(0, round(registro["liberar_em"] - agora)),
+                "atualizado_em": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(registro["atualizado_em"])) if registro["atualizado_em"] else None,
+                "detalhes": registro["detalhes"]
+            }
+            for chave, registro in _uso.items()
+        }
@@ -0,0 +1,76 @@
+import numpy as np
+import dinheiro
+
+# Cálculos em bloco sobre as unidades de orçamento (campanhas CBO e ad sets ABO)
+# compartilhados por escalar, reduzir e realocar. Cada coluna é um array NumPy, de
+# modo que lucro, limites, ordenação e partes proporcionais são calculados
+# para todas as unidades de uma vez, em vez de uma unidade por vez. Os valores
+# monetários são arrays int64 em centavos, então somas e divisões são exatas.
+
+BAIXO = "BAIXO"
+MEDIO = "MÉDIO"
+ALTO = "ALTO"
+
+COLUNAS = ("ids", "adset", "orcamento", "gasto", "valor_conversao", "lucro")
+
+class TabelaUnidades:
+    """
+    Tabela colunar das unidades (registros.Unidade). As linhas seguem a ordem da
+    lista recebida e "unidades" guarda os registros originais, para que as operações
+    continuem usando os mesmos registros ao enviar as atualizações e montar as mensagens.
+    """
+
+    def __init__(self, unidades):
+        self.unidades = list(unidades)
+        self.ids = np.array([u.id_objeto for u in self.unidades], dtype=object)
+        self.adset = np.array([u.tipo == "ABO_ADSET" for u in self.unidades], dtype=bool)
+        self.orcamento = np.array([u.orcamento_atual for u in self.unidades], dtype=np.int64)
+        self.gasto = np.array([u.gasto for u in self.unidades], dtype=np.int64)
+        self.valor_conversao = np.array([u.valor_conversao for u in self.unidades], dtype=np.int64)
+        self.lucro = self.valor_conversao - self.gasto
+
+    def __len__(self):
+        return len(self.unidades)
+
+    def selecionar(self, indices):
+        """Nova tabela com as linhas indicadas (máscara booleana ou índices, na ordem dada)"""
+        indices = np.asarray(indices)
+        indices = np.flatnonzero(indices) if indices.dtype == bool else indices.astype(np.intp)
+        tabela = TabelaUnidades.__new__(TabelaUnidades)
+        tabela.unidades = [self.unidades[i] for i in indices]
+        for coluna in COLUNAS:
+            setattr(tabela, coluna, getattr(self, coluna)[indices])
+        return tabela
+
+    def ordenar_por_lucro(self, decrescente=False):
+        """Nova tabela ordenada por lucro; unidades com o mesmo lucro mantêm a ordem original"""
+        chave = -self.lucro if decrescente else self.lucro
+        return self.selecionar(np.argsort(chave, kind="stable"))
+
+    def classificar(self, limite_baixo, limite_alto):
+        """Classificação BAIXO/MÉDIO/ALTO de cada unidade"""
+        return classificar_lucros(self.lucro, limite_baixo, limite_alto)
+
+    def partes_proporcionais(self, total):
+        """
+        Divide o total (centavos) entre as unidades na proporção do lucro de cada uma;
+        se a soma dos lucros não for positiva, divide em partes iguais.
+        As partes somam exatamente o total (ver dinheiro.dividir_proporcional).
+        """
+        return dinheiro.dividir_proporcional(total, self.lucro)
+
+def classificar_lucros(lucros, limite_baixo, limite_alto):
+    """
+    Classificação BAIXO/MÉDIO/ALTO de uma sequência de lucros (lucros e limites em centavos).
+    Abaixo de limite_baixo é BAIXO mesmo que também passe de limite_alto.
+    """
+    lucros = np.asarray(lucros)
+    return np.select([lucros < limite_baixo, lucros >= limite_alto], [BAIXO, ALTO], default=MEDIO)
+
+def limitar(valores, minimo=None, maximo=None):
+    """Aplica piso e teto (escalares ou arrays) aos orçamentos calculados"""
+    if minimo is not None:
+        valores = np.maximum(valores, minimo)
+    if maximo is not None:
+        valores = np.minimum(valores, maximo)
+    return valores
@@ -0,0 +1,252 @@
+import json
+import os
+import time
+import graph_client
+import snapshot_campanhas
+import dinheiro
+import exportacao
+import historico_execucoes
+import plano_orcamento
+
+# Etapas comuns às operações de orçamento (escalar, reduzir e realocar): configuração
+# compartilhada, campanhas da execução a partir do snapshot, conferência dos orçamentos
+# atuais, envio das alterações, gravação do resultado e dos planos.
+# As regras de cada operação (quais unidades mudam e quanto) ficam nos módulos das operações.
+
+CONFIG_FILE = "config.json"
+
+# Nome de cada operação nas mensagens do log
+NOMES_OPERACOES = {"escala": "escala", "reducao": "redução", "realocacao": "realocação"}
+
+def _ler_config():
+    if not os.path.exists(CONFIG_FILE):
+        return {}
+    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+config = _ler_config()
+
+JANELAS_COMPARACAO = config.get("JANELAS_COMPARACAO", [])  # Ex.: ["yesterday", "last_7d"], buscadas na mesma consulta da janela principal
+PESOS_JANELAS = config.get("PESOS_JANELAS", {})  # Peso de cada janela na pontuação multi-janela
+POLITICA_ORCAMENTO_ALTERADO = config.get("POLITICA_ORCAMENTO_ALTERADO", "rebase")  # "rebase" ou "pular" quando o orçamento mudou desde a coleta
+MAX_CONTAS_PARALELAS = int(config.get("MAX_CONTAS_PARALELAS", 4))  # Contas coletadas simultaneamente
+IDADE_MAXIMA_SNAPSHOT = int(config.get("IDADE_MAXIMA_SNAPSHOT", snapshot_campanhas.IDADE_MAXIMA_PADRAO))  # Segundos em que a coleta de uma operação é reaproveitada pelas seguintes
+MAX_MUTACOES_POR_CONTA = int(config.get("MAX_MUTACOES_POR_CONTA", graph_client.MAX_MUTACOES_POR_CONTA))  # Lotes de atualização de orçamento simultâneos por conta
+HISTORICO_PATH = config.get("HISTORICO_PATH", historico_execucoes.CAMINHO_PADRAO)  # Histórico das execuções por unidade (SQLite)
+HISTORICO_RETENCAO_DIAS = int(config.get("HISTORICO_RETENCAO_DIAS", historico_execucoes.RETENCAO_DIAS_PADRAO))  # Dias mantidos no histórico
+HISTORICO_COMPACTAR_APOS_DIAS = int(config.get("HISTORICO_COMPACTAR_APOS_DIAS", historico_execucoes.COMPACTAR_APOS_DIAS_PADRAO))  # Depois disso fica só a última linha de cada unidade por dia
+
+def log_message(msg):
+    graph_client.log_message(msg)
+
+def obter_campanhas(access_token, contas, contas_abo, date_preset=None, start_date=None, end_date=None):
+    """
+    Campanhas de todas as contas (incluindo ABO) a partir do snapshot compartilhado entre as
+    operações; só há coleta nova se o atual for de outros parâmetros ou mais antigo que
+    IDADE_MAXIMA_SNAPSHOT
+
+    Returns:
+        tuple: (snapshot, cópia das campanhas do snapshot que a operação pode alterar)
+    """
+    snapshot = snapshot_campanhas.obter_snapshot(
+        access_token, contas, contas_abo, date_preset, start_date, end_date,
+        JANELAS_COMPARACAO, PESOS_JANELAS, IDADE_MAXIMA_SNAPSHOT, MAX_CONTAS_PARALELAS
+    )
+    campanhas = snapshot_campanhas.copiar_campanhas(snapshot)
+
+    log_message(f"Total de {len(campanhas)} campanhas ativas encontradas.")
+
+    # Contar campanhas por tipo
+    campanhas_cbo = [c for c in campanhas if c.tipo_campanha == "CBO"]
+    campanhas_abo = [c for c in campanhas if c.tipo_campanha == "ABO"]
+    log_message(f"Campanhas CBO: {len(campanhas_cbo)}, Campanhas ABO: {len(campanhas_abo)}")
+
+    # Log detalhado de campanhas ABO
+    if campanhas_abo:
+        total_adsets = sum(len(c.adsets_info) for c in campanhas_abo)
+        log_message(f"Total de AdSets em campanhas ABO: {total_adsets}")
+
+    return snapshot, campanhas
+
+def salvar_resultado(caminho_planilha, campanhas, saidas, operacao, snapshot_em=None, com_classificacao=False):
+    """
+    Exporta as campanhas da execução para as saídas configuradas, com o novo orçamento e a
+    variação das campanhas e ad sets alterados e o instante do snapshot, e acrescenta as
+    unidades ao histórico das execuções
+
+    Args:
+        caminho_planilha (str): planilha da operação; as outras saídas trocam só a extensão
+        saidas (list): formatos em exportacao.SAIDAS
+        operacao (str): "escala", "reducao" ou "realocacao"
+    """
+    gravadas = exportacao.exportar(caminho_planilha, campanhas, saidas, operacao, snapshot_em, com_classificacao)
+    for caminho, linhas in gravadas.items():
+        log_message(f"Dados de {len(campanhas)} campanhas salvos em {caminho} ({linhas} linhas).")
+    historico_execucoes.registrar(
+        campanhas, operacao, snapshot_em, HISTORICO_PATH, HISTORICO_RETENCAO_DIAS, HISTORICO_COMPACTAR_APOS_DIAS
+    )
+
+def calcular_orcamento_total(campanhas):
+    """Soma, em centavos, dos orçamentos das campanhas (o novo orçamento quando houver)"""
+    return sum(
+        campanha.orcamento_diario if campanha.novo_orcamento is None else campanha.novo_orcamento
+        for campanha in campanhas
+    )
+
+def atualizar_orcamentos_em_lote(atualizacoes, access_token):
+    """
+    Atualiza orçamentos de campanhas CBO e AdSets ABO pelo endpoint batch da Graph API,
+    com os lotes de contas diferentes (e até MAX_MUTACOES_POR_CONTA da mesma conta) em paralelo
+
+    Args:
+        atualizacoes (list): tuplas (tipo, id_objeto, novo_orcamento, id_conta), com tipo "CBO" ou "ABO_ADSET"
+
+    Returns:
+        list: True/False para cada atualização, na mesma ordem recebida
+    """
+    if not atualizacoes:
+        return []
+
+    requisicoes = [
+        {
+            "method": "POST",
+            "relative_url": str(id_objeto),
+            "body": f"daily_budget={int(novo_orcamento)}"
+        }
+        for _, id_objeto, novo_orcamento, _ in atualizacoes
+    ]
+
+    contas = [id_conta for _, _, _, id_conta in atualizacoes]
+    log_message(f"Enviando {len(requisicoes)} atualizações de orçamento de {len(set(contas))} contas em lotes de até "
+                f"{graph_client.TAMANHO_MAXIMO_LOTE} ({MAX_MUTACOES_POR_CONTA} lotes simultâneos por conta)")
+    respostas = graph_client.executar_mutacoes(requisicoes, access_token, contas, MAX_MUTACOES_POR_CONTA)
+
+    resultados = []
+    for (tipo, id_objeto, novo_orcamento, _), result in zip(atualizacoes, respostas):
+        descricao = "AdSet" if tipo == "ABO_ADSET" else "campanha"
+        if result.get("success"):
+            log_message(f"Orçamento atualizado para {descricao} {id_objeto}: R$ {dinheiro.formatar(novo_orcamento)}")
+            resultados.append(True)
+        else:
+            erro_msg = result.get('error', {}).get('message', 'Erro desconhecido')
+            log_message(f"[ERRO] Falha ao atualizar {descricao} {id_objeto}: {erro_msg}")
+            resultados.append(False)
+
+    # Manter o snapshot e as campanhas/ad sets em cache coerentes com os novos orçamentos
+    snapshot_campanhas.registrar_orcamentos({
+        str(id_objeto): int(novo_orcamento)
+        for (_, id_objeto, novo_orcamento, _), sucesso in zip(atualizacoes, resultados)
+        if sucesso
+    })
+    return resultados
+
+def conferir_orcamentos_atuais(unidades, access_token, politica=None, ignoradas=None):
+    """
+    Relê o daily_budget das unidades logo antes das alterações (GET /?ids=, 50 por chamada).
+    Se o orçamento mudou desde a coleta (ex.: alteração manual no Gerenciador de Anúncios),
+    a unidade é recalculada sobre o valor atual (politica "rebase") ou deixada de fora
+    ("pular"). Unidades que não puderam ser lidas ficam de fora.
+
+    Args:
+        politica (str): "rebase" ou "pular"; padrão POLITICA_ORCAMENTO_ALTERADO
+        ignoradas (list): se informada, recebe os ids das unidades deixadas de fora
+
+    Returns:
+        list: unidades que podem ser alteradas, na mesma ordem
+    """
+    if not unidades:
+        return []
+    politica = politica or POLITICA_ORCAMENTO_ALTERADO
+
+    ids = [u.id_objeto for u in unidades]
+    atuais = graph_client.ler_objetos(ids, access_token, ["daily_budget"])
+
+    conferidas = []
+    orcamentos_alterados = {}
+    for unidade, id_objeto in zip(unidades, ids):
+        objeto = atuais.get(str(id_objeto))
+        if objeto is None:
+            log_message(f"[AVISO] Não foi possível conferir o orçamento atual de {unidade.nome}. Unidade ignorada")
+            if ignoradas is not None:
+                ignoradas.append(str(id_objeto))
+            continue
+
+        orcamento_lido = dinheiro.centavos_orcamento(objeto.get("daily_budget"))
+        diferenca = orcamento_lido - unidade.orcamento_atual
+        if diferenca == 0:
+            conferidas.append(unidade)
+            continue
+
+        orcamentos_alterados[str(id_objeto)] = orcamento_lido
+        if politica == "pular":
+            log_message(f"[AVISO] Orçamento de {unidade.nome} mudou de R$ {dinheiro.formatar(unidade.orcamento_atual)} para R$ {dinheiro.formatar(orcamento_lido)} desde a coleta. Unidade ignorada")
+            if ignoradas is not None:
+                ignoradas.append(str(id_objeto))
+            continue
+
+        log_message(f"[AVISO] Orçamento de {unidade.nome} mudou de R$ {dinheiro.formatar(unidade.orcamento_atual)} para R$ {dinheiro.formatar(orcamento_lido)} desde a coleta. Recalculando sobre o valor atual")
+        unidade.orcamento_atual = orcamento_lido
+        if unidade.tipo == "ABO_ADSET":
+            unidade.adset_info.daily_budget = orcamento_lido
+            unidade.campanha_info.orcamento_diario += diferenca
+        else:
+            unidade.campanha_info.orcamento_diario = orcamento_lido
+        conferidas.append(unidade)
+
+    snapshot_campanhas.registrar_orcamentos(orcamentos_alterados)
+    return conferidas
+
+def relatorio_ignoradas(ignoradas):
+    """
+    Trecho do relatório da execução com as unidades deixadas de fora na conferência dos
+    orçamentos (não lidas ou alteradas desde a coleta); vazio se não houver nenhuma
+    """
+    if not ignoradas:
+        return ""
+    log_message(f"[RESUMO] Unidades ignoradas na conferência dos orçamentos: {', '.join(ignoradas)}")
+    return f"\n⚠️ Unidades ignoradas na conferência dos orçamentos ({len(ignoradas)}):\n{', '.join(ignoradas)}\n"
+
+def salvar_plano(caminho, operacao, snapshot, parametros, itens, campanhas):
+    """Grava o plano calculado pela operação sobre as campanhas da execução em caminho (ver plano_orcamento)"""
+    plano = plano_orcamento.criar(operacao, snapshot, parametros, itens, campanhas)
+    plano_orcamento.salvar(plano, caminho)
+    log_message(f"Plano de {NOMES_OPERACOES[operacao]} com {len(itens)} alterações gravado em {caminho}. Nenhum orçamento foi alterado")
+    return plano
+
+def preparar_aplicacao(caminho, operacao, access_token, ignoradas=None):
+    """
+    Carrega o plano gravado em caminho e associa seus itens às campanhas gravadas com ele,
+    desde que o plano ainda não tenha sido aplicado e seus dados não tenham passado de
+    IDADE_MAXIMA_SNAPSHOT. Os orçamentos atuais são relidos na Graph API e os itens cujo
+    orçamento mudou desde o plano ficam de fora. O plano é marcado como aplicado antes de
+    retornar: um plano nunca é aplicado duas vezes, mesmo se a execução cair no meio.
+
+    Args:
+        ignoradas (list): se informada, recebe os ids dos itens deixados de fora na conferência
+
+    Returns:
+        tuple: (plano, campanhas da execução, pares (item, unidade)), ou None se o plano não puder ser aplicado
+    """
+    nome = NOMES_OPERACOES[operacao]
+    plano = plano_orcamento.carregar(caminho)
+    if plano is None or "campanhas" not in plano:
+        log_message(f"[ERRO] Nenhum plano de {nome} gravado. Gere um plano antes de aplicar")
+        return None
+    if plano["aplicado_em"]:
+        log_message(f"[ERRO] Este plano de {nome} já foi aplicado. Gere um novo plano")
+        return None
+    if not plano_orcamento.dentro_da_idade(plano, IDADE_MAXIMA_SNAPSHOT):
+        log_message(f"[ERRO] Os dados do plano passaram de {IDADE_MAXIMA_SNAPSHOT}s. Gere um novo plano")
+        return None
+
+    campanhas = plano_orcamento.campanhas_do_plano(plano)
+    log_message(f"Aplicando plano de {nome} com {len(plano['itens'])} alterações, calculado sobre os dados coletados "
+                f"às {time.strftime('%H:%M:%S', time.localtime(plano['snapshot_em']))}")
+    pares = plano_orcamento.unidades_do_plano(plano, campanhas)
+
+    # Itens cujo orçamento foi alterado depois do plano (manualmente ou por outra operação) não são aplicados
+    conferidas = {id(unidade) for unidade in conferir_orcamentos_atuais([unidade for _, unidade in pares], access_token, "pular", ignoradas)}
+    pares = [(item, unidade) for item, unidade in pares if id(unidade) in conferidas]
+
+    plano_orcamento.marcar_aplicado(plano, caminho)
+    return plano, campanhas, pares
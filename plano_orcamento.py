@@ -0,0 +1,131 @@
+import json
+import os
+import time
+import registros
+import dinheiro
+import graph_client
+from exportacao import formatar_instante
+
+# Plano de alterações de orçamento de uma operação (escalar, reduzir ou realocar).
+# O planejamento calcula os novos orçamentos sem nenhuma escrita na Graph API e grava o
+# plano em JSON: cada item traz a unidade, o orçamento antes e depois, o motivo e a fase
+# ("escala", "reducao" ou "aumento"), e o plano guarda o instante do snapshot usado.
+# O plano também guarda as campanhas da execução, para que a aplicação não dependa do
+# snapshot do processo (ex.: servidor reiniciado entre o plano e a aplicação).
+# A aplicação lê o plano e envia as alterações sem coletar nem recalcular nada, desde que
+# os dados do plano não tenham passado da idade máxima; antes disso os orçamentos atuais
+# são relidos e os itens cujo orçamento mudou desde o plano ficam de fora.
+# Valores em centavos, como nos registros.
+
+def novo_item(fase, unidade, novo_orcamento, motivo):
+    """Item do plano para uma unidade (registros.Unidade) com o orçamento atual conferido"""
+    return {
+        "fase": fase,
+        "tipo": unidade.tipo,
+        "id_conta": unidade.campanha_info.id_conta,
+        "id_campanha": unidade.id_campanha,
+        "id_objeto": str(unidade.id_objeto),
+        "nome": unidade.nome,
+        "orcamento_anterior": int(unidade.orcamento_atual),
+        "novo_orcamento": int(novo_orcamento),
+        "motivo": motivo
+    }
+
+def criar(operacao, snapshot, parametros, itens, campanhas):
+    """
+    Args:
+        operacao (str): "escala", "reducao" ou "realocacao"
+        snapshot (snapshot_campanhas.Snapshot): snapshot usado no cálculo
+        parametros (dict): parâmetros da operação, restaurados na aplicação
+        itens (list): itens criados com novo_item
+        campanhas (list): campanhas da execução (registros.Campanha) sobre as quais o plano foi calculado
+    """
+    return {
+        "operacao": operacao,
+        "criado_em": time.time(),
+        "snapshot_em": snapshot.criado_em,
+        "parametros": parametros,
+        "itens": itens,
+        "campanhas": [campanha.para_dict() for campanha in campanhas],
+        "aplicado_em": None
+    }
+
+def salvar(plano, caminho):
+    """Grava o plano ao lado e só substitui o anterior quando completo"""
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(plano, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+def carregar(caminho):
+    """Plano gravado em caminho, ou None se não houver"""
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def marcar_aplicado(plano, caminho):
+    plano["aplicado_em"] = time.time()
+    salvar(plano, caminho)
+
+def dentro_da_idade(plano, idade_maxima):
+    """Se os dados do plano têm no máximo idade_maxima segundos"""
+    return time.time() - plano["snapshot_em"] <= idade_maxima
+
+def campanhas_do_plano(plano):
+    """Campanhas da execução gravadas no plano (registros.Campanha)"""
+    return [registros.Campanha.de_dict(campanha) for campanha in plano["campanhas"]]
+
+def unidades_do_plano(plano, campanhas):
+    """
+    Associa os itens do plano às unidades das campanhas da execução. Itens cuja unidade
+    não está nas campanhas ficam de fora.
+
+    Returns:
+        list: tuplas (item, unidade) na ordem do plano
+    """
+    unidades = {
+        str(unidade.id_objeto): unidade
+        for campanha in campanhas
+        for unidade in registros.unidades_da_campanha(campanha)
+    }
+    pares = []
+    for item in plano["itens"]:
+        unidade = unidades.get(item["id_objeto"])
+        if unidade is None:
+            graph_client.log_message(f"[AVISO] {item['nome']} não está entre as campanhas do plano. Item do plano ignorado")
+            continue
+        pares.append((item, unidade))
+    return pares
+
+def resumo(plano, idade_maxima):
+    """Plano em reais, com a idade dos dados, para o painel"""
+    if plano is None:
+        return {"disponivel": False}
+    itens = [
+        {
+            "fase": item["fase"],
+            "tipo": "ABO AdSet" if item["tipo"] == "ABO_ADSET" else "CBO",
+            "id_objeto": item["id_objeto"],
+            "nome": item["nome"],
+            "orcamento_anterior": dinheiro.reais(item["orcamento_anterior"]),
+            "novo_orcamento": dinheiro.reais(item["novo_orcamento"]),
+            "variacao": dinheiro.reais(item["novo_orcamento"] - item["orcamento_anterior"]),
+            "motivo": item["motivo"]
+        }
+        for item in plano["itens"]
+    ]
+    variacoes = [item["novo_orcamento"] - item["orcamento_anterior"] for item in plano["itens"]]
+    return {
+        "disponivel": True,
+        "operacao": plano["operacao"],
+        "criado_em": formatar_instante(plano["criado_em"]),
+        "snapshot_em": formatar_instante(plano["snapshot_em"]),
+        "idade_snapshot": round(time.time() - plano["snapshot_em"]),
+        "idade_maxima": idade_maxima,
+        "aplicado_em": formatar_instante(plano["aplicado_em"]),
+        "pode_aplicar": dentro_da_idade(plano, idade_maxima) and "campanhas" in plano and not plano["aplicado_em"],
+        "total_aumentos": dinheiro.reais(sum(v for v in variacoes if v > 0)),
+        "total_reducoes": dinheiro.reais(-sum(v for v in variacoes if v < 0)),
+        "itens": itens
+    }
@@ -1,7 +1,14 @@
 import json
 import os
-import requests
-import openpyxl
+import graph_client
+import snapshot_campanhas
+import dinheiro
+import registros
+import exportacao
+import plano_orcamento
+import operacoes_orcamento
+import metricas_unidades
+import numpy as np
 import time
 import logging
 from selenium import webdriver
@@ -62,6 +69,7 @@ ACCESS_TOKEN = config.get("ACCESS_TOKEN", "")
 AD_ACCOUNTS = config.get("AD_ACCOUNTS", [])
 ABO_ACCOUNTS = config.get("ABO_ACCOUNTS", [])
 SPREADSHEET_PATH = "campanhas_realocacao.xlsx"
+PLANO_PATH = "plano_realocacao.json"  # Último plano de realocação calculado (ver plano_orcamento)
 LIMITE_LUCRO_BAIXO = float(config.get("LIMITE_LUCRO_BAIXO", 1000))
 LIMITE_LUCRO_ALTO = float(config.get("LIMITE_LUCRO_ALTO", 5000))
 PERCENTUAL_REALOCACAO = float(config.get("PERCENTUAL_REALOCACAO", 0.30))
@@ -70,524 +78,221 @@ MINIMO_ORCAMENTO_ABO = float(config.get("MINIMO_ORCAMENTO_ABO", 8))
 MAXIMO_ORCAMENTO = float(config.get("MAXIMO_ORCAMENTO", 10000))
 WHATSAPP_GROUP = config.get("WHATSAPP_GROUP", "#ZIP - ROAS IMPERIO")
 DATE_PRESET = config.get("DATE_PRESET", "today")
+SAIDAS = config.get("SAIDAS_REALOCACAO", exportacao.SAIDAS_PADRAO)  # Formatos do resultado: "xlsx", "csv", "parquet" e/ou "sqlite"
 
-# Armazena dados completos das campanhas para uso na realocação
-campanhas_completas_data = {}
+# Estado da execução: campanhas (registros.Campanha) na ordem da planilha; as decisões
+# leem e gravam nesses registros e as saídas só são geradas no final
+campanhas_execucao = []
 
-def criar_planilha():
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "CAMPANHAS"
-    sheet.append([
-        "ID da Conta de Anúncio", "ID da Campanha", "Nome da Campanha", "Tipo",
-        "Orçamento Diário", "Gasto", "Valor de Conversões",
-        "ROAS", "Lucro", "Novo Orçamento", "Classificação", "Detalhes AdSets"
-    ])
-    workbook.save(SPREADSHEET_PATH)
-    log_message("Planilha criada com sucesso.")
+# Ids das unidades deixadas de fora na conferência dos orçamentos, informados no relatório
+unidades_ignoradas = []
 
-def limpar_planilha():
-    if os.path.exists(SPREADSHEET_PATH):
-        try:
-            workbook = openpyxl.load_workbook(SPREADSHEET_PATH)
-            if "CAMPANHAS" in workbook.sheetnames:
-                sheet = workbook["CAMPANHAS"]
-                sheet.delete_rows(2, sheet.max_row)
-            else:
-                workbook.create_sheet("CAMPANHAS")
-            workbook.save(SPREADSHEET_PATH)
-            log_message("Planilha limpa no início da execução.")
-        except Exception as e:
-            log_message(f"[ERRO] Falha ao limpar a planilha: {e}")
-    else:
-        log_message("Planilha não encontrada. Criando nova planilha.")
-        criar_planilha()
-
-def buscar_dados_facebook(url):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        log_message(f"[ERRO] Falha ao buscar dados do Facebook: {e}\nResposta: {response.text if 'response' in locals() else ''}")
-        return {}
-
-def buscar_todos_dados_facebook(url):
-    todos_dados = []
-    while url:
-        dados = buscar_dados_facebook(url)
-        if "error" in dados:
-            log_message(f"[ERRO] Graph API retornou: {dados['error']}")
-            break
-        page_data = dados.get("data", [])
-        todos_dados.extend(page_data)
-        url = dados.get("paging", {}).get("next")
-    return todos_dados
-
-def detectar_tipo_campanha(campanha, ad_account):
-    """Detecta se a campanha é CBO ou ABO"""
-    daily_budget = campanha.get("daily_budget", 0)
-    
-    if ad_account in ABO_ACCOUNTS:
-        return "ABO"
-    
-    if daily_budget and int(daily_budget) > 0:
-        return "CBO"
-    else:
-        return "ABO"
-
-def buscar_adsets_campanha(campaign_id):
-    """Busca todos os ad sets de uma campanha ABO"""
-    url = (
-        f"https://graph.facebook.com/v17.0/{campaign_id}/adsets"
-        f"?fields=id,name,daily_budget,status&access_token={ACCESS_TOKEN}"
+def classificar_campanhas(campanhas):
+    """Classificação baseada no lucro, calculada para todas as campanhas de uma vez"""
+    classificacoes = metricas_unidades.classificar_lucros(
+        [campanha.lucro for campanha in campanhas],
+        dinheiro.centavos(LIMITE_LUCRO_BAIXO), dinheiro.centavos(LIMITE_LUCRO_ALTO)
     )
-    return buscar_todos_dados_facebook(url)
-
-def buscar_insights_adset(ad_account, campaign_id, date_preset=None, start_date=None, end_date=None):
-    """Busca insights no nível de ad set para campanhas ABO"""
-    filtering = f'[{{"field":"campaign.id","operator":"EQUAL","value":"{campaign_id}"}}]'
-    
-    if date_preset:
-        url = (
-            f"https://graph.facebook.com/v17.0/{ad_account}/insights"
-            f"?fields=adset_id,adset_name,campaign_id,spend,action_values"
-            f"&date_preset={date_preset}&level=adset"
-            f"&filtering={filtering}"
-            f"&access_token={ACCESS_TOKEN}"
-        )
-    else:
-        url = (
-            f"https://graph.facebook.com/v17.0/{ad_account}/insights"
-            f"?fields=adset_id,adset_name,campaign_id,spend,action_values"
-            f"&time_range[since]={start_date}&time_range[until]={end_date}"
-            f"&level=adset"
-            f"&filtering={filtering}"
-            f"&access_token={ACCESS_TOKEN}"
-        )
-    
-    return buscar_todos_dados_facebook(url)
+    for campanha, classificacao in zip(campanhas, classificacoes.tolist()):
+        campanha.classificacao = classificacao
 
-def processar_campanha_abo(campanha, ad_account, date_preset=None, start_date=None, end_date=None):
-    """Processa campanhas ABO agregando dados de todos os ad sets ativos"""
-    campaign_id = campanha["id"]
-    log_message(f"Processando campanha ABO: {campanha['name']}")
-    
-    adsets = buscar_adsets_campanha(campaign_id)
-    insights_adsets = buscar_insights_adset(ad_account, campaign_id, date_preset, start_date, end_date)
-    
-    # Agregar dados de todos os ad sets ativos
-    total_orcamento = 0
-    total_gasto = 0
-    total_conversao = 0
-    adsets_info = []
-    adsets_ativos = 0
-    
-    for adset in adsets:
-        if adset.get("status") == "ACTIVE":
-            adsets_ativos += 1
-            adset_id = adset["id"]
-            daily_budget = float(adset.get("daily_budget", 0)) / 100
-            total_orcamento += daily_budget
-            
-            # Buscar insight correspondente
-            insight = next((i for i in insights_adsets if i.get("adset_id") == adset_id), None)
-            
-            if insight:
-                gasto = float(insight.get("spend", 0))
-                valor_conversao = sum(
-                    float(a.get("value", 0))
-                    for a in insight.get("action_values", [])
-                    if a.get("action_type") in ['offsite_conversion.purchase', 'offsite_conversion.fb_pixel_purchase']
-                )
-                total_gasto += gasto
-                total_conversao += valor_conversao
-            else:
-                gasto = 0
-                valor_conversao = 0
-            
-            lucro = valor_conversao - gasto
-            
-            adsets_info.append({
-                "adset_id": adset_id,
-                "adset_name": adset["name"],
-                "daily_budget": daily_budget,
-                "gasto": gasto,
-                "valor_conversao": valor_conversao,
-                "lucro": lucro
-            })
-    
-    log_message(f"Campanha ABO {campaign_id}: {adsets_ativos} adsets ativos, orçamento total: R$ {total_orcamento:.2f}")
-    
-    lucro = total_conversao - total_gasto
-    roas = round(total_conversao / total_gasto, 2) if total_gasto > 0 else 0
-    
-    # Classificação baseada no lucro
-    if lucro < LIMITE_LUCRO_BAIXO:
-        classificacao = "BAIXO"
-    elif lucro >= LIMITE_LUCRO_ALTO:
-        classificacao = "ALTO"
-    else:
-        classificacao = "MÉDIO"
-    
-    return {
-        "id_conta": ad_account,
-        "id_campanha": campaign_id,
-        "nome_campanha": campanha["name"],
-        "tipo_campanha": "ABO",
-        "orcamento_diario": total_orcamento,
-        "gasto": total_gasto,
-        "valor_conversao": total_conversao,
-        "roas": roas,
-        "lucro": lucro,
-        "classificacao": classificacao,
-        "adsets_info": adsets_info,
-        "detalhes_adsets": f"{adsets_ativos} adsets ativos"
-    }
-
-def processar_dados_campanhas(campanhas, insights, ad_account, date_preset=None, start_date=None, end_date=None):
-    """Processa dados das campanhas, detectando automaticamente se são CBO ou ABO"""
-    campanhas_filtradas = []
-    
-    for campanha in campanhas:
-        if campanha.get("status", "").upper().strip() == "ACTIVE":
-            tipo_campanha = detectar_tipo_campanha(campanha, ad_account)
-            
-            if tipo_campanha == "ABO":
-                # Processar como ABO
-                dados_campanha = processar_campanha_abo(campanha, ad_account, date_preset, start_date, end_date)
-                campanhas_filtradas.append(dados_campanha)
-                # Armazenar dados completos para uso posterior
-                campanhas_completas_data[campanha["id"]] = dados_campanha
-            else:
-                # Processar como CBO (código original)
-                insight = next((i for i in insights if i.get("campaign_id") == campanha.get("id")), None)
-                
-                if insight:
-                    gasto = float(insight.get("spend", 0))
-                    valor_conversao = sum(
-                        float(a.get("value", 0))
-                        for a in insight.get("action_values", [])
-                        if a.get("action_type") in ['offsite_conversion.purchase', 'offsite_conversion.fb_pixel_purchase']
-                    )
-                else:
-                    gasto = 0.0
-                    valor_conversao = 0.0
-                
-                daily_budget = float(campanha.get("daily_budget", 0)) / 100
-                lucro = valor_conversao - gasto
-                roas = round(valor_conversao / gasto, 2) if gasto > 0 else 0
-                
-                # Classificação baseada no lucro
-                if lucro < LIMITE_LUCRO_BAIXO:
-                    classificacao = "BAIXO"
-                elif lucro >= LIMITE_LUCRO_ALTO:
-                    classificacao = "ALTO"
-                else:
-                    classificacao = "MÉDIO"
-                
-                dados_campanha = {
-                    "id_conta": ad_account,
-                    "id_campanha": campanha["id"],
-                    "nome_campanha": campanha["name"],
-                    "tipo_campanha": "CBO",
-                    "orcamento_diario": daily_budget,
-                    "gasto": gasto,
-                    "valor_conversao": valor_conversao,
-                    "roas": roas,
-                    "lucro": lucro,
-                    "classificacao": classificacao,
-                    "adsets_info": None,
-                    "detalhes_adsets": "N/A"
-                }
-                
-                campanhas_filtradas.append(dados_campanha)
-                campanhas_completas_data[campanha["id"]] = dados_campanha
-    
-    return campanhas_filtradas
-
-def salvar_campanhas_excel(campanhas):
-    if not os.path.exists(SPREADSHEET_PATH):
-        criar_planilha()
-    
-    try:
-        workbook = openpyxl.load_workbook(SPREADSHEET_PATH)
-        sheet = workbook["CAMPANHAS"]
-        
-        for campanha in campanhas:
-            sheet.append([
-                campanha["id_conta"],
-                campanha["id_campanha"],
-                campanha["nome_campanha"],
-                campanha.get("tipo_campanha", "CBO"),
-                campanha["orcamento_diario"],
-                campanha["gasto"],
-                campanha["valor_conversao"],
-                campanha["roas"],
-                campanha["lucro"],
-                "",  # Novo orçamento
-                campanha["classificacao"],
-                campanha.get("detalhes_adsets", "")
-            ])
-        
-        workbook.save(SPREADSHEET_PATH)
-        log_message(f"Dados de {len(campanhas)} campanhas salvos na planilha.")
-    except Exception as e:
-        log_message(f"[ERRO] Falha ao salvar planilha: {e}")
-
-def atualizar_orcamento_adset(adset_id, novo_orcamento):
-    """Atualiza o orçamento de um ad set específico"""
-    url = f"https://graph.facebook.com/v17.0/{adset_id}"
-    payload = {
-        "daily_budget": int(novo_orcamento * 100),
-        "access_token": ACCESS_TOKEN
-    }
-    
-    try:
-        log_message(f"Atualizando orçamento do AdSet {adset_id} para R$ {novo_orcamento:.2f}")
-        response = requests.post(url, data=payload)
-        result = response.json()
-        
-        if result.get("success"):
-            log_message(f"Orçamento do AdSet {adset_id} atualizado com sucesso")
-            return True
-        else:
-            erro_msg = result.get('error', {}).get('message', 'Erro desconhecido')
-            log_message(f"[ERRO] Falha ao atualizar AdSet {adset_id}: {erro_msg}")
-            return False
-    except requests.exceptions.RequestException as e:
-        log_message(f"[ERRO] Erro na requisição para atualizar AdSet {adset_id}: {e}")
-        return False
-
-def atualizar_orcamento_facebook(id_campanha, novo_orcamento):
-    """Atualiza o orçamento de campanhas CBO"""
-    url = f"https://graph.facebook.com/v17.0/{id_campanha}"
-    payload = {
-        "daily_budget": int(novo_orcamento * 100),
-        "access_token": ACCESS_TOKEN
-    }
-    try:
-        log_message(f"Enviando atualização de orçamento para campanha {id_campanha}")
-        response = requests.post(url, data=payload)
-        result = response.json()
-        log_message(f"Resposta da API: {result}")
-        if result.get("success"):
-            log_message(f"Orçamento atualizado para a campanha {id_campanha}: R$ {novo_orcamento:.2f}")
-            return True
-        else:
-            log_message(f"[ERRO] Falha ao atualizar campanha {id_campanha}: {result.get('error', {}).get('message')}")
-            return False
-    except requests.exceptions.RequestException as e:
-        log_message(f"[ERRO] Erro na requisição para atualizar orçamento: {e}")
-        return False
-
-def calcular_orcamento_total():
-    try:
-        workbook = openpyxl.load_workbook(SPREADSHEET_PATH)
-        sheet = workbook["CAMPANHAS"]
-        total = 0
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            novo_orcamento = row[9] if row[9] is not None and row[9] != "" else row[4]
-            total += novo_orcamento
-        return total
-    except Exception as e:
-        log_message(f"[ERRO] Falha ao calcular orçamento total: {e}")
-        return 0
-
-def realocar_orcamentos():
-    """Realoca orçamentos entre unidades de baixo e alto lucro (CBO + AdSets ABO)"""
-    if not os.path.exists(SPREADSHEET_PATH):
-        log_message("[ERRO] Planilha de campanhas não encontrada.")
-        return False
-    
-    workbook = openpyxl.load_workbook(SPREADSHEET_PATH)
-    if "CAMPANHAS" not in workbook.sheetnames:
-        log_message("[ERRO] Aba 'CAMPANHAS' não encontrada na planilha.")
-        return False
-    
-    sheet = workbook["CAMPANHAS"]
+def planejar_realocacao():
+    """
+    Calcula a realocação entre unidades de baixo e alto lucro sem alterar nada na Graph API.
+    Os aumentos distribuem o total das reduções calculadas.
     
-    # Lista unificada de unidades para reduzir e aumentar
-    unidades_baixo_lucro = []
-    unidades_alto_lucro = []
+    Returns:
+        tuple: (decisoes_reducao, decisoes_aumento), com decisões no formato
+               (unidade, id_objeto, orcamento_anterior, novo_orcamento, variacao_real),
+               ou None se não houver unidades suficientes
+    """
+    # Lista unificada de unidades candidatas (campanhas CBO + AdSets ABO individuais)
+    candidatas = []
     
-    # Processar todas as campanhas
-    for row_index, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-        id_campanha = row[1]
-        nome_campanha = row[2]
-        tipo_campanha = row[3] if len(row) > 3 else "CBO"
-        orcamento = row[4]
-        lucro = row[8]
-        
-        if tipo_campanha == "ABO":
+    for campanha in campanhas_execucao:
+        if campanha.tipo_campanha == "ABO" and campanha.adsets_info:
             # Para ABO, processar cada AdSet individualmente
-            campanha_completa = campanhas_completas_data.get(id_campanha)
-            if campanha_completa and campanha_completa.get("adsets_info"):
-                log_message(f"Analisando AdSets da campanha ABO: {nome_campanha}")
-                
-                for adset in campanha_completa["adsets_info"]:
-                    adset_lucro = adset.get('lucro', 0)
-                    
-                    unidade = {
-                        "tipo": "ABO_ADSET",
-                        "linha_index": row_index,
-                        "id_campanha": id_campanha,
-                        "id_adset": adset['adset_id'],
-                        "nome": f"{nome_campanha} - {adset['adset_name']}",
-                        "nome_campanha": nome_campanha,
-                        "orcamento_atual": adset['daily_budget'],
-                        "lucro": adset_lucro,
-                        "adset_info": adset,
-                        "campanha_info": campanha_completa
-                    }
-                    
-                    if adset_lucro < LIMITE_LUCRO_BAIXO:
-                        unidades_baixo_lucro.append(unidade)
-                    elif adset_lucro >= LIMITE_LUCRO_ALTO:
-                        unidades_alto_lucro.append(unidade)
-        else:
-            # Para CBO, usar a campanha inteira
-            if lucro is not None:
-                unidade = {
-                    "tipo": "CBO",
-                    "linha_index": row_index,
-                    "id_campanha": id_campanha,
-                    "nome": nome_campanha,
-                    "nome_campanha": nome_campanha,
-                    "orcamento_atual": orcamento,
-                    "lucro": lucro
-                }
-                
-                if lucro < LIMITE_LUCRO_BAIXO:
-                    unidades_baixo_lucro.append(unidade)
-                elif lucro >= LIMITE_LUCRO_ALTO:
-                    unidades_alto_lucro.append(unidade)
+            log_message(f"Analisando AdSets da campanha ABO: {campanha.nome_campanha}")
+        
+        # As unidades apontam para os registros da coleta, sem copiar os dados
+        candidatas.extend(registros.unidades_da_campanha(campanha))
     
-    # Ordenar unidades
-    unidades_baixo_lucro.sort(key=lambda x: x["lucro"])  # Piores primeiro
-    unidades_alto_lucro.sort(key=lambda x: x["lucro"], reverse=True)  # Melhores primeiro
+    # Classificar e ordenar todas as unidades de uma vez
+    candidatas = metricas_unidades.TabelaUnidades(candidatas)
+    classificacoes = candidatas.classificar(dinheiro.centavos(LIMITE_LUCRO_BAIXO), dinheiro.centavos(LIMITE_LUCRO_ALTO))
+    baixo_lucro = candidatas.selecionar(classificacoes == metricas_unidades.BAIXO).ordenar_por_lucro()  # Piores primeiro
+    alto_lucro = candidatas.selecionar(classificacoes == metricas_unidades.ALTO).ordenar_por_lucro(decrescente=True)  # Melhores primeiro
     
     log_message(f"[INFO] Unidades identificadas:")
-    log_message(f"- Com lucro baixo (< R$ {LIMITE_LUCRO_BAIXO:.2f}): {len(unidades_baixo_lucro)}")
-    log_message(f"  - Campanhas CBO: {sum(1 for u in unidades_baixo_lucro if u['tipo'] == 'CBO')}")
-    log_message(f"  - AdSets ABO: {sum(1 for u in unidades_baixo_lucro if u['tipo'] == 'ABO_ADSET')}")
-    log_message(f"- Com lucro alto (>= R$ {LIMITE_LUCRO_ALTO:.2f}): {len(unidades_alto_lucro)}")
-    log_message(f"  - Campanhas CBO: {sum(1 for u in unidades_alto_lucro if u['tipo'] == 'CBO')}")
-    log_message(f"  - AdSets ABO: {sum(1 for u in unidades_alto_lucro if u['tipo'] == 'ABO_ADSET')}")
+    log_message(f"- Com lucro baixo (< R$ {LIMITE_LUCRO_BAIXO:.2f}): {len(baixo_lucro)}")
+    log_message(f"  - Campanhas CBO: {int((~baixo_lucro.adset).sum())}")
+    log_message(f"  - AdSets ABO: {int(baixo_lucro.adset.sum())}")
+    log_message(f"- Com lucro alto (>= R$ {LIMITE_LUCRO_ALTO:.2f}): {len(alto_lucro)}")
+    log_message(f"  - Campanhas CBO: {int((~alto_lucro.adset).sum())}")
+    log_message(f"  - AdSets ABO: {int(alto_lucro.adset.sum())}")
+    
+    if not len(baixo_lucro) or not len(alto_lucro):
+        log_message("Não há unidades suficientes para realocação.")
+        return None
     
+    # Conferir os orçamentos atuais antes de calcular as alterações, numa única leitura
+    # para os dois grupos, que depois são separados de novo (mantendo a ordem de cada um)
+    conferidas = {
+        id(unidade) for unidade in operacoes_orcamento.conferir_orcamentos_atuais(
+            baixo_lucro.unidades + alto_lucro.unidades, ACCESS_TOKEN, ignoradas=unidades_ignoradas
+        )
+    }
+    unidades_baixo_lucro = [unidade for unidade in baixo_lucro.unidades if id(unidade) in conferidas]
+    unidades_alto_lucro = [unidade for unidade in alto_lucro.unidades if id(unidade) in conferidas]
     if not unidades_baixo_lucro or not unidades_alto_lucro:
         log_message("Não há unidades suficientes para realocação.")
-        return False
+        return None
+    
+    # Calcular as reduções (em centavos) de todas as unidades antes de enviar as atualizações;
+    # AdSets ABO têm piso próprio e ficam de fora quando não há redução real
+    tabela = metricas_unidades.TabelaUnidades(unidades_baixo_lucro)
+    minimos = np.where(tabela.adset, dinheiro.centavos(MINIMO_ORCAMENTO_ABO), dinheiro.centavos(MINIMO_ORCAMENTO))
+    reducoes = dinheiro.aplicar_percentual(tabela.orcamento, PERCENTUAL_REALOCACAO)
+    novos_orcamentos = metricas_unidades.limitar(tabela.orcamento - reducoes, minimos)
+    reducoes_reais = tabela.orcamento - novos_orcamentos
+    decisoes_reducao = [
+        (tabela.unidades[i], tabela.ids[i], tabela.orcamento[i].item(), novos_orcamentos[i].item(), reducoes_reais[i].item())
+        for i in np.flatnonzero(~tabela.adset | (reducoes_reais > 0))
+    ]
     
+    total_planejado = sum(reducao_real for *_, reducao_real in decisoes_reducao)
+    decisoes_aumento = calcular_aumentos(unidades_alto_lucro, total_planejado) if total_planejado > 0 else []
+    return decisoes_reducao, decisoes_aumento
+
+def calcular_aumentos(unidades, total):
+    """
+    Distribui total (centavos) entre as unidades proporcionalmente ao lucro, centavo a
+    centavo (as partes somam exatamente o total); AdSets ABO ficam de fora quando não há
+    aumento real
+    
+    Returns:
+        list: decisões (unidade, id_objeto, orcamento_anterior, novo_orcamento, incremento_real)
+    """
+    tabela = metricas_unidades.TabelaUnidades(unidades)
+    incrementos = tabela.partes_proporcionais(total)
+    novos_orcamentos = metricas_unidades.limitar(tabela.orcamento + incrementos, maximo=dinheiro.centavos(MAXIMO_ORCAMENTO))
+    incrementos_reais = novos_orcamentos - tabela.orcamento
+    return [
+        (tabela.unidades[i], tabela.ids[i], tabela.orcamento[i].item(), novos_orcamentos[i].item(), incrementos_reais[i].item())
+        for i in np.flatnonzero(~tabela.adset | (incrementos_reais > 0))
+    ]
+
+def itens_do_plano(decisoes_reducao, decisoes_aumento):
+    """Itens do plano (plano_orcamento) com o motivo de cada redução e aumento"""
+    itens = [
+        plano_orcamento.novo_item(
+            "reducao", unidade, novo_orcamento,
+            f"Lucro baixo de R$ {dinheiro.formatar(unidade.valor_conversao - unidade.gasto)} (abaixo de R$ {LIMITE_LUCRO_BAIXO:.2f}): "
+            f"redução de {PERCENTUAL_REALOCACAO * 100:g}% (-R$ {dinheiro.formatar(reducao_real)})"
+        )
+        for unidade, _, _, novo_orcamento, reducao_real in decisoes_reducao
+    ]
+    itens += [
+        plano_orcamento.novo_item(
+            "aumento", unidade, novo_orcamento,
+            f"Lucro alto de R$ {dinheiro.formatar(unidade.valor_conversao - unidade.gasto)} (a partir de R$ {LIMITE_LUCRO_ALTO:.2f}): "
+            f"+R$ {dinheiro.formatar(incremento_real)} da verba reduzida, proporcional ao lucro"
+        )
+        for unidade, _, _, novo_orcamento, incremento_real in decisoes_aumento
+    ]
+    return itens
+
+def aplicar_realocacao(decisoes_reducao, decisoes_aumento, total_planejado=None):
+    """
+    Envia as alterações calculadas em planejar_realocacao, registra o resultado e avisa no
+    WhatsApp. Se o valor efetivamente reduzido for diferente do total_planejado sobre o qual
+    os aumentos foram calculados (reduções com falha ou deixadas de fora), os aumentos são
+    recalculados sobre o valor reduzido, para a realocação nunca aumentar o orçamento total.
+    """
     # Reduzir orçamentos das unidades com baixo lucro
     total_reducao = 0
     unidades_reduzidas = []
     campanhas_abo_modificadas = {}  # Para rastrear mudanças nas campanhas ABO
     
-    for unidade in unidades_baixo_lucro:
-        if unidade["tipo"] == "ABO_ADSET":
-            # Reduzir AdSet ABO
-            adset = unidade["adset_info"]
-            reducao = adset['daily_budget'] * PERCENTUAL_REALOCACAO
-            novo_orcamento = max(adset['daily_budget'] - reducao, MINIMO_ORCAMENTO_ABO)
-            reducao_real = adset['daily_budget'] - novo_orcamento
-            
-            if reducao_real > 0 and atualizar_orcamento_adset(unidade["id_adset"], novo_orcamento):
-                total_reducao += reducao_real
-                unidades_reduzidas.append({
-                    "nome": unidade['nome'],
-                    "tipo": "ABO AdSet",
-                    "reducao": reducao_real,
-                    "de": adset['daily_budget'],
-                    "para": novo_orcamento
-                })
-                
-                # Rastrear mudanças na campanha
-                if unidade["id_campanha"] not in campanhas_abo_modificadas:
-                    campanhas_abo_modificadas[unidade["id_campanha"]] = {
-                        "linha_index": unidade["linha_index"],
-                        "orcamento_original": unidade["campanha_info"]["orcamento_diario"],
-                        "mudanca_total": 0
-                    }
-                campanhas_abo_modificadas[unidade["id_campanha"]]["mudanca_total"] -= reducao_real
-                
-        else:  # CBO
-            # Reduzir campanha CBO
-            reducao = unidade["orcamento_atual"] * PERCENTUAL_REALOCACAO
-            novo_orcamento = max(unidade["orcamento_atual"] - reducao, MINIMO_ORCAMENTO)
-            reducao_real = unidade["orcamento_atual"] - novo_orcamento
-            
-            if atualizar_orcamento_facebook(unidade["id_campanha"], novo_orcamento):
-                total_reducao += reducao_real
-                sheet.cell(row=unidade["linha_index"], column=10).value = novo_orcamento
-                unidades_reduzidas.append({
-                    "nome": unidade['nome'],
-                    "tipo": "CBO",
-                    "reducao": reducao_real,
-                    "de": unidade["orcamento_atual"],
-                    "para": novo_orcamento
-                })
+    # Enviar as reduções pelo endpoint batch
+    resultados = operacoes_orcamento.atualizar_orcamentos_em_lote([
+        (unidade.tipo, id_objeto, novo_orcamento, unidade.campanha_info.id_conta)
+        for unidade, id_objeto, _, novo_orcamento, _ in decisoes_reducao
+    ], ACCESS_TOKEN)
+    
+    for (unidade, _, orcamento_anterior, novo_orcamento, reducao_real), sucesso in zip(decisoes_reducao, resultados):
+        if not sucesso:
+            continue
+        
+        unidade.definir_novo_orcamento(novo_orcamento)
+        total_reducao += reducao_real
+        unidades_reduzidas.append({
+            "nome": unidade.nome,
+            "tipo": "ABO AdSet" if unidade.tipo == "ABO_ADSET" else "CBO",
+            "reducao": reducao_real,
+            "de": orcamento_anterior,
+            "para": novo_orcamento
+        })
+        
+        if unidade.tipo == "ABO_ADSET":
+            # Rastrear mudanças na campanha
+            if unidade.id_campanha not in campanhas_abo_modificadas:
+                campanhas_abo_modificadas[unidade.id_campanha] = {
+                    "campanha": unidade.campanha_info,
+                    "orcamento_original": unidade.campanha_info.orcamento_diario,
+                    "mudanca_total": 0
+                }
+            campanhas_abo_modificadas[unidade.id_campanha]["mudanca_total"] -= reducao_real
     
     # Distribuir o valor reduzido entre as unidades com alto lucro
     unidades_aumentadas = []
     
-    if total_reducao > 0 and unidades_alto_lucro:
-        soma_lucro_alto = sum(u["lucro"] for u in unidades_alto_lucro)
-        
-        for unidade in unidades_alto_lucro:
-            # Distribuir proporcionalmente ao lucro
-            proporcao = unidade["lucro"] / soma_lucro_alto if soma_lucro_alto > 0 else 1.0 / len(unidades_alto_lucro)
-            incremento = total_reducao * proporcao
+    if total_planejado is None:
+        total_planejado = sum(reducao_real for *_, reducao_real in decisoes_reducao)
+    if total_reducao != total_planejado and decisoes_aumento:
+        log_message(f"[AVISO] Reduções aplicadas somam R$ {dinheiro.formatar(total_reducao)} de R$ {dinheiro.formatar(total_planejado)} calculados. "
+                    f"Aumentos recalculados sobre o valor reduzido")
+        unidades_alto_lucro = [unidade for unidade, *_ in decisoes_aumento]
+        decisoes_aumento = calcular_aumentos(unidades_alto_lucro, total_reducao) if total_reducao > 0 else []
+    
+    if total_reducao > 0 and decisoes_aumento:
+        # Enviar os aumentos pelo endpoint batch
+        resultados = operacoes_orcamento.atualizar_orcamentos_em_lote([
+            (unidade.tipo, id_objeto, novo_orcamento, unidade.campanha_info.id_conta)
+            for unidade, id_objeto, _, novo_orcamento, _ in decisoes_aumento
+        ], ACCESS_TOKEN)
+        
+        for (unidade, _, orcamento_anterior, novo_orcamento, incremento_real), sucesso in zip(decisoes_aumento, resultados):
+            if not sucesso:
+                continue
             
-            if unidade["tipo"] == "ABO_ADSET":
-                # Aumentar AdSet ABO
-                adset = unidade["adset_info"]
-                novo_orcamento = min(adset['daily_budget'] + incremento, MAXIMO_ORCAMENTO)
-                incremento_real = novo_orcamento - adset['daily_budget']
-                
-                if incremento_real > 0 and atualizar_orcamento_adset(unidade["id_adset"], novo_orcamento):
-                    unidades_aumentadas.append({
-                        "nome": unidade['nome'],
-                        "tipo": "ABO AdSet",
-                        "aumento": incremento_real,
-                        "de": adset['daily_budget'],
-                        "para": novo_orcamento
-                    })
-                    
-                    # Rastrear mudanças na campanha
-                    if unidade["id_campanha"] not in campanhas_abo_modificadas:
-                        campanhas_abo_modificadas[unidade["id_campanha"]] = {
-                            "linha_index": unidade["linha_index"],
-                            "orcamento_original": unidade["campanha_info"]["orcamento_diario"],
-                            "mudanca_total": 0
-                        }
-                    campanhas_abo_modificadas[unidade["id_campanha"]]["mudanca_total"] += incremento_real
-                    
-            else:  # CBO
-                # Aumentar campanha CBO
-                novo_orcamento = min(unidade["orcamento_atual"] + incremento, MAXIMO_ORCAMENTO)
-                incremento_real = novo_orcamento - unidade["orcamento_atual"]
-                
-                if atualizar_orcamento_facebook(unidade["id_campanha"], novo_orcamento):
-                    sheet.cell(row=unidade["linha_index"], column=10).value = novo_orcamento
-                    unidades_aumentadas.append({
-                        "nome": unidade['nome'],
-                        "tipo": "CBO",
-                        "aumento": incremento_real,
-                        "de": unidade["orcamento_atual"],
-                        "para": novo_orcamento
-                    })
+            unidade.definir_novo_orcamento(novo_orcamento)
+            unidades_aumentadas.append({
+                "nome": unidade.nome,
+                "tipo": "ABO AdSet" if unidade.tipo == "ABO_ADSET" else "CBO",
+                "aumento": incremento_real,
+                "de": orcamento_anterior,
+                "para": novo_orcamento
+            })
+            
+            if unidade.tipo == "ABO_ADSET":
+                # Rastrear mudanças na campanha
+                if unidade.id_campanha not in campanhas_abo_modificadas:
+                    campanhas_abo_modificadas[unidade.id_campanha] = {
+                        "campanha": unidade.campanha_info,
+                        "orcamento_original": unidade.campanha_info.orcamento_diario,
+                        "mudanca_total": 0
+                    }
+                campanhas_abo_modificadas[unidade.id_campanha]["mudanca_total"] += incremento_real
     
     # Atualizar orçamentos totais das campanhas ABO na planilha
     for id_campanha, info in campanhas_abo_modificadas.items():
         novo_orcamento_total = info["orcamento_original"] + info["mudanca_total"]
-        sheet.cell(row=info["linha_index"], column=10).value = novo_orcamento_total
+        info["campanha"].novo_orcamento = novo_orcamento_total
     
-    # Salvar planilha
-    workbook.save(SPREADSHEET_PATH)
     
     # Calcular orçamento total atual
-    total_orcamento_atual = calcular_orcamento_total()
+    total_orcamento_atual = operacoes_orcamento.calcular_orcamento_total(campanhas_execucao)
     
     # Preparar mensagem detalhada
     mensagem = (
@@ -600,14 +305,14 @@ def realocar_orcamentos():
         f"• Percentual: {int(PERCENTUAL_REALOCACAO * 100)}%\n\n"
         f"📉 REDUÇÕES ({len(unidades_reduzidas)} unidades)\n"
         f"{'='*30}\n"
-        f"💰 Total reduzido: R$ {total_reducao:.2f}\n\n"
+        f"💰 Total reduzido: R$ {dinheiro.formatar(total_reducao)}\n\n"
     )
     
     # Top 5 reduções
     unidades_reduzidas.sort(key=lambda x: x['reducao'], reverse=True)
     for i, u in enumerate(unidades_reduzidas[:5]):
         mensagem += f"{i+1}. {u['nome'][:40]}... ({u['tipo']})\n"
-        mensagem += f"   R$ {u['de']:.2f} → R$ {u['para']:.2f} (-R$ {u['reducao']:.2f})\n\n"
+        mensagem += f"   R$ {dinheiro.formatar(u['de'])} → R$ {dinheiro.formatar(u['para'])} (-R$ {dinheiro.formatar(u['reducao'])})\n\n"
     
     if len(unidades_reduzidas) > 5:
         mensagem += f"... e mais {len(unidades_reduzidas) - 5} unidades\n\n"
@@ -615,14 +320,14 @@ def realocar_orcamentos():
     mensagem += (
         f"📈 AUMENTOS ({len(unidades_aumentadas)} unidades)\n"
         f"{'='*30}\n"
-        f"💰 Total distribuído: R$ {sum(u['aumento'] for u in unidades_aumentadas):.2f}\n\n"
+        f"💰 Total distribuído: R$ {dinheiro.formatar(sum(u['aumento'] for u in unidades_aumentadas))}\n\n"
     )
     
     # Top 5 aumentos
     unidades_aumentadas.sort(key=lambda x: x['aumento'], reverse=True)
     for i, u in enumerate(unidades_aumentadas[:5]):
         mensagem += f"{i+1}. {u['nome'][:40]}... ({u['tipo']})\n"
-        mensagem += f"   R$ {u['de']:.2f} → R$ {u['para']:.2f} (+R$ {u['aumento']:.2f})\n\n"
+        mensagem += f"   R$ {dinheiro.formatar(u['de'])} → R$ {dinheiro.formatar(u['para'])} (+R$ {dinheiro.formatar(u['aumento'])})\n\n"
     
     if len(unidades_aumentadas) > 5:
         mensagem += f"... e mais {len(unidades_aumentadas) - 5} unidades\n\n"
@@ -630,16 +335,18 @@ def realocar_orcamentos():
     mensagem += (
         f"📊 ESTATÍSTICAS FINAIS\n"
         f"{'='*30}\n"
-        f"• Orçamento total: R$ {total_orcamento_atual:.2f}\n"
+        f"• Orçamento total: R$ {dinheiro.formatar(total_orcamento_atual)}\n"
         f"• Unidades CBO reduzidas: {sum(1 for u in unidades_reduzidas if u['tipo'] == 'CBO')}\n"
         f"• AdSets ABO reduzidos: {sum(1 for u in unidades_reduzidas if u['tipo'] == 'ABO AdSet')}\n"
         f"• Unidades CBO aumentadas: {sum(1 for u in unidades_aumentadas if u['tipo'] == 'CBO')}\n"
         f"• AdSets ABO aumentados: {sum(1 for u in unidades_aumentadas if u['tipo'] == 'ABO AdSet')}\n"
     )
     
+    mensagem += operacoes_orcamento.relatorio_ignoradas(unidades_ignoradas)
+    
     # Log resumo
     log_message("[RESUMO] Realocação concluída:")
-    log_message(f"[RESUMO] Total reduzido: R$ {total_reducao:.2f}")
+    log_message(f"[RESUMO] Total reduzido: R$ {dinheiro.formatar(total_reducao)}")
     log_message(f"[RESUMO] Unidades reduzidas: {len(unidades_reduzidas)}")
     log_message(f"[RESUMO] Unidades aumentadas: {len(unidades_aumentadas)}")
     
@@ -654,6 +361,13 @@ def realocar_orcamentos():
     log_message("Processo de realocação concluído com sucesso!")
     return True
 
+def realocar_orcamentos():
+    """Realoca orçamentos entre unidades de baixo e alto lucro (CBO + AdSets ABO)"""
+    decisoes = planejar_realocacao()
+    if decisoes is None:
+        return False
+    return aplicar_realocacao(*decisoes)
+
 def limpar_mensagem_whatsapp(mensagem):
     """Remove caracteres especiais e emojis que podem causar problemas no WhatsApp Web"""
     import re
@@ -832,9 +546,9 @@ def enviar_mensagem_whatsapp(grupo, mensagem_original):
             except:
                 pass
 
-def run(token, accounts, group, logs, date_range='today', start_date=None, end_date=None, low_profit=None, high_profit=None, realloc_pct=None, abo_accounts=None):
+def run(token, accounts, group, logs, date_range='today', start_date=None, end_date=None, low_profit=None, high_profit=None, realloc_pct=None, abo_accounts=None, modo="executar"):
     """
-    Função principal com suporte a ABO
+    Função principal com suporte a ABO; modo "planejar" só grava o plano em PLANO_PATH
     """
     global ACCESS_TOKEN, AD_ACCOUNTS, WHATSAPP_GROUP, DATE_PRESET, LIMITE_LUCRO_BAIXO, LIMITE_LUCRO_ALTO, PERCENTUAL_REALOCACAO, logs_list, ABO_ACCOUNTS
     
@@ -842,6 +556,8 @@ def run(token, accounts, group, logs, date_range='today', start_date=None, end_d
     AD_ACCOUNTS = accounts if accounts is not None else []
     WHATSAPP_GROUP = group
     logs_list = logs
+    graph_client.configurar_log(log_message)
+    graph_client.iniciar_execucao()
     
     # Definir contas ABO se fornecidas
     if abo_accounts:
@@ -854,14 +570,11 @@ def run(token, accounts, group, logs, date_range='today', start_date=None, end_d
                 log_message(f"Conta ABO {conta_abo} adicionada à lista de processamento")
     
     # Limpar dados de campanhas anteriores
-    global campanhas_completas_data
-    campanhas_completas_data = {}
+    global campanhas_execucao, unidades_ignoradas
+    campanhas_execucao = []
+    unidades_ignoradas = []
     
-    if date_range == 'custom' and start_date and end_date:
-        DATE_PRESET = None
-    else:
-        presets = {'today': 'today', 'yesterday': 'yesterday', 'last7': 'last_7d'}
-        DATE_PRESET = presets.get(date_range, 'today')
+    DATE_PRESET, data_inicio, data_fim = snapshot_campanhas.resolver_periodo(date_range, start_date, end_date)
     
     if low_profit is not None:
         LIMITE_LUCRO_BAIXO = float(low_profit)
@@ -876,68 +589,23 @@ def run(token, accounts, group, logs, date_range='today', start_date=None, end_d
     log_message(f"Contas ABO configuradas: {ABO_ACCOUNTS}")
     
     try:
-        limpar_planilha()
-        todas_campanhas = []
-        
-        # Processar TODAS as contas (incluindo ABO)
-        for ad_account in AD_ACCOUNTS:
-            tipo_conta = "ABO" if ad_account in ABO_ACCOUNTS else "CBO"
-            log_message(f"Processando conta de anúncio {tipo_conta}: {ad_account}")
-            log_message(f"Buscando campanhas para conta {ad_account}...")
-            
-            campaigns_url = f"https://graph.facebook.com/v17.0/{ad_account}/campaigns?fields=id,name,daily_budget,status&access_token={ACCESS_TOKEN}"
-            
-            if date_range == 'custom' and start_date and end_date:
-                insights_url = (
-                    f"https://graph.facebook.com/v17.0/{ad_account}/insights?fields=campaign_id,campaign_name,spend,action_values"
-                    f"&time_range[since]={start_date}&time_range[until]={end_date}&level=campaign&access_token={ACCESS_TOKEN}"
-                )
-            else:
-                insights_url = (
-                    f"https://graph.facebook.com/v17.0/{ad_account}/insights?fields=campaign_id,campaign_name,spend,action_values"
-                    f"&date_preset={DATE_PRESET}&level=campaign&access_token={ACCESS_TOKEN}"
-                )
-            
-            campaigns = buscar_todos_dados_facebook(campaigns_url)
-            log_message(f"Encontradas {len(campaigns)} campanhas.")
-            
-            insights = buscar_todos_dados_facebook(insights_url)
-            log_message(f"Encontrados {len(insights)} insights.")
-            
-            # Processar campanhas com suporte a ABO
-            campanhas_processadas = processar_dados_campanhas(
-                campaigns, insights, ad_account,
-                DATE_PRESET if DATE_PRESET else None,
-                start_date if date_range == 'custom' else None,
-                end_date if date_range == 'custom' else None
-            )
-            
-            log_message(f"Processadas {len(campanhas_processadas)} campanhas ativas.")
-            
-            # Log detalhado para campanhas ABO
-            if ad_account in ABO_ACCOUNTS:
-                campanhas_abo_desta_conta = [c for c in campanhas_processadas if c.get("tipo_campanha") == "ABO"]
-                if campanhas_abo_desta_conta:
-                    for camp in campanhas_abo_desta_conta:
-                        log_message(f"  - Campanha ABO: {camp['nome_campanha']} com {len(camp.get('adsets_info', []))} adsets")
-            
-            todas_campanhas.extend(campanhas_processadas)
-        
-        log_message(f"Total de {len(todas_campanhas)} campanhas ativas encontradas.")
-        
-        # Contar campanhas por tipo
-        campanhas_cbo = [c for c in todas_campanhas if c.get("tipo_campanha") == "CBO"]
-        campanhas_abo = [c for c in todas_campanhas if c.get("tipo_campanha") == "ABO"]
-        log_message(f"Campanhas CBO: {len(campanhas_cbo)}, Campanhas ABO: {len(campanhas_abo)}")
-        
-        # Log detalhado de campanhas ABO
-        if campanhas_abo:
-            total_adsets = sum(len(c.get("adsets_info", [])) for c in campanhas_abo)
-            log_message(f"Total de AdSets em campanhas ABO: {total_adsets}")
+        snapshot, todas_campanhas = operacoes_orcamento.obter_campanhas(
+            ACCESS_TOKEN, AD_ACCOUNTS, ABO_ACCOUNTS, DATE_PRESET, data_inicio, data_fim
+        )
+        classificar_campanhas(todas_campanhas)
+        campanhas_execucao = todas_campanhas
         
-        salvar_campanhas_excel(todas_campanhas)
+        if modo == "planejar":
+            return salvar_plano(snapshot)
         
-        resultado = realocar_orcamentos()
+        try:
+            resultado = realocar_orcamentos()
+        finally:
+            # Exportar o resultado uma única vez, já com os novos orçamentos; também se a
+            # execução for interrompida, para registrar as alterações já enviadas
+            operacoes_orcamento.salvar_resultado(
+                SPREADSHEET_PATH, campanhas_execucao, SAIDAS, "realocacao", snapshot.criado_em, com_classificacao=True
+            )
         return resultado
         
     except Exception as e:
@@ -946,22 +614,76 @@ def run(token, accounts, group, logs, date_range='today', start_date=None, end_d
         log_message(traceback.format_exc())
         return False
 
-if __name__ == "__main__":
-    limpar_planilha()
-    todas_campanhas = []
+def salvar_plano(snapshot):
+    """Calcula a realocação sem alterar nenhum orçamento e grava o plano em PLANO_PATH"""
+    decisoes = planejar_realocacao()
+    operacoes_orcamento.salvar_plano(
+        PLANO_PATH, "realocacao", snapshot,
+        {"LIMITE_LUCRO_BAIXO": LIMITE_LUCRO_BAIXO, "LIMITE_LUCRO_ALTO": LIMITE_LUCRO_ALTO, "PERCENTUAL_REALOCACAO": PERCENTUAL_REALOCACAO},
+        itens_do_plano(*decisoes) if decisoes else [],
+        campanhas_execucao
+    )
+    return decisoes is not None
+
+def aplicar_plano(token, group, logs):
+    """
+    Aplica o plano gravado em PLANO_PATH sem coletar nem recalcular (ver
+    operacoes_orcamento.preparar_aplicacao)
     
-    for ad_account in AD_ACCOUNTS:
-        log_message(f"[INFO] Processando conta de anúncio: {ad_account}")
-        campaigns_url = f"https://graph.facebook.com/v17.0/{ad_account}/campaigns?fields=id,name,daily_budget,status&access_token={ACCESS_TOKEN}"
-        insights_url = f"https://graph.facebook.com/v17.0/{ad_account}/insights?fields=campaign_id,campaign_name,spend,action_values&date_preset={DATE_PRESET}&level=campaign&access_token={ACCESS_TOKEN}"
-        
-        campaigns = buscar_todos_dados_facebook(campaigns_url)
-        insights = buscar_todos_dados_facebook(insights_url)
-        
-        campanhas_processadas = processar_dados_campanhas(
-            campaigns, insights, ad_account, DATE_PRESET
+    Returns:
+        bool: True se o plano foi aplicado, False caso contrário
+    """
+    global ACCESS_TOKEN, WHATSAPP_GROUP, LIMITE_LUCRO_BAIXO, LIMITE_LUCRO_ALTO, PERCENTUAL_REALOCACAO, logs_list, campanhas_execucao, unidades_ignoradas
+    
+    ACCESS_TOKEN = token
+    WHATSAPP_GROUP = group
+    logs_list = logs
+    graph_client.configurar_log(log_message)
+    graph_client.iniciar_execucao()
+    unidades_ignoradas = []
+    
+    try:
+        aplicacao = operacoes_orcamento.preparar_aplicacao(PLANO_PATH, "realocacao", ACCESS_TOKEN, unidades_ignoradas)
+        if aplicacao is None:
+            return False
+        plano, campanhas_execucao, pares = aplicacao
+        LIMITE_LUCRO_BAIXO = plano["parametros"]["LIMITE_LUCRO_BAIXO"]
+        LIMITE_LUCRO_ALTO = plano["parametros"]["LIMITE_LUCRO_ALTO"]
+        PERCENTUAL_REALOCACAO = plano["parametros"]["PERCENTUAL_REALOCACAO"]
+        classificar_campanhas(campanhas_execucao)
+        
+        decisoes_reducao = []
+        decisoes_aumento = []
+        for item, unidade in pares:
+            anterior, novo = item["orcamento_anterior"], item["novo_orcamento"]
+            if item["fase"] == "reducao":
+                decisoes_reducao.append((unidade, item["id_objeto"], anterior, novo, anterior - novo))
+            else:
+                decisoes_aumento.append((unidade, item["id_objeto"], anterior, novo, novo - anterior))
+        total_planejado = sum(
+            item["orcamento_anterior"] - item["novo_orcamento"] for item in plano["itens"] if item["fase"] == "reducao"
         )
-        todas_campanhas.extend(campanhas_processadas)
+        try:
+            resultado = aplicar_realocacao(decisoes_reducao, decisoes_aumento, total_planejado)
+        finally:
+            # Exportar o resultado uma única vez, já com os novos orçamentos; também se a
+            # execução for interrompida, para registrar as alterações já enviadas
+            operacoes_orcamento.salvar_resultado(
+                SPREADSHEET_PATH, campanhas_execucao, SAIDAS, "realocacao", plano["snapshot_em"], com_classificacao=True
+            )
+        return resultado
+    except Exception as e:
+        log_message(f"Erro ao aplicar o plano de realocação: {e}")
+        import traceback
+        log_message(traceback.format_exc())
+        return False
+
+if __name__ == "__main__":
+    snapshot, todas_campanhas = operacoes_orcamento.obter_campanhas(ACCESS_TOKEN, AD_ACCOUNTS, ABO_ACCOUNTS, DATE_PRESET)
+    classificar_campanhas(todas_campanhas)
+    campanhas_execucao = todas_campanhas
     
-    salvar_campanhas_excel(todas_campanhas)
-    realocar_orcamentos()
\ No newline at end of file
+    realocar_orcamentos()
+    operacoes_orcamento.salvar_resultado(
+        SPREADSHEET_PATH, campanhas_execucao, SAIDAS, "realocacao", snapshot.criado_em, com_classificacao=True
+    )
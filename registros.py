@@ -0,0 +1,141 @@
+# Registros compactos das campanhas, ad sets e unidades de orçamento.
+# Com __slots__ cada registro guarda só os campos declarados, sem um dict por objeto:
+# a coleta monta um Campanha por campanha e um AdSet por ad set ABO uma única vez, e as
+# unidades das operações apenas apontam para esses registros em vez de copiar os dados.
+# Orçamentos, gastos, valores de conversão e lucros ficam em centavos inteiros (ver dinheiro).
+
+class AdSet:
+    __slots__ = ("adset_id", "adset_name", "daily_budget", "gasto", "valor_conversao", "lucro",
+                 "metricas_janelas", "pontuacao", "novo_orcamento")
+
+    def __init__(self, adset_id, adset_name, daily_budget, gasto, valor_conversao, metricas_janelas, pontuacao):
+        self.adset_id = adset_id
+        self.adset_name = adset_name
+        self.daily_budget = daily_budget
+        self.gasto = gasto
+        self.valor_conversao = valor_conversao
+        self.lucro = valor_conversao - gasto
+        self.metricas_janelas = metricas_janelas
+        self.pontuacao = pontuacao
+        self.novo_orcamento = None  # definido pela operação quando o orçamento é alterado
+
+    def copiar(self):
+        copia = AdSet.__new__(AdSet)
+        for campo in AdSet.__slots__:
+            setattr(copia, campo, getattr(self, campo))
+        return copia
+
+    def para_dict(self):
+        return {campo: getattr(self, campo) for campo in AdSet.__slots__}
+
+    @staticmethod
+    def de_dict(dados):
+        adset = AdSet.__new__(AdSet)
+        for campo in AdSet.__slots__:
+            setattr(adset, campo, dados[campo])
+        return adset
+
+class Campanha:
+    """Campanha processada; adsets_info é a lista de AdSet nas ABO e None nas CBO"""
+    __slots__ = ("id_conta", "id_campanha", "nome_campanha", "tipo_campanha", "orcamento_diario", "gasto",
+                 "valor_conversao", "roas", "lucro", "adsets_info", "detalhes_adsets", "metricas_janelas",
+                 "pontuacao", "classificacao", "novo_orcamento")
+
+    def __init__(self, id_conta, id_campanha, nome_campanha, tipo_campanha, orcamento_diario, gasto,
+                 valor_conversao, adsets_info, detalhes_adsets, metricas_janelas, pontuacao):
+        self.id_conta = id_conta
+        self.id_campanha = id_campanha
+        self.nome_campanha = nome_campanha
+        self.tipo_campanha = tipo_campanha
+        self.orcamento_diario = orcamento_diario
+        self.gasto = gasto
+        self.valor_conversao = valor_conversao
+        self.roas = round(valor_conversao / gasto, 2) if gasto > 0 else 0
+        self.lucro = valor_conversao - gasto
+        self.adsets_info = adsets_info
+        self.detalhes_adsets = detalhes_adsets
+        self.metricas_janelas = metricas_janelas
+        self.pontuacao = pontuacao
+        self.classificacao = None
+        self.novo_orcamento = None  # definido pela operação quando o orçamento é alterado
+
+    def copiar(self):
+        """Cópia que pode ser alterada sem afetar o original (inclusive os ad sets)"""
+        copia = Campanha.__new__(Campanha)
+        for campo in Campanha.__slots__:
+            setattr(copia, campo, getattr(self, campo))
+        if self.adsets_info is not None:
+            copia.adsets_info = [adset.copiar() for adset in self.adsets_info]
+        return copia
+
+    def para_dict(self):
+        """Campos da campanha (e dos ad sets) em um dict que pode ser gravado em JSON"""
+        dados = {campo: getattr(self, campo) for campo in Campanha.__slots__}
+        if self.adsets_info is not None:
+            dados["adsets_info"] = [adset.para_dict() for adset in self.adsets_info]
+        return dados
+
+    @staticmethod
+    def de_dict(dados):
+        """Campanha gravada com para_dict"""
+        campanha = Campanha.__new__(Campanha)
+        for campo in Campanha.__slots__:
+            setattr(campanha, campo, dados[campo])
+        if campanha.adsets_info is not None:
+            campanha.adsets_info = [AdSet.de_dict(adset) for adset in campanha.adsets_info]
+        return campanha
+
+class Unidade:
+    """
+    Unidade de orçamento das operações: uma campanha CBO ou um ad set de campanha ABO.
+    Aponta para os registros da campanha e do ad set; só orcamento_atual é próprio da
+    unidade, pois pode ser recalculado na conferência antes das alterações.
+    """
+    __slots__ = ("tipo", "campanha_info", "adset_info", "orcamento_atual")
+
+    def __init__(self, campanha, adset=None):
+        self.tipo = "CBO" if adset is None else "ABO_ADSET"
+        self.campanha_info = campanha
+        self.adset_info = adset
+        self.orcamento_atual = campanha.orcamento_diario if adset is None else adset.daily_budget
+
+    @property
+    def id_campanha(self):
+        return self.campanha_info.id_campanha
+
+    @property
+    def id_adset(self):
+        return self.adset_info.adset_id if self.adset_info is not None else None
+
+    @property
+    def id_objeto(self):
+        """Id do objeto cujo daily_budget é alterado (ad set nas ABO, campanha nas CBO)"""
+        return self.adset_info.adset_id if self.adset_info is not None else self.campanha_info.id_campanha
+
+    @property
+    def nome_campanha(self):
+        return self.campanha_info.nome_campanha
+
+    @property
+    def nome(self):
+        if self.adset_info is None:
+            return self.campanha_info.nome_campanha
+        return f"{self.campanha_info.nome_campanha} - {self.adset_info.adset_name}"
+
+    def definir_novo_orcamento(self, novo_orcamento):
+        """Guarda o novo orçamento no registro alterado (ad set nas ABO, campanha nas CBO)"""
+        (self.adset_info or self.campanha_info).novo_orcamento = novo_orcamento
+
+    @property
+    def gasto(self):
+        return (self.adset_info or self.campanha_info).gasto
+
+    @property
+    def valor_conversao(self):
+        return (self.adset_info or self.campanha_info).valor_conversao
+
+def unidades_da_campanha(campanha):
+    """Unidades de orçamento de uma campanha: ela mesma (CBO) ou cada um dos seus ad sets (ABO)"""
+    if campanha.tipo_campanha == "ABO":
+        return [Unidade(campanha, adset) for adset in campanha.adsets_info or []]
+    return [Unidade(campanha)]
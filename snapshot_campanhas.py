@@ -0,0 +1,432 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import graph_client
+import consulta_insights
+import cache_graph
+import estrutura_contas
+import registros
+import dinheiro
+
+# Coleta compartilhada das campanhas pelas operações (escalar, reduzir e realocar).
+# Um snapshot é uma visão de todas as contas tirada num instante: campanhas ativas,
+# ad sets ABO e métricas do período. Enquanto não passar de IDADE_MAXIMA_PADRAO
+# segundos e os parâmetros forem os mesmos, as operações seguintes usam o mesmo
+# snapshot em vez de buscar e processar tudo de novo.
+
+IDADE_MAXIMA_PADRAO = 300  # segundos que um snapshot continua válido para novas operações
+MAX_CONTAS_PARALELAS_PADRAO = 4
+TAMANHO_LOTE_CAMPANHAS_ABO = 50  # Campanhas ABO por filtro campaign.id IN nas buscas da conta
+PRESETS_PERIODO = {'today': 'today', 'yesterday': 'yesterday', 'last7': 'last_7d'}
+
+# Campos pedidos nas consultas de insights (campanhas e ad sets vêm da estrutura_contas)
+CAMPOS_INSIGHTS_CAMPANHA = ["campaign_id", "spend", "action_values"]
+CAMPOS_INSIGHTS_ADSET = ["adset_id", "campaign_id", "spend", "action_values"]
+
+# Visão imutável das contas; "campanhas" é uma tupla com os registros processados
+# (um registros.Campanha por campanha). Quem for alterar os registros deve
+# trabalhar sobre copiar_campanhas(snapshot).
+Snapshot = namedtuple("Snapshot", [
+    "criado_em", "contas", "contas_abo", "date_preset", "start_date", "end_date", "campanhas"
+])
+
+# Parâmetros da coleta em andamento (definidos em coletar_snapshot, como o run() das operações)
+ACCESS_TOKEN = ""
+ABO_ACCOUNTS = []
+JANELAS_COMPARACAO = []
+PESOS_JANELAS = {}
+
+_atual = None  # (chave dos parâmetros, Snapshot)
+_lock = threading.Lock()
+_lock_coleta = threading.Lock()  # uma coleta por vez; a segunda espera e reaproveita a primeira
+
+def log_message(msg):
+    graph_client.log_message(msg)
+
+def resolver_periodo(date_range, start_date=None, end_date=None):
+    """
+    Converte o período escolhido no painel nos parâmetros da Graph API
+
+    Returns:
+        tuple: (date_preset, start_date, end_date); as datas só vêm no período personalizado
+    """
+    if date_range == 'custom' and start_date and end_date:
+        return None, start_date, end_date
+    return PRESETS_PERIODO.get(date_range, 'today'), None, None
+
+def iterar_dados_facebook(url):
+    """
+    Gera os registros de uma consulta à medida que cada página chega;
+    a página seguinte já é buscada em segundo plano enquanto a atual é consumida.
+    Leituras em fluxo não passam pelo cache_graph, que precisaria guardar todas as páginas
+    """
+    try:
+        for pagina in graph_client.iterar_paginas(url):
+            yield from pagina
+    except graph_client.ErroGraphAPI as e:
+        log_message(f"[ERRO] Graph API retornou: {e.erro}")
+        # Interromper a execução: seguir com dados parciais levaria a decisões erradas de orçamento
+        raise
+
+def buscar_todos_dados_facebook(url):
+    """Todos os registros de uma consulta, reaproveitando o cache_graph"""
+    em_cache = cache_graph.obter(url)
+    if em_cache is not None:
+        return em_cache
+
+    todos_dados = list(iterar_dados_facebook(url))
+    cache_graph.guardar(url, None, todos_dados)
+    return todos_dados
+
+def detectar_tipo_campanha(campanha, ad_account):
+    """
+    Detecta se a campanha é CBO ou ABO
+    CBO tem daily_budget > 0, ABO tem daily_budget = 0 ou null
+    """
+    daily_budget = campanha.get("daily_budget", 0)
+
+    # Verificação adicional pela conta
+    if ad_account in ABO_ACCOUNTS:
+        return "ABO"
+
+    # Verificação pelo orçamento
+    if daily_budget and int(daily_budget) > 0:
+        return "CBO"
+    else:
+        return "ABO"
+
+def adsets_da_campanha(campanha):
+    """
+    Ad sets ativos que vieram embutidos na campanha; o cursor da conexão só é seguido
+    se a campanha não vier completa (a estrutura_contas já entrega todos os ad sets)
+    """
+    adsets = campanha.get("adsets", {})
+    resultado = list(adsets.get("data", []))
+    proxima = adsets.get("paging", {}).get("next")
+    if proxima:
+        resultado.extend(buscar_todos_dados_facebook(proxima))
+    return resultado
+
+def buscar_insights_adsets(ad_account, campaign_ids, date_preset=None, start_date=None, end_date=None, adsets_por_campanha=None):
+    """
+    Busca insights no nível de ad set de várias campanhas ABO com poucas chamadas
+    no nível da conta e agrupa o resultado por campanha.
+    Lotes com muitos ad sets são consultados como relatório assíncrono.
+    """
+    insights_por_campanha = {campaign_id: [] for campaign_id in campaign_ids}
+    adsets_por_campanha = adsets_por_campanha or {}
+
+    for inicio in range(0, len(campaign_ids), TAMANHO_LOTE_CAMPANHAS_ABO):
+        lote = campaign_ids[inicio:inicio + TAMANHO_LOTE_CAMPANHAS_ABO]
+        resultado = consulta_insights.buscar_insights_comparacao(
+            ad_account, ACCESS_TOKEN, CAMPOS_INSIGHTS_ADSET, "adset",
+            JANELAS_COMPARACAO, date_preset, start_date, end_date,
+            filtering=[{"field": "campaign.id", "operator": "IN", "value": lote}],
+            quantidade_objetos=sum(len(adsets_por_campanha.get(campaign_id, [])) for campaign_id in lote)
+        )
+        for insight in resultado:
+            insights_por_campanha.setdefault(insight.get("campaign_id"), []).append(insight)
+
+    return insights_por_campanha
+
+def processar_campanha_abo(campanha, ad_account, adsets, insights_adsets):
+    """
+    Processa campanhas ABO agregando dados de todos os ad sets ativos
+    """
+    campaign_id = campanha["id"]
+    log_message(f"Processando campanha ABO: {campanha['name']}")
+
+    # Agregar dados de todos os ad sets ativos
+    total_orcamento = 0
+    total_gasto = 0
+    total_conversao = 0
+    adsets_info = []
+    adsets_ativos = 0
+    insights_por_adset = consulta_insights.indexar_insights(insights_adsets, "adset_id")
+
+    for adset in adsets:
+        if adset.get("status") == "ACTIVE":
+            adsets_ativos += 1
+            adset_id = adset["id"]
+            daily_budget = dinheiro.centavos_orcamento(adset.get("daily_budget"))
+            total_orcamento += daily_budget
+
+            # Buscar insight correspondente
+            insight = insights_por_adset.get(adset_id)
+
+            if insight:
+                gasto = dinheiro.centavos(insight.get("spend", 0))
+                valor_conversao = consulta_insights.valor_compras(insight)
+                total_gasto += gasto
+                total_conversao += valor_conversao
+            else:
+                gasto = 0
+                valor_conversao = 0
+
+            metricas_janelas = insight.get("janelas", {}) if insight else {}
+            adsets_info.append(registros.AdSet(
+                adset_id, adset["name"], daily_budget, gasto, valor_conversao, metricas_janelas,
+                consulta_insights.pontuacao_janelas(metricas_janelas, PESOS_JANELAS)
+            ))
+
+    log_message(f"Campanha ABO {campaign_id}: {adsets_ativos} adsets ativos, orçamento total: R$ {dinheiro.formatar(total_orcamento)}")
+
+    metricas_janelas = consulta_insights.somar_metricas(a.metricas_janelas for a in adsets_info)
+
+    return registros.Campanha(
+        ad_account, campaign_id, campanha["name"], "ABO", total_orcamento, total_gasto, total_conversao,
+        adsets_info, f"{adsets_ativos} adsets ativos", metricas_janelas,
+        consulta_insights.pontuacao_janelas(metricas_janelas, PESOS_JANELAS)
+    )
+
+def processar_dados_campanhas(campanhas, insights, ad_account, date_preset=None, start_date=None, end_date=None):
+    """
+    Processa dados das campanhas, detectando automaticamente se são CBO ou ABO
+    """
+    campanhas_filtradas = []
+
+    # Índice dos insights por campanha (mantém o primeiro registro de cada campanha).
+    # Os insights da conta já chegam completos; só as campanhas são consumidas em fluxo
+    insights_por_id = consulta_insights.indexar_insights(insights, "campaign_id")
+
+    # As campanhas podem chegar página a página: as CBO são processadas assim que chegam
+    # e as ABO ficam reservadas na posição original até os insights dos ad sets serem buscados
+    campanhas_abo = []
+    total_campanhas = 0
+    for campanha in campanhas:
+        total_campanhas += 1
+        if campanha.get("status", "").upper().strip() != "ACTIVE":
+            continue
+
+        if detectar_tipo_campanha(campanha, ad_account) == "ABO":
+            campanhas_abo.append((len(campanhas_filtradas), campanha, adsets_da_campanha(campanha)))
+            campanhas_filtradas.append(None)
+            continue
+
+        insight = insights_por_id.get(campanha.get("id"))
+
+        if insight:
+            gasto = dinheiro.centavos(insight.get("spend", 0))
+            valor_conversao = consulta_insights.valor_compras(insight)
+        else:
+            gasto = 0
+            valor_conversao = 0
+
+        daily_budget = dinheiro.centavos_orcamento(campanha.get("daily_budget"))
+        metricas_janelas = insight.get("janelas", {}) if insight else {}
+
+        campanhas_filtradas.append(registros.Campanha(
+            ad_account, campanha["id"], campanha["name"], "CBO", daily_budget, gasto, valor_conversao,
+            None, "N/A", metricas_janelas, consulta_insights.pontuacao_janelas(metricas_janelas, PESOS_JANELAS)
+        ))
+
+    log_message(f"Encontradas {total_campanhas} campanhas na conta {ad_account}.")
+
+    # Buscar insights de todos os ad sets ABO da conta de uma vez
+    ids_abo = [campanha["id"] for _, campanha, _ in campanhas_abo]
+    if ids_abo:
+        adsets_por_campanha = {campanha["id"]: adsets for _, campanha, adsets in campanhas_abo}
+        insights_por_campanha = buscar_insights_adsets(ad_account, ids_abo, date_preset, start_date, end_date, adsets_por_campanha)
+        log_message(f"Conta {ad_account}: {len(ids_abo)} campanhas ABO, {sum(len(a) for a in adsets_por_campanha.values())} ad sets carregados")
+
+        for posicao, campanha, _ in campanhas_abo:
+            campanhas_filtradas[posicao] = processar_campanha_abo(
+                campanha, ad_account,
+                adsets_por_campanha.get(campanha["id"], []),
+                insights_por_campanha.get(campanha["id"], [])
+            )
+
+    return campanhas_filtradas
+
+def coletar_dados_conta(ad_account, date_preset=None, start_date=None, end_date=None):
+    """Busca campanhas e insights de uma conta e retorna suas campanhas ativas processadas"""
+    tipo_conta = "ABO" if ad_account in ABO_ACCOUNTS else "CBO"
+    log_message(f"Processando conta de anúncio {tipo_conta}: {ad_account}")
+    log_message(f"Buscando campanhas para conta {ad_account}...")
+
+    # A estrutura só busca o que mudou desde a última coleta
+    campanhas = estrutura_contas.campanhas_da_conta(ad_account, ACCESS_TOKEN)
+
+    # Insights primeiro: as campanhas são processadas enquanto as páginas chegam.
+    # A quantidade de campanhas (da estrutura local ou, na primeira coleta da conta, do total
+    # informado pela Graph API) decide entre a consulta síncrona e o relatório assíncrono
+    quantidade_campanhas = estrutura_contas.quantidade_campanhas(ad_account, ACCESS_TOKEN)
+    if start_date and end_date:
+        periodo = {"start_date": start_date, "end_date": end_date}
+    else:
+        periodo = {"date_preset": date_preset}
+    insights = consulta_insights.buscar_insights_comparacao(
+        ad_account, ACCESS_TOKEN, CAMPOS_INSIGHTS_CAMPANHA, "campaign", JANELAS_COMPARACAO,
+        quantidade_objetos=quantidade_campanhas, **periodo
+    )
+    log_message(f"Encontrados {len(insights)} insights na conta {ad_account}.")
+
+    # Processar campanhas com suporte a ABO
+    campanhas_processadas = processar_dados_campanhas(
+        campanhas, insights, ad_account, date_preset, start_date, end_date
+    )
+
+    log_message(f"Processadas {len(campanhas_processadas)} campanhas ativas na conta {ad_account}.")
+
+    if JANELAS_COMPARACAO:
+        for camp in campanhas_processadas:
+            lucros = ", ".join(f"{janela}: R$ {dinheiro.formatar(m['lucro'])}" for janela, m in camp.metricas_janelas.items())
+            log_message(f"  - {camp.nome_campanha}: pontuação multi-janela {camp.pontuacao} ({lucros})")
+
+    # Log detalhado para campanhas ABO
+    if ad_account in ABO_ACCOUNTS:
+        campanhas_abo_desta_conta = [c for c in campanhas_processadas if c.tipo_campanha == "ABO"]
+        if campanhas_abo_desta_conta:
+            for camp in campanhas_abo_desta_conta:
+                log_message(f"  - Campanha ABO: {camp.nome_campanha} com {len(camp.adsets_info)} adsets")
+
+    return campanhas_processadas
+
+def _chave(access_token, contas, contas_abo, date_preset, start_date, end_date, janelas_comparacao, pesos_janelas):
+    return (
+        access_token, tuple(contas), tuple(contas_abo or []), date_preset, start_date, end_date,
+        tuple(janelas_comparacao or []), tuple(sorted((pesos_janelas or {}).items()))
+    )
+
+def coletar_snapshot(access_token, contas, contas_abo=None, date_preset=None, start_date=None, end_date=None,
+                     janelas_comparacao=None, pesos_janelas=None, max_contas_paralelas=MAX_CONTAS_PARALELAS_PADRAO):
+    """
+    Coleta todas as contas em paralelo (mantendo a ordem de contas) e monta um novo snapshot
+
+    Returns:
+        Snapshot: visão das campanhas ativas no instante da coleta
+    """
+    global ACCESS_TOKEN, ABO_ACCOUNTS, JANELAS_COMPARACAO, PESOS_JANELAS
+
+    ACCESS_TOKEN = access_token
+    ABO_ACCOUNTS = list(contas_abo or [])
+    JANELAS_COMPARACAO = list(janelas_comparacao or [])
+    PESOS_JANELAS = dict(pesos_janelas or {})
+
+    criado_em = time.time()
+    todas_campanhas = []
+    max_workers = max(1, min(max_contas_paralelas, len(contas)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resultados = executor.map(
+            lambda conta: coletar_dados_conta(conta, date_preset, start_date, end_date),
+            contas
+        )
+        for campanhas_processadas in resultados:
+            todas_campanhas.extend(campanhas_processadas)
+
+    return Snapshot(
+        criado_em, tuple(contas), tuple(ABO_ACCOUNTS), date_preset, start_date, end_date,
+        tuple(todas_campanhas)
+    )
+
+def _janelas_validas(janelas):
+    """Janelas de comparação que podem ser consultadas; as desconhecidas são informadas e ignoradas"""
+    desconhecidas = consulta_insights.janelas_desconhecidas(janelas)
+    if desconhecidas:
+        log_message(
+            f"[ERRO] JANELAS_COMPARACAO tem janelas não suportadas, ignoradas nesta coleta: "
+            f"{', '.join(map(str, desconhecidas))}. Use: {', '.join(consulta_insights.PRESETS_JANELAS)}"
+        )
+    return [janela for janela in janelas or [] if janela not in desconhecidas]
+
+def obter_snapshot(access_token, contas, contas_abo=None, date_preset=None, start_date=None, end_date=None,
+                   janelas_comparacao=None, pesos_janelas=None, idade_maxima=IDADE_MAXIMA_PADRAO,
+                   max_contas_paralelas=MAX_CONTAS_PARALELAS_PADRAO, forcar=False):
+    """
+    Retorna o snapshot atual se ele foi coletado com os mesmos parâmetros há no máximo
+    idade_maxima segundos; caso contrário coleta um novo e o torna o snapshot atual
+
+    Args:
+        forcar (bool): ignora o snapshot atual e as leituras de estrutura em cache
+    """
+    global _atual
+    janelas_comparacao = _janelas_validas(janelas_comparacao)
+    chave = _chave(access_token, contas, contas_abo, date_preset, start_date, end_date, janelas_comparacao, pesos_janelas)
+
+    with _lock_coleta:
+        with _lock:
+            atual = _atual
+        if atual and not forcar and atual[0] == chave and idade(atual[1]) <= idade_maxima:
+            snapshot = atual[1]
+            log_message(f"Usando snapshot das campanhas coletado às {time.strftime('%H:%M:%S', time.localtime(snapshot.criado_em))} "
+                        f"(idade: {idade(snapshot):.0f}s, máximo: {idade_maxima}s)")
+            return snapshot
+
+        if forcar:
+            cache_graph.invalidar()
+            estrutura_contas.invalidar()
+        log_message("Coletando novo snapshot das campanhas...")
+        snapshot = coletar_snapshot(
+            access_token, contas, contas_abo, date_preset, start_date, end_date,
+            janelas_comparacao, pesos_janelas, max_contas_paralelas
+        )
+        with _lock:
+            _atual = (chave, snapshot)
+        log_message(f"Snapshot coletado: {len(snapshot.campanhas)} campanhas em {len(snapshot.contas)} contas")
+        return snapshot
+
+def idade(snapshot):
+    """Segundos desde o início da coleta do snapshot"""
+    return time.time() - snapshot.criado_em
+
+def copiar_campanhas(snapshot):
+    """Cópia dos registros do snapshot que a operação pode alterar livremente"""
+    return [campanha.copiar() for campanha in snapshot.campanhas]
+
+def registrar_orcamentos(orcamentos):
+    """
+    Aplica no snapshot atual, na estrutura local e nas consultas em cache os orçamentos
+    alterados pelas operações.
+    O snapshot não é modificado: um novo, com o mesmo instante de coleta, passa a ser o atual.
+
+    Args:
+        orcamentos (dict): id do objeto (campanha ou ad set) -> novo daily_budget em centavos
+    """
+    global _atual
+    if not orcamentos:
+        return
+    cache_graph.registrar_orcamentos(orcamentos)
+    estrutura_contas.registrar_orcamentos(orcamentos)
+
+    with _lock:
+        if _atual is None:
+            return
+        chave, snapshot = _atual
+        campanhas = []
+        for campanha in snapshot.campanhas:
+            if campanha.adsets_info:
+                if any(a.adset_id in orcamentos for a in campanha.adsets_info):
+                    campanha = campanha.copiar()
+                    for adset_info in campanha.adsets_info:
+                        if adset_info.adset_id in orcamentos:
+                            adset_info.daily_budget = orcamentos[adset_info.adset_id]
+                    campanha.orcamento_diario = sum(a.daily_budget for a in campanha.adsets_info)
+            elif campanha.id_campanha in orcamentos:
+                campanha = campanha.copiar()
+                campanha.orcamento_diario = orcamentos[campanha.id_campanha]
+            campanhas.append(campanha)
+        _atual = (chave, snapshot._replace(campanhas=tuple(campanhas)))
+
+def descartar():
+    """Descarta o snapshot atual; a próxima operação faz uma coleta nova"""
+    global _atual
+    with _lock:
+        _atual = None
+
+def obter_status():
+    """Resumo do snapshot atual para o painel"""
+    with _lock:
+        atual = _atual
+    if atual is None:
+        return {"disponivel": False}
+    snapshot = atual[1]
+    return {
+        "disponivel": True,
+        "criado_em": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.criado_em)),
+        "idade": round(idade(snapshot)),
+        "campanhas": len(snapshot.campanhas),
+        "contas": len(snapshot.contas),
+        "periodo": snapshot.date_preset or f"{snapshot.start_date} a {snapshot.end_date}",
+        "coletando": _lock_coleta.locked()
+    }
@@ -17,6 +17,12 @@ const endDateInput = document.getElementById("end_date");
 const startButton = document.getElementById("start-btn");
 const logToggleBtn = document.getElementById("log-toggle-btn");
 const logContainer = document.getElementById("log-container");
+const graphUsageContainer = document.getElementById("graph-usage");
+const refreshSnapshotBtn = document.getElementById("refresh-snapshot-btn");
+const snapshotStatusContainer = document.getElementById("snapshot-status");
+const planButton = document.getElementById("plan-btn");
+const applyPlanButton = document.getElementById("apply-plan-btn");
+const planContainer = document.getElementById("plan-panel");
 
 // Exibe ou oculta campos conforme operação
 operationSelect.addEventListener("change", () => {
@@ -31,6 +37,7 @@ operationSelect.addEventListener("change", () => {
   } else if (op === "realocar") {
     fieldsRealocar.style.display = "block";
   }
+  fetchPlan();
 });
 
 // Exibe ou oculta datas personalizadas
@@ -54,23 +61,134 @@ function toggleLogs() {
 }
 logToggleBtn.addEventListener("click", toggleLogs);
 
+// Busca o uso da Graph API (folga de cada conta antes do limite) e os acertos do cache de leituras
+function fetchGraphUsage() {
+  fetch("/graph_usage")
+    .then(response => response.json())
+    .then(data => {
+      const entries = Object.entries(data.uso || {});
+      const cache = data.cache || {};
+      let cacheLine = "";
+      if (cache.acertos + cache.falhas > 0) {
+        cacheLine = `<br>Cache de leituras: ${cache.acertos} acertos, ${cache.falhas} falhas (${cache.itens_memoria} em memória)`;
+      }
+      if (entries.length === 0) {
+        graphUsageContainer.innerHTML = cacheLine.replace("<br>", "");
+        return;
+      }
+      graphUsageContainer.innerHTML = "<strong>Uso da Graph API:</strong><br>" + entries
+        .map(([key, info]) => {
+          let line = `${key}: ${info.percentual}% usado (folga ${info.folga}%)`;
+          if (info.pausado_por > 0) {
+            line += ` - pausado por ${info.pausado_por}s`;
+          }
+          return line;
+        })
+        .join("<br>") + cacheLine;
+    })
+    .catch(err => {
+      console.error("Erro ao carregar uso da Graph API:", err);
+    });
+}
+
+// Busca a idade do snapshot das campanhas usado pelas operações
+function fetchSnapshotStatus() {
+  fetch("/snapshot_status")
+    .then(response => response.json())
+    .then(data => {
+      if (!data.disponivel) {
+        snapshotStatusContainer.textContent = "Dados das campanhas: ainda não coletados";
+        return;
+      }
+      let line = `Dados das campanhas: coletados em ${data.criado_em} (há ${data.idade}s, ${data.periodo}) - ${data.campanhas} campanhas em ${data.contas} contas`;
+      if (data.coletando) {
+        line += " - atualizando...";
+      }
+      snapshotStatusContainer.textContent = line;
+    })
+    .catch(err => {
+      console.error("Erro ao carregar status do snapshot:", err);
+    });
+}
+
 // Busca logs do servidor
 function fetchLogs() {
   fetch("/logs")
     .then(response => response.json())
     .then(data => {
       logContainer.textContent = data.logs.join("\n");
+      fetchGraphUsage();
+      fetchSnapshotStatus();
       if (data.running) {
         setTimeout(fetchLogs, 1000);
       } else {
         startButton.disabled = false;
+        refreshSnapshotBtn.disabled = false;
+        planButton.disabled = false;
+        fetchPlan();
       }
     });
 }
 
-// Inicia o processo
-startButton.addEventListener("click", () => {
-  const payload = {
+function escapeHtml(text) {
+  const div = document.createElement("div");
+  div.textContent = text;
+  return div.innerHTML;
+}
+
+function formatMoney(value) {
+  return "R$ " + Number(value).toFixed(2);
+}
+
+// Busca e exibe o último plano calculado da operação selecionada
+function fetchPlan() {
+  const op = operationSelect.value;
+  if (!op) {
+    planContainer.textContent = "";
+    applyPlanButton.disabled = true;
+    return;
+  }
+  fetch("/plan?operation=" + encodeURIComponent(op))
+    .then(response => response.json())
+    .then(data => {
+      if (data.error || !data.disponivel) {
+        planContainer.textContent = data.error || "Nenhum plano calculado para esta operação.";
+        applyPlanButton.disabled = true;
+        return;
+      }
+      let situacao;
+      if (data.aplicado_em) {
+        situacao = `aplicado em ${data.aplicado_em}`;
+      } else if (data.pode_aplicar) {
+        situacao = `pronto para aplicar (dados de ${data.snapshot_em}, há ${data.idade_snapshot}s, máximo ${data.idade_maxima}s)`;
+      } else {
+        situacao = `dados de ${data.snapshot_em} passaram de ${data.idade_maxima}s - gere um novo plano`;
+      }
+      const linhas = data.itens.map(item => `
+        <tr>
+          <td>${escapeHtml(item.nome)}</td>
+          <td>${item.tipo}</td>
+          <td>${formatMoney(item.orcamento_anterior)}</td>
+          <td>${formatMoney(item.novo_orcamento)}</td>
+          <td>${item.variacao >= 0 ? "+" : ""}${formatMoney(item.variacao)}</td>
+          <td>${escapeHtml(item.motivo)}</td>
+        </tr>`).join("");
+      planContainer.innerHTML = `
+        <strong>Plano (${data.operacao}) calculado em ${data.criado_em}:</strong> ${data.itens.length} alterações,
+        aumentos ${formatMoney(data.total_aumentos)}, reduções ${formatMoney(data.total_reducoes)} - ${situacao}
+        <table class="table table-sm">
+          <thead><tr><th>Unidade</th><th>Tipo</th><th>Atual</th><th>Novo</th><th>Variação</th><th>Motivo</th></tr></thead>
+          <tbody>${linhas}</tbody>
+        </table>`;
+      applyPlanButton.disabled = !data.pode_aplicar || startButton.disabled;
+    })
+    .catch(err => {
+      console.error("Erro ao carregar plano:", err);
+    });
+}
+
+function buildPayload() {
+  return {
     operation: operationSelect.value,
     date_range: dateRangeSelect.value,
     start_date: startDateInput.value,
@@ -83,7 +201,11 @@ startButton.addEventListener("click", () => {
     reduce_profit_limit: parseFloat(reduceProfitLimitInput.value) || 0,
     reduce_pct: parseFloat(reducePctInput.value) || 0
   };
-  fetch("/start", {
+}
+
+// Envia uma requisição que inicia um processo no servidor e acompanha os logs
+function startServerProcess(url, payload, message) {
+  fetch(url, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(payload)
@@ -95,8 +217,10 @@ startButton.addEventListener("click", () => {
         logContainer.innerHTML = "<span style='color:red'>" + data.error + "</span>";
       } else {
         startButton.disabled = true;
+        planButton.disabled = true;
+        applyPlanButton.disabled = true;
         logContainer.style.display = "block";
-        logContainer.textContent = "Processo iniciado...\n";
+        logContainer.textContent = message + "\n";
         fetchLogs();
       }
     })
@@ -104,4 +228,56 @@ startButton.addEventListener("click", () => {
       logContainer.style.display = "block";
       logContainer.innerHTML = "<span style='color:red'>Erro ao conectar ao servidor.</span>";
     });
+}
+
+// Inicia o processo (calcula e aplica)
+startButton.addEventListener("click", () => {
+  startServerProcess("/start", buildPayload(), "Processo iniciado...");
+});
+
+// Calcula o plano sem alterar orçamentos
+planButton.addEventListener("click", () => {
+  const payload = buildPayload();
+  payload.mode = "planejar";
+  startServerProcess("/start", payload, "Calculando plano...");
+});
+
+// Aplica o último plano calculado da operação selecionada
+applyPlanButton.addEventListener("click", () => {
+  startServerProcess("/apply_plan", { operation: operationSelect.value }, "Aplicando plano...");
 });
+
+// Força uma nova coleta das campanhas para o período selecionado
+refreshSnapshotBtn.addEventListener("click", () => {
+  const payload = {
+    date_range: dateRangeSelect.value,
+    start_date: startDateInput.value,
+    end_date: endDateInput.value
+  };
+  fetch("/refresh_snapshot", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(payload)
+  })
+    .then(response => response.json())
+    .then(data => {
+      logContainer.style.display = "block";
+      if (data.error) {
+        logContainer.innerHTML = "<span style='color:red'>" + data.error + "</span>";
+      } else {
+        startButton.disabled = true;
+        refreshSnapshotBtn.disabled = true;
+        logContainer.textContent = "Atualizando dados das campanhas...\n";
+        fetchLogs();
+      }
+    })
+    .catch(err => {
+      logContainer.style.display = "block";
+      logContainer.innerHTML = "<span style='color:red'>Erro ao conectar ao servidor.</span>";
+    });
+});
+
+// Exibe o uso da Graph API e a idade dos dados ao carregar a página
+fetchGraphUsage();
+fetchSnapshotStatus();
+fetchPlan();